@@ -0,0 +1,149 @@
+"""История просмотров и голосов по часам и суткам, тренды
+
+Приращения копит буфер счетчиков (counters.py) вместе с лайфтайм
+счетчиками и пишет одним INSERT ... ON CONFLICT DO UPDATE на пачку в той
+же транзакции, поэтому запрос не делает отдельных записей. Часовые
+корзины старше QUOTES_ACTIVITY_HOURLY_RETENTION часов команда
+rollup_activity сворачивает в суточные, а суточные хранит
+QUOTES_ACTIVITY_DAILY_RETENTION дней.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, Sum, Value, When
+from django.db.models.functions import TruncDay
+
+TRENDING_CACHE_KEY = 'quotes:trending'
+# Сколько корзин записываем одним executemany
+WRITE_BATCH_SIZE = 500
+
+
+def hour_bucket(timestamp=None):
+    """Начало часа (UTC) как число секунд эпохи"""
+    timestamp = time.time() if timestamp is None else timestamp
+    return int(timestamp) // 3600 * 3600
+
+
+def _as_datetime(bucket):
+    return datetime.datetime.fromtimestamp(bucket, tz=datetime.timezone.utc)
+
+
+def _upsert(period, rows):
+    """Прибавляет [(quote_id, bucket datetime, views, likes, dislikes)] к корзинам
+
+    Строки удаленных к этому времени цитат пропускаются (WHERE EXISTS),
+    иначе внешний ключ откатил бы всю пачку счетчиков.
+    """
+    from .models import Quote, QuoteActivity
+
+    table = connection.ops.quote_name(QuoteActivity._meta.db_table)
+    quotes = connection.ops.quote_name(Quote._meta.db_table)
+    sql = (
+        f'INSERT INTO {table} (quote_id, period, bucket, views, likes, dislikes) '
+        f'SELECT %s, %s, %s, %s, %s, %s WHERE EXISTS (SELECT 1 FROM {quotes} WHERE id = %s) '
+        f'ON CONFLICT (quote_id, period, bucket) DO UPDATE SET '
+        f'views = {table}.views + excluded.views, '
+        f'likes = {table}.likes + excluded.likes, '
+        f'dislikes = {table}.dislikes + excluded.dislikes'
+    )
+    params = [
+        (quote_id, period, connection.ops.adapt_datetimefield_value(bucket), views, likes, dislikes, quote_id)
+        for quote_id, bucket, views, likes, dislikes in rows
+    ]
+    with connection.cursor() as cursor:
+        for start in range(0, len(params), WRITE_BATCH_SIZE):
+            cursor.executemany(sql, params[start:start + WRITE_BATCH_SIZE])
+
+
+def write_activity(history):
+    """Записывает приращения {(начало часа, id цитаты): [views, likes, dislikes]}"""
+    from .models import QuoteActivity
+
+    _upsert(QuoteActivity.HOUR, [
+        (quote_id, _as_datetime(bucket), *values)
+        for (bucket, quote_id), values in history.items() if any(values)
+    ])
+
+
+def _hourly_retention():
+    return getattr(settings, 'QUOTES_ACTIVITY_HOURLY_RETENTION', 48)
+
+
+def rollup(now=None):
+    """Сворачивает старые часовые корзины в суточные и удаляет устаревшие
+
+    Возвращает (свернуто часовых корзин, удалено суточных).
+    """
+    from .models import QuoteActivity
+
+    current = hour_bucket(now)
+    hourly_cutoff = _as_datetime(current - _hourly_retention() * 3600)
+    daily_cutoff = _as_datetime(current - getattr(settings, 'QUOTES_ACTIVITY_DAILY_RETENTION', 90) * 86400)
+    activity = QuoteActivity.objects.all()
+    with transaction.atomic():
+        hourly = activity.filter(period=QuoteActivity.HOUR, bucket__lt=hourly_cutoff)
+        days = (
+            hourly.annotate(day=TruncDay('bucket', tzinfo=datetime.timezone.utc))
+            .values('quote_id', 'day')
+            .annotate(total_views=Sum('views'), total_likes=Sum('likes'), total_dislikes=Sum('dislikes'))
+            .order_by()
+        )
+        _upsert(QuoteActivity.DAY, [
+            (row['quote_id'], row['day'], row['total_views'], row['total_likes'], row['total_dislikes'])
+            for row in days.iterator()
+        ])
+        rolled, _ = hourly.delete()
+        expired, _ = activity.filter(period=QuoteActivity.DAY, bucket__lt=daily_cutoff).delete()
+    return rolled, expired
+
+
+def compute_trending(limit, now=None):
+    """Цитаты с наибольшей активностью за последние QUOTES_TRENDING_HOURS часов
+
+    Вклад часа затухает вдвое каждые QUOTES_TRENDING_HALF_LIFE часов;
+    лайк дает +1, дизлайк -1, просмотр QUOTES_TRENDING_VIEW_WEIGHT.
+    Сумма считается в БД по индексу (period, bucket).
+    """
+    from .models import Quote, QuoteActivity
+
+    hours = getattr(settings, 'QUOTES_TRENDING_HOURS', 24)
+    half_life = getattr(settings, 'QUOTES_TRENDING_HALF_LIFE', 6)
+    view_weight = getattr(settings, 'QUOTES_TRENDING_VIEW_WEIGHT', 0.1)
+    current = hour_bucket(now)
+    buckets = [_as_datetime(current - age * 3600) for age in range(hours)]
+    decay = Case(
+        *(When(bucket=bucket, then=Value(0.5 ** (age / half_life))) for age, bucket in enumerate(buckets)),
+        default=Value(0.0), output_field=FloatField(),
+    )
+    activity = F('likes') - F('dislikes') + F('views') * Value(view_weight)
+    ranked = list(
+        QuoteActivity.objects.filter(period=QuoteActivity.HOUR, bucket__gte=buckets[-1])
+        .values('quote_id')
+        .annotate(score=Sum(decay * activity, output_field=FloatField()))
+        .filter(score__gt=0)
+        .order_by('-score', '-quote_id')
+        .values_list('quote_id', 'score')[:limit]
+    )
+    quotes = Quote.objects.select_related('source').in_bulk([quote_id for quote_id, _ in ranked])
+    return [
+        {
+            'id': quote_id,
+            'text': quotes[quote_id].text,
+            'source': str(quotes[quote_id].source),
+            'score': round(score, 2),
+        }
+        for quote_id, score in ranked if quote_id in quotes
+    ]
+
+
+def trending_quotes(limit=10):
+    """compute_trending из кэша (пересчет раз в QUOTES_TRENDING_MAX_AGE секунд)"""
+    key = f'{TRENDING_CACHE_KEY}:{limit}'
+    entries = cache.get(key)
+    if entries is None:
+        entries = compute_trending(limit)
+        cache.set(key, entries, getattr(settings, 'QUOTES_TRENDING_MAX_AGE', 300))
+    return entries
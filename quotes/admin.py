@@ -1,3 +1,166 @@
-from django.contrib import admin
+"""Админка цитат и источников, рассчитанная на миллионы строк
 
-# Register your models here.
+Список без фильтров не считает COUNT(*) по всей таблице, а берет оценку
+числа строк (EstimatedCountPaginator). Источник цитаты показывается
+одним JOIN и выбирается через автодополнение. Поиск идет по индексам:
+цитаты - полнотекстовым поиском (search.py), источники - по началу
+названия (SourceQuerySet.lookup). Массовые действия - по одному UPDATE.
+"""
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Value
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .counters import counter_buffer
+from .leaderboard import popular_leaderboard
+from .models import Quote, Source
+from .sampler import quote_sampler
+from .search import search_quote_ids
+from .stats import dashboard_stats
+from .weighting import effective_weight_expression
+
+# Меньше стольких строк таблицу дешевле посчитать точно
+EXACT_COUNT_LIMIT = 10000
+# Сколько лучших совпадений полнотекстового поиска показывать в списке цитат
+SEARCH_LIMIT = 1000
+
+
+def estimated_count(model, using):
+    """Примерное число строк таблицы без прохода по ней или None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # Статистика ANALYZE, а без нее - разброс rowid (поиск по B-дереву)
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s AND idx IS NULL', [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+            pk = connection.ops.quote_name(model._meta.pk.column)
+            table = connection.ops.quote_name(table)
+            # Отдельные подзапросы: MIN и MAX в одном SELECT читают всю таблицу
+            cursor.execute(f'SELECT (SELECT MAX({pk}) FROM {table}) - (SELECT MIN({pk}) FROM {table}) + 1')
+            return cursor.fetchone()[0] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, который для всей большой таблицы берет оценку числа строк
+
+    С фильтром или поиском число строк считается точно - по индексу.
+    Последние страницы по оценке могут оказаться пустыми.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+def _invalidate_caches():
+    # Массовый UPDATE не шлет сигналы - сбрасываем производные кэши явно
+    quote_sampler.invalidate()
+    dashboard_stats.invalidate()
+    popular_leaderboard.invalidate()
+
+
+class WeightFilter(admin.SimpleListFilter):
+    title = 'Вес'
+    parameter_name = 'weight'
+    RANGES = {
+        'low': (0, 10),
+        'base': (10, 20),
+        'high': (20, 50),
+        'top': (50, None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [
+            ('low', 'меньше 10'),
+            ('base', '10-19'),
+            ('high', '20-49'),
+            ('top', '50 и больше'),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.RANGES:
+            return queryset
+        low, high = self.RANGES[self.value()]
+        queryset = queryset.filter(weight__gte=low)
+        return queryset if high is None else queryset.filter(weight__lt=high)
+
+
+@admin.register(Source)
+class SourceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'type', 'quote_count', 'created_at']
+    list_filter = ['type']
+    search_fields = ['name']
+    readonly_fields = ['quote_count']
+    ordering = ['name_key', 'type']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск и автодополнение по началу названия (индекс name_key)"""
+        if not search_term.strip():
+            return queryset, False
+        return queryset & Source.objects.lookup(search_term).order_by(), False
+
+
+@admin.register(Quote)
+class QuoteAdmin(admin.ModelAdmin):
+    list_display = ['short_text', 'source', 'weight', 'views', 'likes', 'dislikes', 'created_at']
+    list_select_related = ['source']
+    list_filter = ['source__type', WeightFilter]
+    search_fields = ['text']
+    autocomplete_fields = ['source']
+    readonly_fields = ['effective_weight', 'created_at', 'updated_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['reset_counters', 'recompute_vote_weights']
+
+    @admin.display(description='Текст')
+    def short_text(self, quote):
+        return quote.text[:80]
+
+    def get_search_results(self, request, queryset, search_term):
+        """Полнотекстовый поиск по тексту и источнику вместо LIKE по всей таблице"""
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(id__in=search_quote_ids(search_term, SEARCH_LIMIT)), False
+
+    @admin.action(description='Обнулить просмотры и голоса')
+    def reset_counters(self, request, queryset):
+        # Иначе накопленные в буфере приращения лягут поверх нулей
+        counter_buffer.flush()
+        zero = {'views': Value(0), 'likes': Value(0), 'dislikes': Value(0)}
+        with transaction.atomic():
+            updated = queryset.update(
+                views=0, likes=0, dislikes=0,
+                effective_weight=effective_weight_expression(**zero),
+                updated_at=timezone.now(),
+            )
+            transaction.on_commit(_invalidate_caches)
+        self.message_user(request, f'Счетчики обнулены у {updated} цитат', messages.SUCCESS)
+
+    @admin.action(description='Пересчитать вес по голосам')
+    def recompute_vote_weights(self, request, queryset):
+        # Та же формула, что после голосования (models.vote_weight_expression);
+        # команда recompute_weights, наоборот, не трогает вес, а применяет
+        # к нему текущую политику (weighting.py)
+        with transaction.atomic():
+            updated = queryset.recompute_vote_weights()
+            transaction.on_commit(_invalidate_caches)
+        self.message_user(request, f'Вес пересчитан у {updated} цитат', messages.SUCCESS)
@@ -0,0 +1,196 @@
+"""JSON API только для чтения: случайные цитаты, список, популярные, тренды, статистика, подсказки источников"""
+import hashlib
+
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_GET
+
+from .activity import trending_quotes
+from .counters import counter_buffer
+from .eligibility import VoteEligibility
+from .leaderboard import popular_leaderboard
+from .models import MAX_QUOTES_PER_SOURCE, Quote, Source
+from .search import search_quotes
+from .stats import dashboard_stats
+from .views import pick_random_quote, pick_random_quotes, random_filters
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+DEFAULT_RANDOM_BATCH = 10
+# Меньше, чем помнит cookie права голоса (QUOTES_VOTE_ELIGIBILITY_SIZE)
+MAX_RANDOM_BATCH = 20
+
+
+def serialize_quote(quote):
+    return {
+        'id': quote.id,
+        'text': quote.text,
+        'source': {
+            'id': quote.source.id,
+            'name': quote.source.name,
+            'type': quote.source.type,
+        },
+        'weight': quote.weight,
+        'views': quote.views,
+        'likes': quote.likes,
+        'dislikes': quote.dislikes,
+        'created_at': quote.created_at.isoformat(),
+        'updated_at': quote.updated_at.isoformat(),
+    }
+
+
+def serialize_source(source):
+    return {
+        'id': source.id,
+        'name': source.name,
+        'type': source.type,
+        'label': str(source),
+        'quote_count': source.quote_count,
+        'full': source.quote_count >= MAX_QUOTES_PER_SOURCE,
+    }
+
+
+def _etag(*parts):
+    return hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def conditional_json(request, build, etag, last_modified=None):
+    """Отвечает 304, если у клиента актуальная версия, иначе JSON из build()
+
+    build вызывается только при промахе, так что неизмененные ответы не
+    читают строки целиком и не сериализуются заново.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=quote_etag(etag), last_modified=timestamp)
+    if response is None:
+        response = JsonResponse(build())
+    response.headers['ETag'] = quote_etag(etag)
+    if timestamp is not None:
+        response.headers['Last-Modified'] = http_date(timestamp)
+    # Клиент хранит ответ, но каждый раз сверяет ETag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def _page_size(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
+    return min(max(limit, 1), MAX_PAGE_SIZE)
+
+
+@require_GET
+def quote_list(request):
+    """Список цитат по возрастанию id с keyset-пагинацией (?after=<id>&limit=)"""
+    limit = _page_size(request)
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        after = 0
+
+    page = Quote.objects.filter(id__gt=after).order_by('id')[:limit]
+    # Для проверки ETag достаточно id и updated_at по первичному ключу
+    versions = list(page.values_list('id', 'updated_at'))
+    last_modified = max((updated_at for _, updated_at in versions), default=None)
+
+    def build():
+        quotes = page.select_related('source')
+        next_url = None
+        if len(versions) == limit:
+            next_url = f"{reverse('api_quote_list')}?after={versions[-1][0]}&limit={limit}"
+        return {'results': [serialize_quote(quote) for quote in quotes], 'next': next_url}
+
+    return conditional_json(request, build, _etag(limit, versions), last_modified)
+
+
+@require_GET
+def quote_detail(request, quote_id):
+    """Одна цитата"""
+    updated_at = Quote.objects.filter(id=quote_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        raise Http404('Цитата не найдена')
+
+    def build():
+        return serialize_quote(Quote.objects.select_related('source').get(id=quote_id))
+
+    return conditional_json(request, build, _etag(quote_id, updated_at), updated_at)
+
+
+@require_GET
+def random_quote(request):
+    """Случайная цитата с учетом веса (?type=, ?source=); как и страница, засчитывает просмотр"""
+    quote = pick_random_quote(**random_filters(request))
+    eligibility = VoteEligibility.from_request(request)
+    if quote is None:
+        return JsonResponse({'quote': None})
+
+    counter_buffer.record(quote, views=1)
+    eligibility.mark_viewed(quote.id)
+    response = JsonResponse({'quote': serialize_quote(quote)})
+    patch_cache_control(response, no_store=True)
+    return eligibility.save(response)
+
+
+@require_GET
+def random_quotes(request):
+    """Несколько разных случайных цитат с учетом веса (?count=, ?type=, ?source=) для очереди на клиенте
+
+    Просмотры и право голоса засчитываются сразу за все цитаты пачки.
+    """
+    try:
+        count = int(request.GET.get('count', DEFAULT_RANDOM_BATCH))
+    except ValueError:
+        count = DEFAULT_RANDOM_BATCH
+    quotes = pick_random_quotes(min(max(count, 1), MAX_RANDOM_BATCH), **random_filters(request))
+    eligibility = VoteEligibility.from_request(request)
+    if quotes:
+        counter_buffer.record_many(quotes, views=1)
+        eligibility.mark_viewed_many([quote.id for quote in quotes])
+    response = JsonResponse({'results': [serialize_quote(quote) for quote in quotes]})
+    patch_cache_control(response, no_store=True)
+    return eligibility.save(response)
+
+
+@require_GET
+def popular_quotes(request):
+    """Топ популярных цитат"""
+    entries = popular_leaderboard.get()
+    etag = _etag([(entry['id'], entry['likes'], entry['dislikes'], entry['views']) for entry in entries])
+
+    def build():
+        quotes = Quote.objects.select_related('source').in_bulk([entry['id'] for entry in entries])
+        return {'results': [serialize_quote(quotes[entry['id']]) for entry in entries if entry['id'] in quotes]}
+
+    return conditional_json(request, build, etag)
+
+
+@require_GET
+def trending(request):
+    """Цитаты с наибольшей активностью за последние часы (?limit=)"""
+    entries = trending_quotes(_page_size(request))
+    return conditional_json(request, lambda: {'results': entries}, _etag(entries))
+
+
+@require_GET
+def stats(request):
+    """Сводная статистика (та же, что на дашборде)"""
+    snapshot = {key: value for key, value in dashboard_stats.get().items() if key != 'built_at'}
+    return conditional_json(request, lambda: snapshot, _etag(sorted(snapshot.items(), key=str)))
+
+
+@require_GET
+def search(request):
+    """Поиск по тексту цитаты и названию источника (?q=&limit=)"""
+    query = request.GET.get('q', '').strip()
+    quotes = search_quotes(query, _page_size(request)) if query else []
+    return JsonResponse({'query': query, 'results': [serialize_quote(quote) for quote in quotes]})
+
+
+@require_GET
+def source_lookup(request):
+    """Источники по началу названия для поля выбора в форме (?q=&type=&limit=)"""
+    sources = Source.objects.lookup(request.GET.get('q', ''), request.GET.get('type'))[:_page_size(request)]
+    return JsonResponse({'results': [serialize_source(source) for source in sources]})
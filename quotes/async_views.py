@@ -0,0 +1,103 @@
+"""Асинхронные версии горячих представлений для запуска под ASGI
+
+Чтение идет через асинхронный ORM, выбор цитаты и топ берутся из памяти
+и кэша без потоков. В sync_to_async уходят только (пере)чтение индексов
+и запись голоса, у которой нет асинхронного аналога UPDATE ... RETURNING.
+Право голоса хранится в cookie, поэтому сессия здесь не нужна.
+Подключаются настройкой QUOTES_ASYNC_VIEWS (см. urls.py).
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, render
+from django.views.decorators.http import require_POST
+
+from . import fragments
+from .counters import counter_buffer
+from .eligibility import VoteEligibility
+from .leaderboard import popular_leaderboard
+from .models import Quote, Source
+from .sampler import quote_sampler
+from .views import apply_vote, random_filters, sample_without_replacement, source_quotes
+
+
+async def pick_random_quote(source_type=None, source_id=None):
+    """Асинхронный views.pick_random_quote"""
+    if source_id is not None:
+        quotes = [quote async for quote in source_quotes(source_id)]
+        return next(iter(sample_without_replacement(quotes, 1)), None)
+    quotes = Quote.objects.select_related('source')
+    quote_id = await quote_sampler.apick(source_type)
+    if quote_id is not None:
+        quote = await quotes.filter(id=quote_id).afirst()
+        if quote is not None:
+            return quote
+        # Цитату удалили в другом процессе - индекс устарел
+        quote_sampler.invalidate()
+    if source_type is not None:
+        return None
+
+    return await quotes.order_by('?').afirst()
+
+
+async def random_quote(request):
+    """Случайная цитата с учетом веса"""
+    filters = random_filters(request)
+    selected_quote = await pick_random_quote(**filters)
+
+    eligibility = VoteEligibility.from_request(request)
+    if selected_quote:
+        await counter_buffer.arecord(selected_quote, views=1)
+        eligibility.mark_viewed(selected_quote.id)
+
+    response = render(request, 'quotes/random_quote.html', {
+        'quote': selected_quote,
+        'total_quotes': await Quote.objects.acount(),
+        'source_types': Source.TYPE_CHOICES,
+        'filters': filters,
+    })
+    return eligibility.save(response)
+
+
+@require_POST
+async def like_quote(request, quote_id):
+    """Лайк цитаты с проверкой ограничений"""
+    return await _vote_quote(request, quote_id, 'like')
+
+
+@require_POST
+async def dislike_quote(request, quote_id):
+    """Дизлайк цитаты с проверкой ограничений"""
+    return await _vote_quote(request, quote_id, 'dislike')
+
+
+async def _vote_quote(request, quote_id, vote_type):
+    eligibility = VoteEligibility.from_request(request)
+    if not eligibility.can_vote(quote_id):
+        quote = counter_buffer.apply_pending(await aget_object_or_404(Quote, id=quote_id))
+        return JsonResponse({
+            'success': False,
+            'error': 'Вы уже голосовали за эту цитату или не просматривали её',
+            'likes': quote.likes,
+            'dislikes': quote.dislikes
+        })
+
+    # Голос, индекс выбора, статистика и топ - одним переходом в поток
+    likes, dislikes, weight = await sync_to_async(apply_vote)(quote_id, vote_type)
+    eligibility.mark_voted(quote_id)
+
+    return eligibility.save(JsonResponse({
+        'success': True,
+        'likes': likes,
+        'dislikes': dislikes,
+        'weight': weight
+    }))
+
+
+async def popular_quotes(request):
+    """Популярные цитаты по количеству лайков"""
+    quotes = await popular_leaderboard.aget()
+
+    return render(request, 'quotes/popular_quotes.html', {
+        'quotes': quotes,
+        **await fragments.acontext(fragments.POPULAR),
+    })
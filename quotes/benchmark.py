@@ -0,0 +1,266 @@
+"""Общие помощники для нагрузочных замеров (команды bench_*)"""
+import asyncio
+import os
+import random
+import statistics
+import threading
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.db import connection, transaction
+
+SEED_BATCH_SIZE = 5000
+
+# Бюджет SQL-запросов на запрос к странице в установившемся режиме (кэши
+# прогреты). Его проверяют EndpointQueryBudgetTests и bench_endpoints --check
+QUERY_BUDGETS = {
+    'random_quote': 2,
+    'random_by_type': 2,
+    'random_batch': 1,
+    'like_quote': 1,
+    'dislike_quote': 1,
+    'popular_quotes': 0,
+    'dashboard': 0,
+    'add_quote': 8,
+    'add_source': 0,
+}
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """Временная БД (как у тестов), чтобы не трогать рабочие данные
+
+    У каждого замера свой файл: запущенный рядом manage.py test не
+    пересоздаст его посреди замера, и наоборот.
+    """
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict['TEST']
+    old_test_name = test_settings.get('NAME')
+    test_settings['NAME'] = Path(tempfile.gettempdir()) / f'quotes_bench_{os.getpid()}.sqlite3'
+    try:
+        connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+        try:
+            yield connection
+        finally:
+            from .counters import counter_buffer
+
+            # Приращения относятся к временной БД - пишем их туда, пока она есть
+            counter_buffer.flush()
+            connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+    finally:
+        test_settings['NAME'] = old_test_name
+
+
+def seed(quotes, max_likes=1000, max_views=100000, rng=None):
+    """Заполняет БД синтетическими источниками и цитатами (по 3 на источник)
+
+    Цитаты попадают только в созданные здесь источники, поэтому seed можно
+    вызывать и на БД с данными: чужие источники и их лимит не затрагиваются.
+    Названия получают метку запуска, чтобы повторный вызов не конфликтовал
+    с прошлым по уникальности.
+    """
+    from .models import Quote, Source
+
+    rng = rng or random.Random(42)
+    types = [code for code, _ in Source.TYPE_CHOICES]
+    tag = uuid.uuid4().hex[:8]
+    sources_count = (quotes + 2) // 3
+    with transaction.atomic():
+        # Не все СУБД возвращают id из bulk_create - новые источники находим
+        # по id больше последнего существующего
+        last_id = Source.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        for start in range(0, sources_count, SEED_BATCH_SIZE):
+            Source.objects.bulk_create([
+                Source(
+                    name=f'Источник {tag}-{number}', name_key=f'источник {tag}-{number}',
+                    type=types[number % len(types)], quote_count=min(quotes - number * 3, 3),
+                )
+                for number in range(start, min(start + SEED_BATCH_SIZE, sources_count))
+            ])
+        sources = list(Source.objects.filter(id__gt=last_id, name_key__startswith=f'источник {tag}-')
+                       .order_by('id').values_list('id', 'quote_count'))
+        # Каждый источник получает ровно quote_count цитат
+        source_ids = [source_id for source_id, quote_count in sources for _ in range(quote_count)]
+        for start in range(0, quotes, SEED_BATCH_SIZE):
+            Quote.objects.bulk_create([
+                Quote(
+                    text=f'Синтетическая цитата номер {number}',
+                    source_id=source_ids[number],
+                    weight=rng.randint(1, 100),
+                    views=rng.randint(0, max_views),
+                    likes=rng.randint(0, max_likes),
+                    dislikes=rng.randint(0, max_likes),
+                )
+                for number in range(start, min(start + SEED_BATCH_SIZE, quotes))
+            ])
+        Quote.objects.refresh_effective_weights()
+
+
+def percentiles(samples):
+    """Сводка по замерам в миллисекундах"""
+    ordered = sorted(samples)
+
+    def at(share):
+        return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+    return {
+        'count': len(ordered),
+        'mean': statistics.fmean(ordered),
+        'p50': at(0.50),
+        'p95': at(0.95),
+        'p99': at(0.99),
+        'max': ordered[-1],
+    }
+
+
+def measure(func, repeat):
+    """Вызывает func repeat раз и возвращает сводку по времени в мс"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentiles(samples)
+
+
+def format_summary(summary):
+    return (
+        f"n={summary['count']} mean={summary['mean']:.3f}ms p50={summary['p50']:.3f}ms "
+        f"p95={summary['p95']:.3f}ms p99={summary['p99']:.3f}ms max={summary['max']:.3f}ms"
+    )
+
+
+class QueryCounter:
+    """execute_wrapper, считающий SQL-запросы текущего потока"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run_load(prepare, request, clients, requests):
+    """Выполняет request(client, prepared) из clients потоков
+
+    prepare(client) вызывается перед каждым запросом и в замер не входит
+    (например, просмотр цитаты перед голосованием). Возвращает сводку по
+    задержкам, пропускной способности и числу SQL-запросов на запрос.
+    """
+    from django.test import Client
+
+    latencies = []
+    queries = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(count):
+        client = Client()
+        counter = QueryCounter()
+        try:
+            with connection.execute_wrapper(counter):
+                for _ in range(count):
+                    prepared = prepare(client) if prepare else None
+                    counter.count = 0
+                    started = time.perf_counter()
+                    try:
+                        response = request(client, prepared)
+                        failed = response.status_code >= 400
+                    except Exception as exc:
+                        failed = exc
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        if failed:
+                            errors.append(failed)
+                        else:
+                            latencies.append(elapsed)
+                            queries.append(counter.count)
+        finally:
+            connection.close()
+
+    counts = [requests // clients + (index < requests % clients) for index in range(clients)]
+    threads = [threading.Thread(target=worker, args=(count,)) for count in counts if count]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    summary = percentiles(latencies) if latencies else {'count': 0}
+    summary.update(
+        errors=len(errors),
+        throughput=len(latencies) / wall if wall else 0.0,
+        queries=statistics.fmean(queries) if queries else 0.0,
+        # Медиана не учитывает редкие запросы со сбросом счетчиков или
+        # пересборкой кэша - по ней сверяем с QUERY_BUDGETS
+        queries_p50=statistics.median(queries) if queries else 0.0,
+    )
+    return summary
+
+
+def budget_failures(results, budgets=None):
+    """Нарушения в результатах run_load по страницам: ошибки и превышение бюджета запросов"""
+    budgets = QUERY_BUDGETS if budgets is None else budgets
+    failures = []
+    for name, summary in results.items():
+        if summary['errors']:
+            failures.append(f"{name}: ошибок {summary['errors']}")
+        if not summary['count']:
+            failures.append(f'{name}: ни одного успешного запроса')
+        elif name in budgets and summary['queries_p50'] > budgets[name]:
+            failures.append(f"{name}: {summary['queries_p50']:g} SQL-запросов на запрос, бюджет {budgets[name]}")
+    return failures
+
+
+def run_async_load(prepare, request, clients, requests):
+    """Асинхронный run_load: clients задач AsyncClient в одном цикле событий
+
+    prepare и request здесь корутины. Запросы идут через ASGI-обработчик,
+    поэтому асинхронные представления не занимают поток на время ожидания.
+    SQL-запросы выполняются в потоках sync_to_async и не считаются.
+    """
+    from asgiref.sync import sync_to_async
+    from django.db import connections
+    from django.test import AsyncClient
+
+    latencies = []
+    errors = []
+
+    async def worker(count):
+        client = AsyncClient()
+        for _ in range(count):
+            prepared = await prepare(client) if prepare else None
+            started = time.perf_counter()
+            try:
+                response = await request(client, prepared)
+                failed = response.status_code >= 400
+            except Exception as exc:
+                failed = exc
+            elapsed = (time.perf_counter() - started) * 1000
+            if failed:
+                errors.append(failed)
+            else:
+                latencies.append(elapsed)
+
+    async def main():
+        counts = [requests // clients + (index < requests % clients) for index in range(clients)]
+        await asyncio.gather(*(worker(count) for count in counts if count))
+        # Соединения открывались в потоке sync_to_async - там же их и закрываем
+        await sync_to_async(connections.close_all)()
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    wall = time.perf_counter() - started
+
+    summary = percentiles(latencies) if latencies else {'count': 0}
+    summary.update(
+        errors=len(errors),
+        throughput=len(latencies) / wall if wall else 0.0,
+        queries=None,
+    )
+    return summary
@@ -0,0 +1,386 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .activity import hour_bucket, write_activity
+from .db import retry_on_busy
+from .weighting import current_policy
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ('views', 'likes', 'dislikes')
+
+# Сколько цитат обновляем одним UPDATE (ограничение SQLite на число параметров)
+BATCH_SIZE = 250
+# Файл в QUOTES_COUNTER_SPOOL_DIR, которым flush_counters просит все
+# процессы сбросить буферы (внутри - время запроса)
+FLUSH_REQUEST_FILE = 'flush.request'
+
+
+class CounterBuffer:
+    """Копит приращения просмотров и голосов в памяти и пишет их в БД пачками
+
+    Заодно копит те же приращения по часам для истории (activity.py), в
+    том числе голоса, которые в саму цитату уже записал apply_vote.
+    Сброс происходит при накоплении QUOTES_COUNTER_FLUSH_SIZE цитат, раз в
+    QUOTES_COUNTER_FLUSH_INTERVAL секунд (по таймеру в фоновом потоке, даже
+    если новых запросов нет), при штатном завершении процесса и по запросу
+    команды flush_counters: раз в QUOTES_COUNTER_FLUSH_POLL секунд процесс
+    с непустым буфером проверяет файл запроса в QUOTES_COUNTER_SPOOL_DIR.
+    Если БД недоступна при выходе, приращения сохраняются в тот же каталог
+    и применяются командой flush_counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # id цитаты -> [views, likes, dislikes]
+        self._history = {}  # (начало часа, id цитаты) -> [views, likes, dislikes]
+        self._database = None  # БД, для которой накоплены приращения
+        self._last_flush = time.monotonic()
+        self._last_flush_at = time.time()  # то же по часам, для сравнения с запросом сброса
+        self._request_checked = 0.0  # когда последний раз проверяли запрос сброса
+        self._timer = None  # отложенный фоновый сброс
+
+    def _accumulate(self, quote_ids, views, likes, dislikes, counters=True):
+        """Копит одинаковые приращения цитат; возвращает True, если пора сбрасывать буфер"""
+        with self._lock:
+            if not self._pending and not self._history:
+                self._database = _database_name()
+            bucket = hour_bucket()
+            for quote_id in quote_ids:
+                targets = [self._history.setdefault((bucket, quote_id), [0, 0, 0])]
+                if counters:
+                    targets.append(self._pending.setdefault(quote_id, [0, 0, 0]))
+                for deltas in targets:
+                    deltas[0] += views
+                    deltas[1] += likes
+                    deltas[2] += dislikes
+            self._schedule()
+            return self._is_due()
+
+    def _schedule(self):
+        """Заводит фоновую проверку буфера, если она еще не заведена (под self._lock)
+
+        Таймер срабатывает через интервал сброса или раньше, если запрос
+        сброса проверяется чаще.
+        """
+        delays = [
+            delay for delay in (
+                getattr(settings, 'QUOTES_COUNTER_FLUSH_INTERVAL', 5),
+                getattr(settings, 'QUOTES_COUNTER_FLUSH_POLL', 1),
+            )
+            if delay is not None
+        ]
+        if (
+            self._timer is not None or not delays
+            or not getattr(settings, 'QUOTES_COUNTER_BACKGROUND_FLUSH', True)
+        ):
+            return
+        self._timer = threading.Timer(min(delays), self._background_flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_flush(self):
+        with self._lock:
+            self._timer = None
+            if not self._pending and not self._history:
+                return
+            if not self._is_due():
+                self._schedule()
+                return
+        try:
+            self._flush_quietly()
+        finally:
+            # Соединения этого потока больше не понадобятся. Если запись не
+            # удалась, _restore уже завел следующую попытку
+            connections.close_all()
+
+    def _after_fork(self):
+        # Поток таймера и захваченная блокировка в дочерний процесс не переходят
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            # Приращения уже возвращены в буфер, запишем их при следующем сбросе
+            pass
+
+    def add(self, quote_id, views=0, likes=0, dislikes=0):
+        if self._accumulate([quote_id], views, likes, dislikes):
+            self._flush_quietly()
+
+    def add_history(self, quote_id, likes=0, dislikes=0):
+        """Учитывает в истории голос, уже записанный в цитату"""
+        if self._accumulate([quote_id], 0, likes, dislikes, counters=False):
+            self._flush_quietly()
+
+    async def aadd(self, quote_id, views=0, likes=0, dislikes=0):
+        """add() для асинхронных представлений: сброс в БД уходит в поток"""
+        if self._accumulate([quote_id], views, likes, dislikes):
+            await sync_to_async(self._flush_quietly)()
+
+    def _is_due(self):
+        flush_size = getattr(settings, 'QUOTES_COUNTER_FLUSH_SIZE', 500)
+        if flush_size is not None and len(self._pending) >= flush_size:
+            return True
+        interval = getattr(settings, 'QUOTES_COUNTER_FLUSH_INTERVAL', 5)
+        if interval is not None and time.monotonic() - self._last_flush >= interval:
+            return True
+        return self._flush_requested()
+
+    def _flush_requested(self):
+        """Просила ли команда flush_counters сбросить буфер после нашего последнего сброса"""
+        poll = getattr(settings, 'QUOTES_COUNTER_FLUSH_POLL', 1)
+        now = time.monotonic()
+        if poll is None or now - self._request_checked < poll:
+            return False
+        self._request_checked = now
+        requested_at = flush_requested_at()
+        return requested_at is not None and requested_at > self._last_flush_at
+
+    def pending(self, quote_id):
+        """Еще не записанные в БД приращения для цитаты"""
+        with self._lock:
+            deltas = self._pending.get(quote_id, (0, 0, 0))
+            return dict(zip(COUNTER_FIELDS, deltas))
+
+    def apply_pending(self, quote):
+        """Добавляет незаписанные приращения к загруженной цитате для показа"""
+        for field, delta in self.pending(quote.id).items():
+            setattr(quote, field, getattr(quote, field) + delta)
+        return quote
+
+    def record(self, quote, **deltas):
+        """Учитывает приращения и сразу отражает их в загруженной цитате"""
+        self.apply_pending(quote)
+        for field, delta in deltas.items():
+            setattr(quote, field, getattr(quote, field) + delta)
+        self.add(quote.id, **deltas)
+        return quote
+
+    def record_many(self, quotes, **deltas):
+        """record() для пачки цитат: приращения копятся разом, сброс не больше одного"""
+        for quote in quotes:
+            self.apply_pending(quote)
+            for field, delta in deltas.items():
+                setattr(quote, field, getattr(quote, field) + delta)
+        values = {field: deltas.get(field, 0) for field in COUNTER_FIELDS}
+        if self._accumulate([quote.id for quote in quotes], **values):
+            self._flush_quietly()
+        return quotes
+
+    async def arecord(self, quote, **deltas):
+        self.apply_pending(quote)
+        for field, delta in deltas.items():
+            setattr(quote, field, getattr(quote, field) + delta)
+        await self.aadd(quote.id, **deltas)
+        return quote
+
+    def _take(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            history, self._history = self._history, {}
+            database, self._database = self._database, None
+            self._last_flush = time.monotonic()
+            self._last_flush_at = time.time()
+            return pending, history, database
+
+    def _restore(self, deltas, history):
+        with self._lock:
+            if not self._pending and not self._history:
+                self._database = _database_name()
+            for target, restored in ((self._pending, deltas), (self._history, history)):
+                for key, values in restored.items():
+                    current = target.setdefault(key, [0, 0, 0])
+                    for index, value in enumerate(values):
+                        current[index] += value
+            self._schedule()
+
+    def flush(self):
+        """Записывает накопленные приращения, возвращает число цитат"""
+        deltas, history, database = self._take()
+        if not deltas and not history:
+            return 0
+        if database != _database_name():
+            _set_aside(deltas, history, database)
+            return 0
+        try:
+            write_deltas(deltas, history)
+        except Exception:
+            # Ничего не теряем: вернем приращения и попробуем в следующий раз
+            self._restore(deltas, history)
+            logger.exception('Не удалось записать счетчики цитат')
+            raise
+        return len(deltas)
+
+    def flush_on_exit(self):
+        deltas, history, database = self._take()
+        if not deltas and not history:
+            return
+        if database != _database_name():
+            _set_aside(deltas, history, database)
+            return
+        try:
+            write_deltas(deltas, history)
+        except Exception:
+            logger.exception('Не удалось записать счетчики при завершении, сохраняем в spool')
+            spool_deltas(deltas, history, database)
+
+
+def _database_name():
+    return str(connection.settings_dict['NAME'])
+
+
+def _set_aside(deltas, history, database):
+    # Соединение уже переключили на другую БД (например, временную удалили):
+    # в текущую чужие id писать нельзя, откладываем до возвращения той БД
+    path = spool_deltas(deltas, history, database)
+    logger.info('Счетчики %d цитат БД %s сохранены в %s', len(deltas), database, path)
+
+
+@retry_on_busy
+def write_deltas(deltas, history=None):
+    """Применяет приращения {id: [views, likes, dislikes]} в одной транзакции
+
+    history - приращения по часам для activity.write_activity, пишутся в
+    той же транзакции. Если БД занята, транзакция повторяется целиком
+    (db.retry_on_busy).
+    """
+    from .leaderboard import popular_leaderboard
+    from .models import Quote
+    from .sampler import quote_sampler
+    from .stats import dashboard_stats
+
+    ids = list(deltas)
+    rows = []
+    with transaction.atomic():
+        for start in range(0, len(ids), BATCH_SIZE):
+            chunk = ids[start:start + BATCH_SIZE]
+            updates = {}
+            for index, field in enumerate(COUNTER_FIELDS):
+                whens = [
+                    When(id=quote_id, then=Value(deltas[quote_id][index]))
+                    for quote_id in chunk if deltas[quote_id][index]
+                ]
+                if whens:
+                    updates[field] = F(field) + Case(*whens, default=Value(0), output_field=IntegerField())
+            Quote.objects.filter(id__in=chunk).update(updated_at=timezone.now(), **updates)
+            rows.extend(Quote.objects.filter(id__in=chunk).values_list('id', 'views', 'likes', 'dislikes'))
+
+        # Вес зависит от лайков и дизлайков - пересчитываем после записи голосов
+        voted = [quote_id for quote_id in ids if deltas[quote_id][1] or deltas[quote_id][2]]
+        for start in range(0, len(voted), BATCH_SIZE):
+            chunk = voted[start:start + BATCH_SIZE]
+            Quote.objects.filter(id__in=chunk).recompute_vote_weights()
+            quote_sampler.refresh(chunk)
+
+        # Остальным только просмотры; эффективный вес от них зависит не всегда
+        if 'views' in current_policy().inputs:
+            viewed = [quote_id for quote_id in ids if not (deltas[quote_id][1] or deltas[quote_id][2])]
+            for start in range(0, len(viewed), BATCH_SIZE):
+                chunk = viewed[start:start + BATCH_SIZE]
+                Quote.objects.filter(id__in=chunk).refresh_effective_weights()
+                quote_sampler.refresh(chunk)
+
+        if history:
+            write_activity(history)
+
+        def update_caches():
+            dashboard_stats.record_counters(deltas, rows)
+            popular_leaderboard.record_counters(rows)
+
+        transaction.on_commit(update_caches)
+
+
+def _spool_dir():
+    spool_dir = getattr(settings, 'QUOTES_COUNTER_SPOOL_DIR', None)
+    return Path(spool_dir) if spool_dir else None
+
+
+def spool_deltas(deltas, history=None, database=None):
+    """Сохраняет приращения в файл, чтобы их применила команда flush_counters
+
+    database - имя БД, к которой относятся приращения (по умолчанию текущая).
+    """
+    spool_dir = _spool_dir()
+    if spool_dir is None:
+        logger.error('QUOTES_COUNTER_SPOOL_DIR не задан, потеряны счетчики: %s', deltas)
+        return None
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    path = spool_dir / f'{int(time.time())}-{os.getpid()}-{uuid.uuid4().hex}.json'
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps({
+        'database': database or _database_name(),
+        'counters': {str(quote_id): values for quote_id, values in deltas.items()},
+        'history': [[bucket, quote_id, *values] for (bucket, quote_id), values in (history or {}).items()],
+    }))
+    tmp_path.replace(path)
+    return path
+
+
+def request_flush():
+    """Просит все процессы сбросить буферы счетчиков; False, если spool не настроен
+
+    Процессы с непустым буфером заметят запрос в течение
+    QUOTES_COUNTER_FLUSH_POLL секунд (при следующем запросе или по таймеру).
+    """
+    spool_dir = _spool_dir()
+    if spool_dir is None:
+        return False
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    path = spool_dir / FLUSH_REQUEST_FILE
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_text(repr(time.time()))
+    tmp_path.replace(path)
+    return True
+
+
+def flush_requested_at():
+    """Время последнего запроса flush_counters (секунды эпохи) или None"""
+    spool_dir = _spool_dir()
+    if spool_dir is None:
+        return None
+    try:
+        return float((spool_dir / FLUSH_REQUEST_FILE).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def drain_spool():
+    """Применяет сохраненные в spool приращения текущей БД, возвращает число файлов"""
+    spool_dir = _spool_dir()
+    if spool_dir is None or not spool_dir.exists():
+        return 0
+    drained = 0
+    for path in sorted(spool_dir.glob('*.json')):
+        data = json.loads(path.read_text())
+        if 'counters' not in data:
+            # Файлы старого формата: только {id: [views, likes, dislikes]}
+            data = {'counters': data, 'history': []}
+        if data.get('database', _database_name()) != _database_name():
+            logger.warning('%s: счетчики другой БД (%s), пропускаем', path.name, data['database'])
+            continue
+        deltas = {int(quote_id): values for quote_id, values in data['counters'].items()}
+        history = {(bucket, quote_id): values for bucket, quote_id, *values in data['history']}
+        write_deltas(deltas, history)
+        path.unlink()
+        drained += 1
+    return drained
+
+
+counter_buffer = CounterBuffer()
+atexit.register(counter_buffer.flush_on_exit)
+os.register_at_fork(after_in_child=counter_buffer._after_fork)
@@ -0,0 +1,51 @@
+"""Повтор записи, если SQLite занята другим писателем ("database is locked")"""
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, transaction
+
+logger = logging.getLogger(__name__)
+
+BUSY_MESSAGES = ('database is locked', 'database is busy', 'database table is locked')
+
+
+def is_busy_error(exc):
+    message = str(exc).lower()
+    return any(text in message for text in BUSY_MESSAGES)
+
+
+def retry_on_busy(func=None, *, using=DEFAULT_DB_ALIAS):
+    """Повторяет func при занятой БД с экспоненциальной паузой и разбросом
+
+    Повторять имеет смысл только целую транзакцию: внутри внешнего atomic
+    ошибка пробрасывается сразу, повторит ее открывший транзакцию код.
+    Число попыток и начальная пауза - QUOTES_DB_BUSY_RETRIES и
+    QUOTES_DB_BUSY_BACKOFF.
+    """
+    if func is None:
+        return functools.partial(retry_on_busy, using=using)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, 'QUOTES_DB_BUSY_RETRIES', 5)
+        backoff = getattr(settings, 'QUOTES_DB_BUSY_BACKOFF', 0.05)
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if (
+                    attempt >= retries
+                    or not is_busy_error(exc)
+                    or transaction.get_connection(using).in_atomic_block
+                ):
+                    raise
+                attempt += 1
+                delay = backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                logger.info('БД занята (%s), попытка %d через %.3f с', exc, attempt, delay)
+                time.sleep(delay)
+
+    return wrapper
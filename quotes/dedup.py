@@ -0,0 +1,164 @@
+"""Поиск точных и почти точных дубликатов цитат среди всех источников
+
+Точный дубликат - совпадение хэша нормализованного текста (регистр,
+пунктуация, ё/е и пробелы не важны), это один запрос по индексу.
+Почти точный - сходство по Жаккару множеств символьных 4-грамм не ниже
+QUOTES_NEAR_DUPLICATE_THRESHOLD. Его ищет MinHash с LSH: подпись текста
+режется на полосы, ключи полос хранятся в QuoteSignature с индексом, и
+кандидатами становятся цитаты хотя бы с одним общим ключом; сходство
+кандидатов затем считается точно.
+"""
+import hashlib
+import random
+
+from django.conf import settings
+from django.db.models import Q
+
+from .search import tokenize
+
+SHINGLE_SIZE = 4
+BANDS = 6
+ROWS_PER_BAND = 3
+# Перестановки хэшей шинглов - XOR со случайной маской: для криптохэша это
+# та же случайная перестановка, но втрое дешевле умножения по модулю.
+# Маски фиксированы: подписи должны совпадать между процессами
+_rng = random.Random(20240917)
+MASKS = [_rng.getrandbits(64) for _ in range(BANDS * ROWS_PER_BAND)]
+
+
+def normalize_text(text):
+    return ' '.join(tokenize(text))
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data.encode(), digest_size=8).digest(), 'big')
+
+
+def text_hash(text):
+    """Хэш нормализованного текста для поиска точных дубликатов"""
+    return hashlib.blake2b(normalize_text(text).encode(), digest_size=16).hexdigest()
+
+
+def shingles(text):
+    normalized = normalize_text(text)
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def similarity(first, second):
+    """Коэффициент Жаккара двух множеств шинглов"""
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def band_keys(text):
+    """Ключи LSH-полос MinHash-подписи текста (знаковые 64-битные числа)"""
+    hashes = [_hash64(shingle) for shingle in shingles(text)]
+    signature = [min(map(mask.__xor__, hashes)) for mask in MASKS]
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        key = _hash64(f'{band}:' + ','.join(map(str, rows)))
+        # BigIntegerField знаковый
+        keys.append(key - (1 << 64) if key >= 1 << 63 else key)
+    return keys
+
+
+def near_duplicate_threshold():
+    return getattr(settings, 'QUOTES_NEAR_DUPLICATE_THRESHOLD', 0.8)
+
+
+def find_duplicate(text, exclude_id=None):
+    """Цитата, дублирующая text, и признак точного совпадения, или (None, False)
+
+    Точный хэш и кандидаты LSH берутся одним запросом по двум индексам.
+    """
+    from .models import Quote, QuoteSignature
+
+    digest = text_hash(text)
+    threshold = near_duplicate_threshold()
+    condition = Q(text_hash=digest)
+    if threshold is not None:
+        # Подзапрос, а не JOIN: так SQLite разбирает OR по двум индексам
+        candidates = QuoteSignature.objects.filter(key__in=band_keys(text)).values('quote_id')
+        condition |= Q(id__in=candidates)
+    quotes = Quote.objects.select_related('source').filter(condition)
+    if exclude_id is not None:
+        quotes = quotes.exclude(id=exclude_id)
+
+    text_shingles = shingles(text)
+    best, best_score = None, threshold
+    for candidate in quotes:
+        if candidate.text_hash == digest:
+            return candidate, True
+        score = similarity(text_shingles, shingles(candidate.text))
+        if score >= best_score:
+            best, best_score = candidate, score
+    return best, False
+
+
+def duplicate_message(duplicate, exact):
+    if exact:
+        return f'Такая цитата уже есть у источника "{duplicate.source}"'
+    return f'Похожая цитата уже есть у источника "{duplicate.source}": «{duplicate.text[:80]}»'
+
+
+class BatchDeduplicator:
+    """Проверка пачки новых текстов на дубликаты для импорта
+
+    Хэши и ключи полос всей пачки ищутся в БД несколькими запросами по
+    индексам, а тексты, уже принятые из этой же пачки, проверяются по тем
+    же корзинам LSH в памяти.
+    """
+
+    def __init__(self, texts, chunk_size=500):
+        from .models import Quote, QuoteSignature
+
+        self.threshold = near_duplicate_threshold()
+        self._hashes = {text: text_hash(text) for text in texts}
+        self._keys = {text: band_keys(text) for text in texts} if self.threshold is not None else {}
+        self._seen = set()
+        self._buckets = {}
+        self._shingles = {}
+
+        hashes = list(set(self._hashes.values()))
+        for start in range(0, len(hashes), chunk_size):
+            self._seen.update(Quote.objects.filter(text_hash__in=hashes[start:start + chunk_size])
+                              .values_list('text_hash', flat=True))
+        keys = list({key for text_keys in self._keys.values() for key in text_keys})
+        for start in range(0, len(keys), chunk_size):
+            for key, quote_id in QuoteSignature.objects.filter(key__in=keys[start:start + chunk_size]) \
+                    .values_list('key', 'quote_id'):
+                self._buckets.setdefault(key, set()).add(quote_id)
+        quote_ids = list({quote_id for bucket in self._buckets.values() for quote_id in bucket})
+        for start in range(0, len(quote_ids), chunk_size):
+            for quote_id, text in Quote.objects.filter(id__in=quote_ids[start:start + chunk_size]) \
+                    .values_list('id', 'text'):
+                self._shingles[quote_id] = shingles(text)
+
+    def check(self, text):
+        """Причина отказа для дубликата или None"""
+        if self._hashes[text] in self._seen:
+            return 'Такая цитата уже есть'
+        if self.threshold is None:
+            return None
+        text_shingles = shingles(text)
+        candidates = {quote_id for key in self._keys[text] for quote_id in self._buckets.get(key, ())}
+        if any(similarity(text_shingles, self._shingles[quote_id]) >= self.threshold for quote_id in candidates):
+            return 'Похожая цитата уже есть'
+        return None
+
+    def add(self, text):
+        """Запоминает принятый текст, чтобы следующие строки пачки сравнивались и с ним"""
+        self._seen.add(self._hashes[text])
+        if self.threshold is None:
+            return
+        pending = ('pending', len(self._shingles))
+        self._shingles[pending] = shingles(text)
+        for key in self._keys[text]:
+            self._buckets.setdefault(key, set()).add(pending)
+
+    def signature_keys(self, text):
+        return self._keys.get(text) or band_keys(text)
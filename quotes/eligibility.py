@@ -0,0 +1,67 @@
+from django.conf import settings
+
+COOKIE_NAME = 'quotes_can_vote'
+COOKIE_SALT = 'quotes.eligibility'
+
+
+class VoteEligibility:
+    """Цитаты, за которые пользователь может проголосовать
+
+    Хранится в подписанной cookie вместо сессии, поэтому просмотр цитаты
+    не пишет в БД. Это упорядоченное множество недавно просмотренных и еще
+    не оцененных цитат, не больше QUOTES_VOTE_ELIGIBILITY_SIZE штук:
+    просмотр добавляет цитату, голос убирает ее. Повторный просмотр снова
+    разрешает голос - как и раньше с сессией, поэтому подмена cookie на
+    старую копию не дает ничего сверх повторного просмотра.
+    """
+
+    def __init__(self, quote_ids=()):
+        self._quote_ids = dict.fromkeys(quote_ids)
+        self.modified = False
+
+    @classmethod
+    def from_request(cls, request):
+        eligibility = getattr(request, '_vote_eligibility', None)
+        if eligibility is None:
+            raw = request.get_signed_cookie(COOKIE_NAME, default='', salt=COOKIE_SALT)
+            quote_ids = [int(value) for value in raw.split(',') if value.isdigit()]
+            eligibility = request._vote_eligibility = cls(quote_ids)
+        return eligibility
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'QUOTES_VOTE_ELIGIBILITY_SIZE', 50)
+
+    def can_vote(self, quote_id):
+        return int(quote_id) in self._quote_ids
+
+    def mark_viewed(self, quote_id):
+        self.mark_viewed_many([quote_id])
+
+    def mark_viewed_many(self, quote_ids):
+        for quote_id in map(int, quote_ids):
+            # Свежий просмотр переносим в конец, самые старые вытесняем
+            self._quote_ids.pop(quote_id, None)
+            self._quote_ids[quote_id] = None
+        while len(self._quote_ids) > self.max_size:
+            del self._quote_ids[next(iter(self._quote_ids))]
+        self.modified = True
+
+    def mark_voted(self, quote_id):
+        if self._quote_ids.pop(int(quote_id), False) is None:
+            self.modified = True
+
+    def save(self, response):
+        """Записывает состояние в cookie ответа, если оно изменилось"""
+        if not self.modified:
+            return response
+        response.set_signed_cookie(
+            COOKIE_NAME,
+            ','.join(str(quote_id) for quote_id in self._quote_ids),
+            salt=COOKIE_SALT,
+            max_age=settings.SESSION_COOKIE_AGE,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite='Lax',
+        )
+        return response
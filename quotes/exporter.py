@@ -0,0 +1,73 @@
+"""Потоковая выгрузка цитат со статистикой в CSV/JSONL"""
+import csv
+import io
+import json
+import zlib
+
+from .models import Quote
+
+FIELDS = (
+    'id', 'text', 'source_id', 'source_name', 'source_type',
+    'weight', 'views', 'likes', 'dislikes', 'created_at', 'updated_at',
+)
+
+# Строки копятся в кусок примерно такого размера перед отдачей/сжатием
+CHUNK_BYTES = 64 * 1024
+
+
+def _records(chunk_size):
+    quotes = Quote.objects.select_related('source').order_by('id')
+    for quote in quotes.iterator(chunk_size=chunk_size):
+        yield (
+            quote.id, quote.text, quote.source_id, quote.source.name, quote.source.type,
+            quote.weight, quote.views, quote.likes, quote.dislikes,
+            quote.created_at.isoformat(), quote.updated_at.isoformat(),
+        )
+
+
+def _lines(fmt, chunk_size):
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(FIELDS)
+        for record in _records(chunk_size):
+            writer.writerow(record)
+            if buffer.tell() >= CHUNK_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        return
+
+    lines = []
+    size = 0
+    for record in _records(chunk_size):
+        line = json.dumps(dict(zip(FIELDS, record)), ensure_ascii=False) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield ''.join(lines)
+            lines = []
+            size = 0
+    yield ''.join(lines)
+
+
+def export_chunks(fmt='csv', compress=False, chunk_size=2000):
+    """Генератор байтовых кусков выгрузки; память не зависит от размера таблицы"""
+    if not compress:
+        for text in _lines(fmt, chunk_size):
+            if text:
+                yield text.encode('utf-8')
+        return
+
+    # wbits=31 - формат gzip, сжимаем на лету
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for text in _lines(fmt, chunk_size):
+        data = compressor.compress(text.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_filename(fmt, compress):
+    return f"quotes.{fmt}{'.gz' if compress else ''}"
@@ -1,7 +1,31 @@
 from django import forms
 from django.core.exceptions import ValidationError
+from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
-from .models import Quote, Source
+from .models import MAX_QUOTES_PER_SOURCE, QUOTE_LIMIT_MESSAGE, Quote, Source
+
+
+class SourceAutocomplete(forms.Widget):
+    """Выбор источника с подсказками из api/sources/ вместо <select>
+
+    Варианты не рендерятся: в разметку попадает только выбранный источник,
+    поэтому страница не зависит от числа источников. ModelChoiceField
+    проверяет присланный id одним запросом по первичному ключу.
+    """
+    template_name = 'quotes/widgets/source_autocomplete.html'
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        source = None
+        if value not in (None, ''):
+            try:
+                source = Source.objects.filter(pk=value).first()
+            except (TypeError, ValueError):
+                pass
+        context['widget']['label'] = str(source) if source else ''
+        context['widget']['lookup_url'] = reverse('api_source_lookup')
+        context['widget']['max_quotes'] = MAX_QUOTES_PER_SOURCE
+        return context
 
 class SourceForm(forms.ModelForm):
     class Meta:
@@ -35,8 +59,8 @@ class SourceForm(forms.ModelForm):
         
         # Проверка ограничения на количество цитат при редактировании
         if self.instance and self.instance.pk:
-            if self.instance.quote_set.count() >= 3:
-                self.add_error(None, 'У одного источника не может быть больше 3 цитат')
+            if self.instance.quote_count >= MAX_QUOTES_PER_SOURCE:
+                self.add_error(None, QUOTE_LIMIT_MESSAGE)
         
         return cleaned_data
 
@@ -50,7 +74,10 @@ class QuoteForm(forms.ModelForm):
                 'rows': 3,
                 'placeholder': 'Введите текст цитаты...'
             }),
-            'source': forms.Select(attrs={'class': 'form-control'}),
+            'source': SourceAutocomplete(attrs={
+                'class': 'form-control',
+                'placeholder': 'Начните вводить название источника...'
+            }),
             'weight': forms.NumberInput(attrs={
                 'class': 'form-control',
                 'min': '1',
@@ -62,7 +89,6 @@ class QuoteForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['source'].empty_label = "--- Выберите источник ---"
         self.fields['source'].required = True
         self.fields['weight'].help_text = 'Чем выше вес, тем чаще цитата будет показываться'
 
@@ -0,0 +1,59 @@
+"""Кэш отрисованных фрагментов шаблонов ({% cache %})
+
+У каждой группы фрагментов ('sources', 'popular', 'stats') есть номер
+поколения в кэше, и он входит в ключ фрагмента. Сигналы моделей и запись
+снимков топа и статистики меняют номер, после чего старые фрагменты больше
+не читаются и истекают сами. Данные в шаблон передаются лениво, поэтому при
+попадании в кэш не выполняются ни запросы, ни отрисовка.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+SOURCES = 'sources'
+POPULAR = 'popular'
+STATS = 'stats'
+GROUPS = (SOURCES, POPULAR, STATS)
+
+
+def _key(group):
+    return f'quotes:fragments:{group}'
+
+
+def _timeout():
+    return getattr(settings, 'QUOTES_FRAGMENT_CACHE_TIMEOUT', 300)
+
+
+def bump(*groups):
+    """Сбрасывает фрагменты групп (по умолчанию всех)"""
+    # Номер - время, а не счетчик: после вытеснения ключа из кэша
+    # поколение не начнется заново и не совпадет со старыми фрагментами
+    version = time.time_ns()
+    cache.set_many({_key(group): version for group in groups or GROUPS}, None)
+
+
+def _context(groups, versions):
+    """Контекст шаблона и поколения, которых еще не было в кэше"""
+    missing = {_key(group): time.time_ns() for group in groups if _key(group) not in versions}
+    versions = {**versions, **missing}
+    return missing, {
+        'fragment_timeout': _timeout(),
+        'fragment_versions': {group: versions[_key(group)] for group in groups},
+    }
+
+
+def context(*groups):
+    """Переменные для {% cache fragment_timeout <имя> fragment_versions.<группа> %}"""
+    missing, result = _context(groups, cache.get_many([_key(group) for group in groups]))
+    if missing:
+        cache.set_many(missing, None)
+    return result
+
+
+async def acontext(*groups):
+    """context() для асинхронных представлений"""
+    missing, result = _context(groups, await cache.aget_many([_key(group) for group in groups]))
+    if missing:
+        await cache.aset_many(missing, None)
+    return result
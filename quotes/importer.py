@@ -0,0 +1,209 @@
+"""Потоковый импорт цитат из CSV/JSONL пачками"""
+import csv
+import json
+from collections import Counter
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+
+from .counters import BATCH_SIZE
+from .dedup import BatchDeduplicator, text_hash
+from .models import BASE_WEIGHT, QUOTE_LIMIT_MESSAGE, Quote, QuoteSignature, Source, source_name_key
+from .weighting import current_policy, effective_weight
+
+MIN_TEXT_LENGTH = 5
+MAX_WEIGHT = 1000
+
+
+class ImportRejected(Exception):
+    pass
+
+
+def read_rows(stream, fmt):
+    """Итератор словарей из CSV (с заголовком) или JSONL"""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _clean(row, source_types):
+    """Проверки QuoteForm/SourceForm для одной строки, без запросов к БД"""
+    text = (row.get('text') or '').strip()
+    if len(text) < MIN_TEXT_LENGTH:
+        raise ImportRejected('Текст цитаты должен содержать не менее 5 символов')
+    name = (row.get('source') or '').strip()
+    if not name or len(name) > Source._meta.get_field('name').max_length:
+        raise ImportRejected('Некорректное название источника')
+    source_type = (row.get('type') or '').strip()
+    if source_type not in source_types:
+        raise ImportRejected(f'Неизвестный тип источника: {source_type}')
+    weight = row.get('weight')
+    try:
+        weight = BASE_WEIGHT if weight in (None, '') else int(weight)
+    except (TypeError, ValueError):
+        raise ImportRejected('Вес должен быть целым числом')
+    if not 1 <= weight <= MAX_WEIGHT:
+        raise ImportRejected('Вес должен быть от 1 до 1000')
+    return text, name, source_type, weight
+
+
+class QuoteImporter:
+    """Загружает цитаты пачками по batch_size строк
+
+    Дубликаты среди всех цитат ищутся по хэшам и ключам LSH пачки
+    (dedup.BatchDeduplicator), лимит в 3 цитаты на источник - по счетчикам
+    ее источников, поэтому память ограничена размером пачки, а не файла.
+    Каждая пачка - своя транзакция.
+    """
+
+    def __init__(self, batch_size=5000, on_reject=None):
+        self.batch_size = batch_size
+        self.on_reject = on_reject
+        self.created = 0
+        self.sources_created = 0
+        self.rejected = Counter()
+        self._source_types = {code for code, _ in Source.TYPE_CHOICES}
+
+    def run(self, rows):
+        numbered = enumerate(rows, start=1)
+        while True:
+            batch = list(islice(numbered, self.batch_size))
+            if not batch:
+                break
+            self._import_batch(batch)
+        self._invalidate_caches()
+        return self
+
+    def _reject(self, line, row, reason):
+        self.rejected[reason] += 1
+        if self.on_reject:
+            self.on_reject(line, row, reason)
+
+    def _import_batch(self, batch):
+        cleaned = []
+        for line, row in batch:
+            try:
+                cleaned.append((line, row, *_clean(row, self._source_types)))
+            except ImportRejected as exc:
+                self._reject(line, row, str(exc))
+
+        with transaction.atomic():
+            sources = self._resolve_sources({(name, source_type) for *_, name, source_type, _ in cleaned})
+            duplicates = BatchDeduplicator([text for _, _, text, *_ in cleaned])
+            slots = self._reserve_slots(Counter(sources[(name, source_type)].id for *_, name, source_type, _ in cleaned))
+
+            policy = current_policy()
+            quotes = []
+            for line, row, text, name, source_type, weight in cleaned:
+                source = sources[(name, source_type)]
+                reason = duplicates.check(text)
+                if reason:
+                    self._reject(line, row, reason)
+                elif not slots[source.id]:
+                    self._reject(line, row, QUOTE_LIMIT_MESSAGE)
+                else:
+                    duplicates.add(text)
+                    slots[source.id] -= 1
+                    quote = Quote(text=text, source=source, weight=weight, text_hash=text_hash(text))
+                    # bulk_create обходит Quote.save - эффективный вес считаем сами
+                    quote.effective_weight = effective_weight(quote, policy)
+                    quotes.append(quote)
+
+            Quote.objects.bulk_create(quotes, batch_size=1000)
+            if quotes and quotes[0].pk is None:
+                self._fetch_ids(quotes)
+            QuoteSignature.objects.bulk_create([
+                QuoteSignature(quote_id=quote.id, key=key)
+                for quote in quotes for key in duplicates.signature_keys(quote.text)
+            ], batch_size=1000)
+            self.created += len(quotes)
+            self._release_slots(slots)
+
+    def _fetch_ids(self, quotes):
+        """Находит id вставленных цитат по (источник, текст)
+
+        bulk_create не возвращает id, если БД не умеет INSERT ... RETURNING
+        (SQLite старше 3.35), а они нужны для сигнатур дубликатов.
+        """
+        by_key = {(quote.source_id, quote.text): quote for quote in quotes}
+        for start in range(0, len(quotes), BATCH_SIZE):
+            chunk = quotes[start:start + BATCH_SIZE]
+            rows = Quote.objects.filter(text_hash__in={quote.text_hash for quote in chunk}).values_list(
+                'id', 'source_id', 'text',
+            )
+            for quote_id, source_id, text in rows:
+                quote = by_key.get((source_id, text))
+                if quote is not None:
+                    quote.pk = quote_id
+
+    def _reserve_slots(self, wanted):
+        """Занимает места под цитаты {id источника: сколько строк} до вставки
+
+        bulk_create обходит Quote.save, поэтому лимит проверяется тем же
+        условным UPDATE (SourceQuerySet.reserve_quote_slots): параллельное
+        добавление цитаты через сайт не превысит его вместе с импортом.
+        Возвращает {id источника: занято мест}.
+        """
+        return {
+            source_id: Source.objects.reserve_quote_slots(source_id, count)
+            for source_id, count in wanted.items()
+        }
+
+    def _release_slots(self, slots):
+        """Возвращает места, не понадобившиеся из-за дубликатов"""
+        unused = {source_id: count for source_id, count in slots.items() if count}
+        source_ids = list(unused)
+        for start in range(0, len(source_ids), BATCH_SIZE):
+            chunk = source_ids[start:start + BATCH_SIZE]
+            Source.objects.filter(id__in=chunk).update(quote_count=Greatest(F('quote_count') - Case(
+                *(When(id=source_id, then=Value(unused[source_id])) for source_id in chunk),
+                default=Value(0), output_field=IntegerField(),
+            ), 0))
+
+    def _resolve_sources(self, keys):
+        """Находит или создает источники {(name, type): Source} одной пачкой"""
+        def fetch():
+            found = Source.objects.filter(name__in={name for name, _ in keys})
+            return {(source.name, source.type): source for source in found if (source.name, source.type) in keys}
+
+        sources = fetch()
+        missing = keys - sources.keys()
+        if missing:
+            new_sources = [
+                Source(name=name, type=source_type, name_key=source_name_key(name)) for name, source_type in missing
+            ]
+            try:
+                with transaction.atomic():
+                    Source.objects.bulk_create(new_sources, batch_size=1000)
+                self.sources_created += len(new_sources)
+            except IntegrityError:
+                # Часть источников успел создать параллельный импорт - создаем
+                # по одному и считаем только действительно созданные
+                for source in new_sources:
+                    _, created = Source.objects.get_or_create(
+                        name=source.name, type=source.type, defaults={'name_key': source.name_key},
+                    )
+                    self.sources_created += created
+            sources = fetch()
+        return sources
+
+    def _invalidate_caches(self):
+        # bulk_create не шлет сигналы - сбрасываем производные кэши явно
+        from . import fragments
+        from .leaderboard import popular_leaderboard
+        from .sampler import quote_sampler
+        from .search import search_index
+        from .stats import dashboard_stats
+
+        if self.created or self.sources_created:
+            quote_sampler.invalidate()
+            dashboard_stats.invalidate()
+            popular_leaderboard.invalidate()
+            search_index.invalidate()
+            fragments.bump(fragments.SOURCES)
@@ -0,0 +1,145 @@
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from . import fragments
+
+CACHE_KEY = 'quotes:leaderboard'
+
+
+def _entry(quote):
+    return {
+        'id': quote.id,
+        'text': quote.text,
+        'source': str(quote.source),
+        'views': quote.views,
+        'likes': quote.likes,
+        'dislikes': quote.dislikes,
+    }
+
+
+def _rank(entry):
+    return (entry['likes'], entry['views'])
+
+
+class Leaderboard:
+    """Топ-N популярных цитат (по лайкам, затем просмотрам) в кэше
+
+    Голосование и запись счетчиков лайки и просмотры только увеличивают,
+    поэтому при них цитата может выпасть из топа лишь вытесненной другой -
+    список поддерживается точно, без сортировки таблицы. Все, что счетчики
+    уменьшает (обнуление в админке, удаление цитат), обязано вызвать
+    invalidate(): тогда топ пересобирается из БД. Для страховки между
+    процессами он пересобирается и раз в QUOTES_LEADERBOARD_MAX_AGE секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return getattr(settings, 'QUOTES_LEADERBOARD_SIZE', 10)
+
+    def _max_age(self):
+        return getattr(settings, 'QUOTES_LEADERBOARD_MAX_AGE', 300)
+
+    def _cached(self):
+        return self._fresh(cache.get(CACHE_KEY))
+
+    def _fresh(self, board):
+        if board is None or time.time() - board['built_at'] >= self._max_age():
+            return None
+        return board
+
+    def _save(self, board):
+        timeout = max(self._max_age() - (time.time() - board['built_at']), 1)
+        cache.set(CACHE_KEY, board, timeout)
+
+    def get(self):
+        board = self._cached()
+        if board is None:
+            board = self.rebuild()
+        return board['entries']
+
+    async def aget(self):
+        """get() для асинхронных представлений"""
+        board = self._fresh(await cache.aget(CACHE_KEY))
+        if board is None:
+            board = await sync_to_async(self.rebuild)()
+        return board['entries']
+
+    def rebuild(self):
+        from .models import Quote
+
+        quotes = Quote.objects.select_related('source').order_by('-likes', '-views')[:self.size]
+        board = {'entries': [_entry(quote) for quote in quotes], 'built_at': time.time()}
+        self._save(board)
+        return board
+
+    def invalidate(self):
+        cache.delete(CACHE_KEY)
+        fragments.bump(fragments.POPULAR)
+
+    def contains(self, quote_id):
+        board = self._cached()
+        return board is not None and any(entry['id'] == quote_id for entry in board['entries'])
+
+    def is_full(self):
+        board = self._cached()
+        return board is not None and len(board['entries']) >= self.size
+
+    def _update(self, rows):
+        """rows: [(id, views, likes, dislikes)] - новые значения счетчиков"""
+        from .models import Quote
+
+        with self._lock:
+            board = self._cached()
+            if board is None:
+                return
+            entries = board['entries']
+            by_id = {entry['id']: entry for entry in entries}
+            newcomers = []
+            for quote_id, views, likes, dislikes in rows:
+                entry = by_id.get(quote_id)
+                if entry is not None:
+                    entry.update(likes=likes, dislikes=dislikes)
+                    if views is not None:
+                        entry['views'] = views
+                elif views is not None and (
+                    len(entries) < self.size or (likes, views) > _rank(entries[-1])
+                ):
+                    newcomers.append(quote_id)
+            if newcomers:
+                quotes = Quote.objects.select_related('source').filter(id__in=newcomers)
+                entries.extend(_entry(quote) for quote in quotes)
+            entries.sort(key=_rank, reverse=True)
+            del entries[self.size:]
+            self._save(board)
+            fragments.bump(fragments.POPULAR)
+
+    def record_counters(self, rows):
+        """Учитывает записанные буфером счетчики"""
+        self._update(rows)
+
+    def record_vote(self, quote_id, likes, dislikes):
+        """Учитывает голос, уже записанный в БД"""
+        from .models import Quote
+
+        board = self._cached()
+        if board is None:
+            return
+        entries = board['entries']
+        views = None
+        in_board = any(entry['id'] == quote_id for entry in entries)
+        if not in_board and (len(entries) < self.size or likes >= entries[-1]['likes']):
+            # Цитата может войти в топ - нужны ее просмотры для сравнения
+            views = Quote.objects.filter(id=quote_id).values_list('views', flat=True).first()
+            if views is None:
+                return
+        self._update([(quote_id, views, likes, dislikes)])
+
+
+popular_leaderboard = Leaderboard()
@@ -0,0 +1,92 @@
+import json
+import types
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import include, path, reverse
+
+from quotes import async_views, views
+from quotes.benchmark import benchmark_database, run_async_load, run_load, seed
+from quotes.counters import counter_buffer
+from quotes.urls import build_urlpatterns
+
+from .bench_endpoints import QUOTE_ID_RE, view_quote
+
+
+def urlconf(hot_views):
+    """Корневой urlconf с выбранными горячими представлениями"""
+    module = types.ModuleType(f'bench_urls_{hot_views.__name__}')
+    module.urlpatterns = [path('', include(build_urlpatterns(hot_views)))]
+    return module
+
+
+async def aview_quote(client):
+    response = await client.get(reverse('random_quote'))
+    match = QUOTE_ID_RE.search(response.content.decode())
+    return int(match.group(1)) if match else None
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение пропускной способности синхронных представлений через WSGI '
+        'с асинхронными через ASGI (случайная цитата, голос, топ) при '
+        'одинаковом числе одновременных клиентов. Работает на временной БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quotes', type=int, default=10_000, help='Сколько цитат создать')
+        parser.add_argument(
+            '--clients', type=int, action='append',
+            help='Одновременных клиентов (можно несколько раз, по умолчанию 1, 8 и 64)',
+        )
+        parser.add_argument('--requests', type=int, default=500, help='Запросов на каждый замер')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def scenarios(self):
+        return {
+            'random_quote': (
+                (None, lambda client, prepared: client.get(reverse('random_quote'))),
+                (None, lambda client, prepared: client.get(reverse('random_quote'))),
+            ),
+            'like_quote': (
+                (view_quote, lambda client, quote_id: client.post(reverse('like_quote', args=[quote_id]))),
+                (aview_quote, lambda client, quote_id: client.post(reverse('like_quote', args=[quote_id]))),
+            ),
+            'popular_quotes': (
+                (None, lambda client, prepared: client.get(reverse('popular_quotes'))),
+                (None, lambda client, prepared: client.get(reverse('popular_quotes'))),
+            ),
+        }
+
+    def handle(self, *args, **options):
+        results = []
+        modes = (('wsgi', run_load, urlconf(views)), ('asgi', run_async_load, urlconf(async_views)))
+        # Лог медленных запросов под нагрузкой только зашумил бы вывод
+        with benchmark_database(), override_settings(ALLOWED_HOSTS=['*'], QUOTES_SLOW_REQUEST_MS=None):
+            seed(options['quotes'])
+            for name, (sync_scenario, async_scenario) in self.scenarios().items():
+                for clients in options['clients'] or [1, 8, 64]:
+                    for mode, runner, root_urlconf in modes:
+                        prepare, request = sync_scenario if mode == 'wsgi' else async_scenario
+                        with override_settings(ROOT_URLCONF=root_urlconf):
+                            summary = runner(prepare, request, clients, options['requests'])
+                        results.append({'endpoint': name, 'mode': mode, 'clients': clients, **summary})
+            counter_buffer.flush()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(
+            f"{'endpoint':<16}{'mode':>6}{'clients':>9}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+            f"{'p99 ms':>10}{'errors':>8}"
+        )
+        for row in results:
+            prefix = f"{row['endpoint']:<16}{row['mode']:>6}{row['clients']:>9}"
+            if not row['count']:
+                self.stdout.write(f"{prefix}{'-':>10}{'-':>10}{'-':>10}{'-':>10}{row['errors']:>8}")
+                continue
+            self.stdout.write(
+                f"{prefix}{row['throughput']:>10.1f}{row['p50']:>10.2f}{row['p95']:>10.2f}"
+                f"{row['p99']:>10.2f}{row['errors']:>8}"
+            )
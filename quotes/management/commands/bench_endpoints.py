@@ -0,0 +1,112 @@
+import json
+import re
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from quotes.benchmark import benchmark_database, budget_failures, run_load, seed
+from quotes.counters import counter_buffer
+from quotes.models import Source
+
+QUOTE_ID_RE = re.compile(r'id="likes-(\d+)"')
+
+
+def view_quote(client):
+    """Просмотр случайной цитаты - без него голосовать нельзя"""
+    match = QUOTE_ID_RE.search(client.get(reverse('random_quote')).content.decode())
+    return int(match.group(1)) if match else None
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный замер всех страниц приложения: пропускная способность, '
+        'перцентили задержки и число SQL-запросов. Работает на временной БД. '
+        'С --check завершается с ошибкой, если были ошибки или превышен бюджет '
+        'SQL-запросов (benchmark.QUERY_BUDGETS) - для CI.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quotes', type=int, default=10_000, help='Сколько цитат создать')
+        parser.add_argument('--clients', type=int, default=8, help='Параллельных клиентов')
+        parser.add_argument('--requests', type=int, default=500, help='Запросов на каждую страницу')
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints',
+            help='Замерить только указанные страницы (можно несколько раз)',
+        )
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Ошибка, если есть неудачные запросы или превышен бюджет SQL-запросов',
+        )
+
+    def scenarios(self, requests):
+        # Для add_quote нужны источники без цитат - по одному на запрос
+        fresh_sources = iter(Source.objects.bulk_create(
+            Source(name=f'Пустой источник {number}', name_key=f'пустой источник {number}', type='other') for number in range(requests)
+        ))
+
+        def add_quote(client, prepared):
+            # Тексты не должны быть похожи друг на друга, иначе их отсеет
+            # проверка на дубликаты и замер покажет отказы
+            return client.post(reverse('add_quote'), {
+                'text': f'Новая цитата для замера {uuid.uuid4().hex}',
+                'source': next(fresh_sources).pk,
+                'weight': 10,
+            })
+
+        return {
+            'random_quote': (None, lambda client, prepared: client.get(reverse('random_quote'))),
+            'random_by_type': (
+                None, lambda client, prepared: client.get(reverse('random_quote'), {'type': 'book'}),
+            ),
+            'random_batch': (
+                None, lambda client, prepared: client.get(reverse('api_random_quotes'), {'count': 10}),
+            ),
+            'like_quote': (
+                view_quote,
+                lambda client, quote_id: client.post(reverse('like_quote', args=[quote_id])),
+            ),
+            'dislike_quote': (
+                view_quote,
+                lambda client, quote_id: client.post(reverse('dislike_quote', args=[quote_id])),
+            ),
+            'popular_quotes': (None, lambda client, prepared: client.get(reverse('popular_quotes'))),
+            'dashboard': (None, lambda client, prepared: client.get(reverse('dashboard'))),
+            'add_quote': (None, add_quote),
+            'add_source': (None, lambda client, prepared: client.get(reverse('add_source'))),
+        }
+
+    def handle(self, *args, **options):
+        results = {}
+        with benchmark_database(), override_settings(ALLOWED_HOSTS=['*']):
+            seed(options['quotes'])
+            scenarios = self.scenarios(options['requests'])
+            for name in options['endpoints'] or scenarios:
+                prepare, request = scenarios[name]
+                results[name] = run_load(prepare, request, options['clients'], options['requests'])
+            counter_buffer.flush()
+
+        failures = budget_failures(results) if options['check'] else []
+        self.report(results, options['json'])
+        if failures:
+            raise CommandError('Замер не прошел проверку:\n' + '\n'.join(failures))
+
+    def report(self, results, as_json):
+        if as_json:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(
+            f"{'endpoint':<16}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+            f"{'queries':>10}{'errors':>8}"
+        )
+        for name, summary in results.items():
+            if not summary['count']:
+                self.stdout.write(f"{name:<16}{'-':>10}{'-':>10}{'-':>10}{'-':>10}{'-':>10}{summary['errors']:>8}")
+                continue
+            self.stdout.write(
+                f"{name:<16}{summary['throughput']:>10.1f}{summary['p50']:>10.2f}{summary['p95']:>10.2f}"
+                f"{summary['p99']:>10.2f}{summary['queries']:>10.1f}{summary['errors']:>8}"
+            )
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+
+from quotes.benchmark import benchmark_database, format_summary, measure, seed
+from quotes.leaderboard import popular_leaderboard
+from quotes.models import Quote
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер выборки популярных цитат: план запроса и задержка с индексом, '
+        'без индекса и из кэша топа. Работает на временной БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+            help='Размеры таблицы цитат для замеров',
+        )
+        parser.add_argument('--repeat', type=int, default=50, help='Повторов на каждый замер')
+
+    def handle(self, *args, **options):
+        for rows in options['rows']:
+            with benchmark_database() as connection:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{rows} цитат'))
+                seed(rows)
+                self._run(connection, options['repeat'])
+
+    def _run(self, connection, repeat):
+        size = popular_leaderboard.size
+        indexed = Quote.objects.select_related('source').order_by('-likes', '-views')[:size]
+        self.stdout.write('План с индексом:')
+        self.stdout.write(indexed.explain())
+        self.stdout.write('  ' + format_summary(measure(lambda: list(indexed.all()), repeat)))
+
+        if connection.vendor == 'sqlite':
+            table = connection.ops.quote_name(Quote._meta.db_table)
+            unindexed = f'SELECT id FROM {table} NOT INDEXED ORDER BY likes DESC, views DESC LIMIT {size}'
+
+            def run_unindexed():
+                with connection.cursor() as cursor:
+                    cursor.execute(unindexed)
+                    cursor.fetchall()
+
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {unindexed}')
+                plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+            self.stdout.write(f'План без индекса: {plan}')
+            self.stdout.write('  ' + format_summary(measure(run_unindexed, max(repeat // 10, 1))))
+
+        popular_leaderboard.invalidate()
+        popular_leaderboard.get()
+        self.stdout.write('Кэш топа:')
+        self.stdout.write('  ' + format_summary(measure(popular_leaderboard.get, repeat)))
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from quotes.benchmark import benchmark_database, format_summary, measure, seed
+from quotes.search import common_terms, invalidate_common_terms, search_index, search_quotes
+
+# Узкий запрос, запрос по префиксу числа, по названию источника и
+# запрос, которому соответствует каждая цитата (худший случай ранжирования)
+QUERIES = ('номер 4242', 'номер 12345', 'источник 777', 'синтетические цитаты')
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер поиска по цитатам (FTS5 и/или индекс в памяти) на таблицах '
+        'разного размера. Работает на временной БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+            help='Размеры таблицы цитат для замеров',
+        )
+        parser.add_argument(
+            '--backend', choices=['auto', 'memory'], action='append',
+            help='Какие варианты поиска замерить (по умолчанию auto)',
+        )
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов на каждый запрос')
+        parser.add_argument('--query', action='append', dest='queries', help='Свои запросы вместо стандартных')
+
+    def handle(self, *args, **options):
+        for rows in options['rows']:
+            with benchmark_database() as connection:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{rows} цитат'))
+                seed(rows)
+                invalidate_common_terms(connection)
+                started = time.perf_counter()
+                common = common_terms(connection)
+                self.stdout.write(
+                    f'Частые слова ({len(common)}) посчитаны за {time.perf_counter() - started:.2f} с'
+                )
+                for backend in options['backend'] or ['auto']:
+                    with override_settings(QUOTES_SEARCH_BACKEND=backend):
+                        self._run(backend, options['queries'] or QUERIES, options['repeat'])
+
+    def _run(self, backend, queries, repeat):
+        if backend == 'memory':
+            search_index.invalidate()
+            started = time.perf_counter()
+            search_index.search(['прогрев'], 1)
+            self.stdout.write(f'Построение индекса в памяти: {time.perf_counter() - started:.2f} с')
+        for query in queries:
+            found = len(search_quotes(query))
+            self.stdout.write(f'{backend} "{query}" ({found} в выдаче):')
+            self.stdout.write('  ' + format_summary(measure(lambda: search_quotes(query), repeat)))
+        search_index.invalidate()
@@ -0,0 +1,171 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from quotes.benchmark import benchmark_database, percentiles, seed
+
+PROFILES = ['quotes_site.settings', 'quotes_site.settings_production']
+
+# Выполняется в новом процессе интерпретатора: замеряет импорт проекта,
+# django.setup() с загрузкой WSGI-приложения и первые запросы к нему так,
+# как их вызвал бы WSGI-сервер, и печатает результат одной строкой JSON
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+from django.conf import settings
+settings.DATABASES['default']['NAME'] = sys.argv[1]
+from django.core.wsgi import get_wsgi_application
+imported = time.perf_counter()
+application = get_wsgi_application()
+ready = time.perf_counter()
+ready_at = time.time()
+
+def call(path):
+    path, _, query = path.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+        'REMOTE_ADDR': '127.0.0.1', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.input': __import__('io').BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http', 'wsgi.multithread': True, 'wsgi.multiprocess': True,
+        'wsgi.run_once': False, 'wsgi.version': (1, 0),
+    }
+    statuses = []
+    began = time.perf_counter()
+    body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    b''.join(body)
+    getattr(body, 'close', lambda: None)()
+    elapsed = (time.perf_counter() - began) * 1000
+    if not statuses[0].startswith(('2', '3')):
+        raise SystemExit(f'{path}: {statuses[0]}')
+    return elapsed
+
+requests = {}
+for path in json.loads(sys.argv[2]):
+    first = call(path)
+    requests[path] = {'first': first, 'warm': [call(path) for _ in range(int(sys.argv[3]))]}
+print(json.dumps({
+    'import': (imported - started) * 1000,
+    'setup': (ready - imported) * 1000,
+    'ready_at': ready_at,
+    'requests': requests,
+}))
+'''
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер холодного старта воркера: запуск интерпретатора, импорт проекта, '
+        'django.setup() с загрузкой WSGI-приложения и задержка первого запроса '
+        'по сравнению с прогретыми - для каждого профиля настроек. Каждый '
+        'запуск - новый процесс; работает на временной БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quotes', type=int, default=10_000, help='Сколько цитат создать')
+        parser.add_argument('--runs', type=int, default=10, help='Запусков процесса на профиль')
+        parser.add_argument('--warm', type=int, default=20, help='Прогретых запросов после первого')
+        parser.add_argument(
+            '--profile', action='append', dest='profiles',
+            help=f'Модуль настроек (можно несколько раз, по умолчанию {" и ".join(PROFILES)})',
+        )
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Страница для запросов (можно несколько раз, по умолчанию / и /popular/)',
+        )
+        parser.add_argument(
+            '--imports', type=int, default=0,
+            help='Показать столько самых долгих по собственному времени пакетов (python -X importtime)',
+        )
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def child_env(self, profile):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=profile)
+        env.setdefault('DJANGO_SECRET_KEY', 'bench-startup-not-a-secret')
+        env.setdefault('DJANGO_ALLOWED_HOSTS', 'localhost')
+        # Реплика и ее маршрутизация в замер старта не входят
+        env.pop('QUOTES_REPLICA_DB', None)
+        return env
+
+    def spawn(self, profile, database, paths, warm, importtime=False):
+        command = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-c', CHILD,
+                   str(database), json.dumps(paths), str(warm)]
+        started = time.time()
+        result = subprocess.run(
+            command, cwd=settings.BASE_DIR, env=self.child_env(profile), capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f'{profile}: процесс завершился с ошибкой\n{result.stderr[-2000:]}')
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        # От запуска процесса до готового приложения, вместе со стартом интерпретатора
+        report['ready'] = (report['ready_at'] - started) * 1000
+        return report, result.stderr
+
+    def import_packages(self, stderr, limit):
+        """Собственное время импорта (мс) по пакетам верхнего уровня"""
+        totals = {}
+        for line in stderr.splitlines():
+            match = IMPORTTIME_RE.match(line)
+            if match:
+                package = match.group(4).split('.')[0]
+                totals[package] = totals.get(package, 0) + int(match.group(1)) / 1000
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def handle(self, *args, **options):
+        profiles = options['profiles'] or PROFILES
+        paths = options['paths'] or ['/', '/popular/']
+        results = []
+        imports = {}
+        with benchmark_database() as connection:
+            seed(options['quotes'])
+            database = connection.settings_dict['NAME']
+            # Чужие процессы читают файл БД - свое соединение закрываем
+            connection.close()
+            for profile in profiles:
+                runs = [self.spawn(profile, database, paths, options['warm'])[0] for _ in range(options['runs'])]
+                row = {
+                    'profile': profile,
+                    'ready': percentiles([report['ready'] for report in runs]),
+                    'import': percentiles([report['import'] for report in runs]),
+                    'setup': percentiles([report['setup'] for report in runs]),
+                    'requests': {},
+                }
+                for path in paths:
+                    warm = [sample for report in runs for sample in report['requests'][path]['warm']]
+                    row['requests'][path] = {
+                        'first': percentiles([report['requests'][path]['first'] for report in runs]),
+                        'warm': percentiles(warm) if warm else None,
+                    }
+                results.append(row)
+                if options['imports']:
+                    _, stderr = self.spawn(profile, database, paths[:1], 0, importtime=True)
+                    imports[profile] = self.import_packages(stderr, options['imports'])
+
+        if options['json']:
+            self.stdout.write(json.dumps({'results': results, 'imports': imports}, indent=2))
+            return
+
+        self.stdout.write('Медианы по запускам, мс')
+        self.stdout.write(
+            f"{'profile':<34}{'ready':>9}{'import':>9}{'setup':>9}{'path':>12}{'first':>9}{'warm':>9}"
+        )
+        for row in results:
+            for number, (path, timings) in enumerate(row['requests'].items()):
+                prefix = (
+                    f"{row['profile']:<34}{row['ready']['p50']:>9.1f}{row['import']['p50']:>9.1f}"
+                    f"{row['setup']['p50']:>9.1f}" if not number else f"{'':<34}{'':>9}{'':>9}{'':>9}"
+                )
+                warm = f"{timings['warm']['p50']:>9.2f}" if timings['warm'] else f"{'-':>9}"
+                self.stdout.write(f"{prefix}{path[:11]:>12}{timings['first']['p50']:>9.1f}{warm}")
+        for profile, packages in imports.items():
+            self.stdout.write(f'\nИмпорт {profile}, собственное время по пакетам, мс')
+            for package, elapsed in packages:
+                self.stdout.write(f'  {package:<30}{elapsed:>9.1f}')
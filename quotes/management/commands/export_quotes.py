@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from quotes.exporter import export_chunks
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка всех цитат с источником и статистикой в CSV или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Файл для выгрузки или "-" для stdout')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Сжимать выгрузку gzip на лету')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Строк на одно чтение из БД')
+
+    def handle(self, *args, **options):
+        chunks = export_chunks(options['format'], options['gzip'], options['chunk_size'])
+        if options['path'] == '-':
+            output = sys.stdout.buffer
+            for chunk in chunks:
+                output.write(chunk)
+            output.flush()
+            return
+
+        written = 0
+        with open(options['path'], 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Записано {written} байт в {options['path']}"))
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from quotes.counters import counter_buffer, drain_spool, request_flush
+
+
+class Command(BaseCommand):
+    help = (
+        'Просит работающие процессы сбросить в БД накопленные счетчики '
+        'просмотров и голосов, ждет их и применяет счетчики, отложенные в spool'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--wait', type=float, default=None,
+            help='Сколько секунд ждать сброса в процессах (по умолчанию два QUOTES_COUNTER_FLUSH_POLL)',
+        )
+
+    def handle(self, *args, **options):
+        wait = options['wait']
+        if wait is None:
+            wait = 2 * (getattr(settings, 'QUOTES_COUNTER_FLUSH_POLL', 1) or 0)
+        if request_flush():
+            time.sleep(wait)
+        else:
+            self.stderr.write('QUOTES_COUNTER_SPOOL_DIR не задан: буферы других процессов не сброшены')
+        files = drain_spool()
+        quotes = counter_buffer.flush()
+        self.stdout.write(self.style.SUCCESS(
+            f'Применено файлов из spool: {files}, цитат из буфера этого процесса: {quotes}'
+        ))
@@ -0,0 +1,54 @@
+import csv
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quotes.importer import QuoteImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Массовый импорт цитат из CSV (колонки text, source, type, weight) или '
+        'JSONL с теми же ключами. Отклоненные строки можно сохранить в файл.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл для импорта или "-" для stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='По умолчанию - по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Строк в одной транзакции')
+        parser.add_argument('--rejects', help='Куда записать отклоненные строки (JSONL)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        rejects_file = open(options['rejects'], 'w', encoding='utf-8') if options['rejects'] else None
+
+        def on_reject(line, row, reason):
+            if rejects_file:
+                rejects_file.write(json.dumps({'line': line, 'reason': reason, 'row': row}, ensure_ascii=False) + '\n')
+
+        started = time.monotonic()
+        try:
+            stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        except OSError as exc:
+            raise CommandError(f'Не удалось открыть {path}: {exc}')
+        try:
+            importer = QuoteImporter(batch_size=options['batch_size'], on_reject=on_reject)
+            importer.run(read_rows(stream, fmt))
+        except (csv.Error, json.JSONDecodeError) as exc:
+            raise CommandError(f'Ошибка разбора файла: {exc}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if rejects_file:
+                rejects_file.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено цитат: {importer.created}, новых источников: {importer.sources_created} '
+            f'за {elapsed:.1f} с'
+        ))
+        for reason, count in importer.rejected.most_common():
+            self.stdout.write(self.style.WARNING(f'Отклонено ({reason}): {count}'))
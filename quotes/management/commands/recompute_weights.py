@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from quotes.models import Quote
+from quotes.sampler import quote_sampler
+from quotes.weighting import current_policy
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает сохраненные эффективные веса цитат по политике из '
+        'QUOTES_WEIGHT_POLICY (запускать после смены политики или ее параметров)'
+    )
+
+    def handle(self, *args, **options):
+        policy = current_policy()
+        updated = Quote.objects.refresh_effective_weights()
+        quote_sampler.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Политика {type(policy).__name__}: пересчитано цитат: {updated}'
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from quotes.activity import rollup
+from quotes.counters import counter_buffer
+
+
+class Command(BaseCommand):
+    help = (
+        'Сворачивает часовую историю просмотров и голосов в суточную и удаляет '
+        'устаревшую (запускать по расписанию, например раз в час)'
+    )
+
+    def handle(self, *args, **options):
+        counter_buffer.flush()
+        rolled, expired = rollup()
+        self.stdout.write(self.style.SUCCESS(
+            f'Свернуто часовых записей: {rolled}, удалено суточных: {expired}'
+        ))
@@ -0,0 +1,51 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from quotes.routers import replica_alias
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную SQLite-БД в файл реплики (QUOTES_REPLICA_DB) '
+        'онлайн-бэкапом: согласованный снимок без остановки записи. Для '
+        'локальной проверки чтения с реплики; в PostgreSQL - штатная репликация'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help='Повторять копирование каждые N секунд, пока команду не остановят',
+        )
+
+    def handle(self, *args, **options):
+        replica = replica_alias()
+        if replica is None:
+            raise CommandError('Реплика не настроена: задайте QUOTES_REPLICA_DB')
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        target = connections[replica].settings_dict
+        if primary['ENGINE'] != target['ENGINE'] or connections[replica].vendor != 'sqlite':
+            raise CommandError('Команда копирует только SQLite-файлы')
+
+        while True:
+            started = time.monotonic()
+            self.copy(primary['NAME'], target['NAME'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Реплика {target["NAME"]} обновлена за {(time.monotonic() - started) * 1000:.0f} мс'
+            ))
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
+
+    def copy(self, source_name, target_name):
+        source = sqlite3.connect(source_name)
+        target = sqlite3.connect(target_name, timeout=20)
+        try:
+            # Страницы пишутся в открытую реплику под ее блокировкой записи,
+            # читатели видят либо старый, либо новый снимок целиком
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
@@ -0,0 +1,152 @@
+"""Метрики запросов: задержка, время в БД и шаблонах, число SQL-запросов"""
+import threading
+import time
+from contextvars import ContextVar
+
+# Границы корзин гистограмм (мс для времени, штуки для запросов)
+TIME_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, float('inf'))
+
+_current = ContextVar('quotes_request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+    def quantile(self, share):
+        """Оценка квантиля: верхняя граница корзины, куда он попал"""
+        if not self.total:
+            return None
+        threshold = share * self.total
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= threshold:
+                return bound
+        return self.buckets[-1]
+
+    def as_dict(self):
+        return {
+            'count': self.total,
+            'sum': self.sum,
+            'mean': self.sum / self.total if self.total else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': {
+                ('+Inf' if bound == float('inf') else str(bound)): count
+                for bound, count in zip(self.buckets, self.counts)
+            },
+        }
+
+
+class RequestCollector:
+    """Счетчики одного запроса; заполняются обертками БД и шаблонов"""
+
+    def __init__(self, keep_queries=False):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.keep_queries = keep_queries
+        self.query_log = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if self.keep_queries:
+                self.query_log.append((round(elapsed * 1000, 3), sql))
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class MetricsRegistry:
+    """Гистограммы по представлениям в памяти процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view_name, collector):
+        with self._lock:
+            histograms = self._views.get(view_name)
+            if histograms is None:
+                histograms = self._views[view_name] = {
+                    'latency_ms': Histogram(TIME_BUCKETS),
+                    'db_ms': Histogram(TIME_BUCKETS),
+                    'template_ms': Histogram(TIME_BUCKETS),
+                    'queries': Histogram(QUERY_BUCKETS),
+                }
+            histograms['latency_ms'].observe(collector.elapsed * 1000)
+            histograms['db_ms'].observe(collector.db_time * 1000)
+            histograms['template_ms'].observe(collector.template_time * 1000)
+            histograms['queries'].observe(collector.queries)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                view_name: {name: histogram.as_dict() for name, histogram in histograms.items()}
+                for view_name, histograms in sorted(self._views.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Постоянная обертка соединений: отдает запрос активному сборщику
+
+    Сборщик берется из contextvar, поэтому запросы считаются и в потоках
+    sync_to_async асинхронных представлений, где свои соединения.
+    """
+    collector = _current.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    return collector(execute, sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    """Обработчик connection_created: вешает обертку на соединение один раз"""
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+def current_collector():
+    return _current.get()
+
+
+def activate(collector):
+    return _current.set(collector)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def add_template_time(seconds):
+    collector = _current.get()
+    if collector is not None:
+        collector.template_time += seconds
+
+
+request_metrics = MetricsRegistry()
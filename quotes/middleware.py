@@ -0,0 +1,126 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import routers
+from .metrics import RequestCollector, activate, deactivate, request_metrics
+
+slow_logger = logging.getLogger('quotes.slow_requests')
+# Cookie клиента, который недавно писал (см. ReplicaRoutingMiddleware)
+STICKY_COOKIE = 'quotes_primary'
+
+
+class InstrumentationMiddleware:
+    """Собирает по каждому представлению задержку, время в БД и шаблонах
+
+    Гистограммы доступны на странице метрик (views.metrics). Запросы
+    дольше QUOTES_SLOW_REQUEST_MS пишутся в лог quotes.slow_requests, а с
+    QUOTES_SLOW_REQUEST_SQL - вместе со списком SQL-запросов (тогда текст
+    SQL копится на каждый запрос, не только на медленный). Работает и под WSGI, и под ASGI: синхронный
+    middleware в асинхронной цепочке загнал бы async-представления в поток.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        collector, token = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            deactivate(token)
+        self._finish(request, collector)
+        return response
+
+    async def __acall__(self, request):
+        collector, token = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            deactivate(token)
+        self._finish(request, collector)
+        return response
+
+    def _start(self):
+        # SQL считает обертка metrics.execute_wrapper на каждом соединении
+        keep_queries = (
+            getattr(settings, 'QUOTES_SLOW_REQUEST_MS', None) is not None
+            and getattr(settings, 'QUOTES_SLOW_REQUEST_SQL', False)
+        )
+        collector = RequestCollector(keep_queries=keep_queries)
+        return collector, activate(collector)
+
+    def _finish(self, request, collector):
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        request_metrics.record(view_name, collector)
+
+        slow_ms = getattr(settings, 'QUOTES_SLOW_REQUEST_MS', None)
+        elapsed_ms = collector.elapsed * 1000
+        if slow_ms is not None and elapsed_ms >= slow_ms:
+            slow_logger.warning(
+                'Медленный запрос %s %s (%s): %.1f мс, SQL: %d за %.1f мс, шаблоны: %.1f мс%s',
+                request.method, request.path, view_name, elapsed_ms,
+                collector.queries, collector.db_time * 1000, collector.template_time * 1000,
+                ''.join(f'\n  {ms} мс: {sql}' for ms, sql in collector.query_log),
+            )
+
+
+class ReplicaRoutingMiddleware:
+    """Держит чтение клиента на основной БД сразу после его записи
+
+    POST, который что-то записал, ставит cookie на
+    QUOTES_REPLICA_STICKY_SECONDS секунд (запаздывание реплики); пока она
+    жива, PrimaryReplicaRouter читает для клиента из основной БД.
+    Без настроенной реплики ничего не делает.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if routers.replica_alias() is None:
+            return self.get_response(request)
+        token = routers.activate(sticky=STICKY_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            state = routers.current_state()
+            routers.deactivate(token)
+        return self._finish(request, response, state)
+
+    async def __acall__(self, request):
+        if routers.replica_alias() is None:
+            return await self.get_response(request)
+        token = routers.activate(sticky=STICKY_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = routers.current_state()
+            routers.deactivate(token)
+        return self._finish(request, response, state)
+
+    def _finish(self, request, response, state):
+        if state.wrote and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            # Записи в GET (сброс буфера счетчиков) клиенту не видны
+            response.set_cookie(
+                STICKY_COOKIE, '1',
+                max_age=getattr(settings, 'QUOTES_REPLICA_STICKY_SECONDS', 10),
+                httponly=True, samesite='Lax',
+            )
+        return response
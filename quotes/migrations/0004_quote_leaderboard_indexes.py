@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0003_alter_quote_source'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quote',
+            index=models.Index(fields=['-likes', '-views'], name='quote_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quote',
+            index=models.Index(fields=['-views'], name='quote_most_viewed_idx'),
+        ),
+    ]
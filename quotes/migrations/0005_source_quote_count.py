@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:16
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_quote_count(apps, schema_editor):
+    """Заполняет quote_count одним UPDATE с подзапросом"""
+    Quote = apps.get_model('quotes', 'Quote')
+    Source = apps.get_model('quotes', 'Source')
+    counts = (
+        Quote.objects.filter(source=OuterRef('pk')).order_by()
+        .values('source').annotate(total=Count('pk')).values('total')
+    )
+    Source.objects.using(schema_editor.connection.alias).update(
+        quote_count=Coalesce(Subquery(counts), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0004_quote_leaderboard_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='source',
+            name='quote_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Цитат'),
+        ),
+        migrations.RunPython(backfill_quote_count, migrations.RunPython.noop),
+    ]
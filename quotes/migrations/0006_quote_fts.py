@@ -0,0 +1,77 @@
+from django.db import OperationalError, migrations
+
+# Снимок схемы FTS на момент миграции: миграция не должна зависеть от
+# того, как quotes/search.py устроен сейчас
+FTS_TABLE = 'quotes_quote_fts'
+FTS_VOCAB_TABLE = 'quotes_quote_fts_vocab'
+
+FTS_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON quotes_quote BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text, source_name)
+        SELECT new.id, new.text, name FROM quotes_source WHERE id = new.source_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF text, source_id ON quotes_quote BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, text, source_name)
+        SELECT new.id, new.text, name FROM quotes_source WHERE id = new.source_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON quotes_quote BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_source_rename AFTER UPDATE OF name ON quotes_source BEGIN
+        UPDATE {FTS_TABLE} SET source_name = new.name
+        WHERE rowid IN (SELECT id FROM quotes_quote WHERE source_id = new.id);
+    END
+    """,
+)
+
+
+def create_index(apps, schema_editor):
+    # Без FTS5 (не SQLite или сборка без расширения) поиск работает
+    # по инвертированному индексу в памяти
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+                f'USING fts5(text, source_name, tokenize="unicode61 remove_diacritics 2")'
+            )
+        except OperationalError:
+            return
+        cursor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_VOCAB_TABLE} USING fts5vocab({FTS_TABLE}, row)')
+        for statement in FTS_TRIGGERS:
+            cursor.execute(statement)
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE}(rowid, text, source_name) '
+            f'SELECT q.id, q.text, s.name FROM quotes_quote q JOIN quotes_source s ON s.id = q.source_id'
+        )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for suffix in ('insert', 'update', 'delete', 'source_rename'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_VOCAB_TABLE}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0005_source_quote_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
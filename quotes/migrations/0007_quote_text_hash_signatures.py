@@ -0,0 +1,102 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:33
+
+import hashlib
+import random
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# Снимок quotes/dedup.py на момент миграции: хэши и подписи, посчитанные
+# здесь, не должны зависеть от того, как модуль устроен сейчас
+WORD_RE = re.compile(r'\w+')
+SHINGLE_SIZE = 4
+BANDS = 6
+ROWS_PER_BAND = 3
+_rng = random.Random(20240917)
+MASKS = [_rng.getrandbits(64) for _ in range(BANDS * ROWS_PER_BAND)]
+
+
+def normalize_text(text):
+    return ' '.join(WORD_RE.findall(text.lower().replace('ё', 'е')))
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data.encode(), digest_size=8).digest(), 'big')
+
+
+def text_hash(text):
+    return hashlib.blake2b(normalize_text(text).encode(), digest_size=16).hexdigest()
+
+
+def band_keys(text):
+    normalized = normalize_text(text)
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    hashes = [_hash64(shingle) for shingle in shingles]
+    signature = [min(map(mask.__xor__, hashes)) for mask in MASKS]
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        key = _hash64(f'{band}:' + ','.join(map(str, rows)))
+        keys.append(key - (1 << 64) if key >= 1 << 63 else key)
+    return keys
+
+
+def backfill_signatures(apps, schema_editor):
+    """Считает хэши и MinHash-подписи существующих цитат пачками"""
+    Quote = apps.get_model('quotes', 'Quote')
+    QuoteSignature = apps.get_model('quotes', 'QuoteSignature')
+    using = schema_editor.connection.alias
+    quotes = Quote.objects.using(using).only('id', 'text').order_by('id')
+    last_id = 0
+    while True:
+        batch = list(quotes.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        signatures = []
+        for quote in batch:
+            quote.text_hash = text_hash(quote.text)
+            signatures.extend(QuoteSignature(quote_id=quote.id, key=key) for key in band_keys(quote.text))
+        Quote.objects.using(using).bulk_update(batch, ['text_hash'], batch_size=BATCH_SIZE)
+        QuoteSignature.objects.using(using).bulk_create(signatures, batch_size=BATCH_SIZE)
+        last_id = batch[-1].id
+
+
+def drop_triggers(apps, schema_editor):
+    # Таблица цитат пересоздается; триггеры FTS вернет post_migrate
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for suffix in ('insert', 'update', 'delete', 'source_rename'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS quotes_quote_fts_{suffix}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0006_quote_fts'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_triggers, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='quote',
+            name='text_hash',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=32, verbose_name='Хэш текста'),
+        ),
+        migrations.CreateModel(
+            name='QuoteSignature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(db_index=True)),
+                ('quote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='signatures', to='quotes.quote')),
+            ],
+        ),
+        migrations.RunPython(backfill_signatures, migrations.RunPython.noop),
+        migrations.RunPython(migrations.RunPython.noop, drop_triggers),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:41
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill_name_key(apps, schema_editor):
+    """Заполняет name_key пачками (LOWER в SQLite не знает кириллицу)"""
+    Source = apps.get_model('quotes', 'Source')
+    sources = Source.objects.using(schema_editor.connection.alias).only('id', 'name').order_by('id')
+    last_id = 0
+    while True:
+        batch = list(sources.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        for source in batch:
+            source.name_key = source.name.strip().lower().replace('ё', 'е')
+        Source.objects.using(schema_editor.connection.alias).bulk_update(batch, ['name_key'], batch_size=BATCH_SIZE)
+        last_id = batch[-1].id
+
+
+def drop_triggers(apps, schema_editor):
+    # Таблица источников пересоздается; триггеры FTS вернет post_migrate
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for suffix in ('insert', 'update', 'delete', 'source_rename'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS quotes_quote_fts_{suffix}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0007_quote_text_hash_signatures'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_triggers, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='source',
+            name='name_key',
+            field=models.CharField(default='', editable=False, max_length=200, verbose_name='Ключ названия'),
+        ),
+        migrations.RunPython(backfill_name_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='source',
+            index=models.Index(fields=['name_key', 'type'], name='source_name_prefix_idx'),
+        ),
+        migrations.RunPython(migrations.RunPython.noop, drop_triggers),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0008_source_name_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuoteActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Час'), ('day', 'Сутки')], max_length=4, verbose_name='Период')),
+                ('bucket', models.DateTimeField(verbose_name='Начало периода')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Просмотры')),
+                ('likes', models.PositiveIntegerField(default=0, verbose_name='Лайки')),
+                ('dislikes', models.PositiveIntegerField(default=0, verbose_name='Дизлайки')),
+                ('quote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='quotes.quote')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'bucket'], name='quote_activity_period_idx')],
+                'constraints': [models.UniqueConstraint(fields=('quote', 'period', 'bucket'), name='quote_activity_bucket_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:10
+
+from django.db import migrations, models
+from django.db.models.functions import Cast, Power
+
+
+def backfill_effective_weight(apps, schema_editor):
+    """Считает эффективный вес существующих цитат одним UPDATE
+
+    Формула зафиксирована - политика по умолчанию (power, weight^1.5), а не
+    та, что задана в настройках сейчас. Для другой политики веса после
+    миграции пересчитывает команда recompute_weights.
+    """
+    Quote = apps.get_model('quotes', 'Quote')
+    Quote.objects.using(schema_editor.connection.alias).update(
+        effective_weight=Power(Cast('weight', models.FloatField()), models.Value(1.5)),
+    )
+
+
+def drop_triggers(apps, schema_editor):
+    # Таблица цитат пересоздается; триггеры FTS вернет post_migrate
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for suffix in ('insert', 'update', 'delete', 'source_rename'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS quotes_quote_fts_{suffix}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0009_quote_activity'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_triggers, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='quote',
+            name='effective_weight',
+            field=models.FloatField(db_index=True, default=0, editable=False, verbose_name='Эффективный вес'),
+        ),
+        migrations.RunPython(backfill_effective_weight, migrations.RunPython.noop),
+        migrations.RunPython(migrations.RunPython.noop, drop_triggers),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0010_quote_effective_weight'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quote',
+            index=models.Index(fields=['weight'], name='quote_weight_idx'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+from django.db import migrations
+
+# Снимок схемы FTS на момент миграции (см. 0006_quote_fts): миграция не
+# должна зависеть от того, как quotes/search.py устроен сейчас
+FTS_TABLE = 'quotes_quote_fts'
+
+
+def fold(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def triggers(text, name):
+    return (
+        f"""
+        CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON quotes_quote BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, text, source_name)
+            SELECT new.id, {text('new.text')}, {name('name')} FROM quotes_source WHERE id = new.source_id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF text, source_id ON quotes_quote BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            INSERT INTO {FTS_TABLE}(rowid, text, source_name)
+            SELECT new.id, {text('new.text')}, {name('name')} FROM quotes_source WHERE id = new.source_id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON quotes_quote BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER {FTS_TABLE}_source_rename AFTER UPDATE OF name ON quotes_source BEGIN
+            UPDATE {FTS_TABLE} SET source_name = {name('new.name')}
+            WHERE rowid IN (SELECT id FROM quotes_quote WHERE source_id = new.id);
+        END
+        """,
+    )
+
+
+def rebuild(schema_editor, convert):
+    """Пересоздает триггеры и содержимое FTS с преобразованием convert текста"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        if cursor.fetchone() is None:
+            # Без FTS5 поиск работает по индексу в памяти
+            return
+        for suffix in ('insert', 'update', 'delete', 'source_rename'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+        for statement in triggers(convert, convert):
+            cursor.execute(statement)
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, text, source_name) SELECT q.id, {convert('q.text')}, "
+            f"{convert('s.name')} FROM quotes_quote q JOIN quotes_source s ON s.id = q.source_id"
+        )
+
+
+def fold_yo(apps, schema_editor):
+    # unicode61 не приравнивает ё к е, а запрос ё заменяет - индексируем без ё
+    rebuild(schema_editor, fold)
+
+
+def keep_yo(apps, schema_editor):
+    rebuild(schema_editor, lambda column: column)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0011_quote_weight_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(fold_yo, keep_yo),
+    ]
@@ -1,7 +1,170 @@
-from django.db import models
+import sqlite3
+
+from django.db import connections, models, router, transaction
+from django.db.models import Case, F, FloatField, IntegerField, Value, When
+from django.db.models.functions import Abs, Cast, Floor, Greatest, Least
+from django.db.models.lookups import GreaterThan
+from django.db.models.sql import UpdateQuery
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
+from .db import retry_on_busy
+from .dedup import band_keys, duplicate_message, find_duplicate, text_hash
+from .search import normalize
+from .weighting import effective_weight, effective_weight_expression
+
+
+# Параметры формулы веса (см. views.update_quote_weight)
+BASE_WEIGHT = 10
+MAX_WEIGHT_GROWTH = 1.8
+
+# Больше стольких цитат у одного источника быть не может
+MAX_QUOTES_PER_SOURCE = 3
+QUOTE_LIMIT_MESSAGE = 'У одного источника не может быть больше 3 цитат'
+
+
+def vote_weight_expression(likes=None, dislikes=None, weight=None):
+    """Формула пересчета веса после голосования в виде SQL-выражения
+
+    Вес = max(1, 10 + рейтинг + процент лайков / 10), но не больше чем
+    текущий вес * 1.8; изменения меньше 0.1 игнорируются. В одном UPDATE
+    все выражения видят старые значения строки, поэтому новые лайки и
+    дизлайки можно передать явно (например, F('likes') + 1).
+    """
+    likes = F('likes') if likes is None else likes
+    dislikes = F('dislikes') if dislikes is None else dislikes
+    weight = F('weight') if weight is None else weight
+
+    total_votes = likes + dislikes
+    like_percentage = Cast(likes, FloatField()) * Value(100.0) / total_votes
+    raw_new_weight = Greatest(
+        Value(1.0),
+        Value(float(BASE_WEIGHT)) + likes - dislikes + like_percentage / Value(10.0),
+    )
+    max_allowed_weight = Cast(weight, FloatField()) * Value(MAX_WEIGHT_GROWTH)
+    new_weight = Case(
+        When(GreaterThan(total_votes, 0), then=Least(raw_new_weight, max_allowed_weight)),
+        default=Value(float(BASE_WEIGHT)),
+        output_field=FloatField(),
+    )
+    return Case(
+        When(GreaterThan(Abs(new_weight - weight), 0.1), then=Cast(Floor(new_weight), IntegerField())),
+        default=weight,
+        output_field=IntegerField(),
+    )
+
+
+def supports_update_returning(connection):
+    """Поддерживает ли БД UPDATE ... RETURNING"""
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 35)
+
+
+class QuoteQuerySet(models.QuerySet):
+    def recompute_vote_weights(self):
+        """Пересчитывает вес по формуле голосования и эффективный вес одним UPDATE"""
+        weight = vote_weight_expression()
+        return self.update(
+            weight=weight,
+            effective_weight=effective_weight_expression(weight=weight),
+            updated_at=timezone.now(),
+        )
+
+    def refresh_effective_weights(self):
+        """Пересчитывает эффективный вес по текущей политике (weighting.py)"""
+        return self.update(effective_weight=effective_weight_expression())
+
+    def apply_vote(self, quote_id, vote_type):
+        """Засчитывает голос и пересчитывает веса одним атомарным запросом
+
+        Возвращает (likes, dislikes, weight, effective_weight) после
+        голосования или None, если цитаты нет. При занятой БД запрос
+        повторяется (db.retry_on_busy).
+        """
+        # Сырой UPDATE сам не выбирает БД для записи, в отличие от update()
+        using = self._db or router.db_for_write(self.model)
+        return retry_on_busy(self.using(using)._apply_vote, using=using)(quote_id, vote_type)
+
+    def _apply_vote(self, quote_id, vote_type):
+        likes = F('likes') + 1 if vote_type == 'like' else F('likes')
+        dislikes = F('dislikes') + 1 if vote_type == 'dislike' else F('dislikes')
+        weight = vote_weight_expression(likes, dislikes)
+        values = {
+            'likes': likes,
+            'dislikes': dislikes,
+            'weight': weight,
+            'effective_weight': effective_weight_expression(likes=likes, dislikes=dislikes, weight=weight),
+            # update() не трогает auto_now, а по updated_at считается ETag API
+            'updated_at': timezone.now(),
+        }
+        queryset = self.filter(id=quote_id)
+        connection = connections[self.db]
+        returned = ('likes', 'dislikes', 'weight', 'effective_weight')
+
+        if not supports_update_returning(connection):
+            with transaction.atomic(using=self.db):
+                if not queryset.update(**values):
+                    return None
+                return queryset.values_list(*returned).get()
+
+        query = queryset.query.chain(UpdateQuery)
+        query.add_update_values(values)
+        sql, params = query.get_compiler(self.db).as_sql()
+        returning = ', '.join(connection.ops.quote_name(field) for field in returned)
+        with transaction.mark_for_rollback_on_error(using=self.db):
+            with connection.cursor() as cursor:
+                cursor.execute(f'{sql} RETURNING {returning}', params)
+                return cursor.fetchone()
+
+
+def source_name_key(name):
+    """Название источника для поиска по префиксу без учета регистра и ё"""
+    return normalize(name.strip())
+
+
+class SourceQuerySet(models.QuerySet):
+    def lookup(self, prefix, source_type=None):
+        """Источники, название которых начинается с prefix, по индексу (name_key, type)
+
+        Префикс ищется диапазоном по нормализованному ключу, а не LIKE:
+        в SQLite LIKE не учитывает регистр только для латиницы и не
+        пользуется обычным индексом.
+        """
+        key = source_name_key(prefix)
+        sources = self.filter(name_key__gte=key)
+        if key:
+            sources = sources.filter(name_key__lt=key + '\U0010ffff')
+        if source_type:
+            sources = sources.filter(type=source_type)
+        return sources.order_by('name_key', 'type')
+
+    def reserve_quote_slot(self, source_id):
+        """Увеличивает quote_count, только если лимит еще не достигнут
+
+        Проверка и увеличение - один условный UPDATE, поэтому параллельные
+        добавления не превысят лимит. Возвращает True, если место нашлось.
+        """
+        return self.reserve_quote_slots(source_id, 1) == 1
+
+    def reserve_quote_slots(self, source_id, count):
+        """Занимает до count мест под цитаты источника, возвращает число занятых
+
+        Тот же условный UPDATE, что у reserve_quote_slot; если count мест
+        уже нет, пробует меньше (не больше MAX_QUOTES_PER_SOURCE попыток).
+        """
+        for reserved in range(min(count, MAX_QUOTES_PER_SOURCE), 0, -1):
+            if self.filter(id=source_id, quote_count__lte=MAX_QUOTES_PER_SOURCE - reserved).update(
+                quote_count=F('quote_count') + reserved,
+            ):
+                return reserved
+        return 0
+
+    def release_quote_slot(self, source_id):
+        """Уменьшает quote_count после удаления цитаты"""
+        return self.filter(id=source_id).update(quote_count=Greatest(F('quote_count') - 1, 0))
+
+
 class Source(models.Model):
     TYPE_CHOICES = [
         ('movie', 'Фильм'),
@@ -15,9 +178,18 @@ class Source(models.Model):
     name = models.CharField(max_length=200, verbose_name="Название")
     type = models.CharField(max_length=20, choices=TYPE_CHOICES, verbose_name="Тип")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Число цитат источника; поддерживается Quote.save и сигналом удаления
+    quote_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Цитат")
+    # Нормализованное название для подсказок в форме (см. SourceQuerySet.lookup)
+    name_key = models.CharField(max_length=200, default='', editable=False, verbose_name="Ключ названия")
+    
+    objects = SourceQuerySet.as_manager()
     
     class Meta:
         unique_together = ['name', 'type']
+        indexes = [
+            models.Index(fields=['name_key', 'type'], name='source_name_prefix_idx'),
+        ]
     
     def __str__(self):
         return f"{self.get_type_display()}: {self.name}"
@@ -29,8 +201,16 @@ class Source(models.Model):
         
         # Проверяем, что у источника не больше 3 цитат
         if self.pk:  # только для существующих объектов
-            if self.quote_set.count() >= 3:
-                raise ValidationError('У одного источника не может быть больше 3 цитат')
+            if self.quote_count >= MAX_QUOTES_PER_SOURCE:
+                raise ValidationError(QUOTE_LIMIT_MESSAGE)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'name' in update_fields:
+            self.name_key = source_name_key(self.name)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'name_key'}
+        super().save(*args, **kwargs)
 
 class Quote(models.Model):
     text = models.TextField(verbose_name="Текст цитаты")
@@ -41,19 +221,118 @@ class Quote(models.Model):
     dislikes = models.PositiveIntegerField(default=0, verbose_name="Дизлайки")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Хэш нормализованного текста для поиска дубликатов (см. dedup.py)
+    text_hash = models.CharField(max_length=32, default='', editable=False, db_index=True, verbose_name="Хэш текста")
+    # Вес для случайного выбора по политике из настроек (см. weighting.py)
+    effective_weight = models.FloatField(default=0, editable=False, db_index=True, verbose_name="Эффективный вес")
+    
+    objects = QuoteQuerySet.as_manager()
     
     class Meta:
         unique_together = ['text', 'source']
+        indexes = [
+            # Сортировки для популярных цитат и дашборда
+            models.Index(fields=['-likes', '-views'], name='quote_popular_idx'),
+            models.Index(fields=['-views'], name='quote_most_viewed_idx'),
+            # Фильтр по весу в админке
+            models.Index(fields=['weight'], name='quote_weight_idx'),
+        ]
     
     def __str__(self):
         return f"{self.text[:50]}... ({self.source})"
     
     def clean(self):
-        # Проверяем уникальность цитаты для источника
-        if Quote.objects.filter(text=self.text, source=self.source).exclude(pk=self.pk).exists():
-            raise ValidationError('Цитата с таким текстом уже существует для этого источника')
+        # Проверяем, нет ли такой же или почти такой же цитаты у любого источника
+        duplicate, exact = find_duplicate(self.text, exclude_id=self.pk)
+        if duplicate is not None:
+            raise ValidationError(duplicate_message(duplicate, exact))
         
         # Проверяем ограничение на количество цитат у источника
         if not self.pk:  # только для новых объектов
-            if self.source.quote_set.count() >= 3:
-                raise ValidationError('У одного источника не может быть больше 3 цитат')
\ No newline at end of file
+            if self.source.quote_count >= MAX_QUOTES_PER_SOURCE:
+                raise ValidationError(QUOTE_LIMIT_MESSAGE)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем источник, чтобы при переносе цитаты поправить оба счетчика,
+        # и хэш текста, чтобы не пересчитывать подпись без изменения текста
+        instance._loaded_source_id = instance.__dict__.get('source_id')
+        instance._loaded_text_hash = instance.__dict__.get('text_hash')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Сохраняет цитату, занимая место в лимите источника
+
+        Лимит проверяется условным UPDATE счетчика источника в той же
+        транзакции (SourceQuerySet.reserve_quote_slot), без COUNT по цитатам.
+        При изменении текста обновляются его хэш и MinHash-подпись,
+        эффективный вес пересчитывается при каждом сохранении.
+        """
+        loaded_source_id = getattr(self, '_loaded_source_id', None)
+        adding = self._state.adding
+        moved = not adding and loaded_source_id is not None and loaded_source_id != self.source_id
+        self.effective_weight = effective_weight(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields = {*update_fields, 'effective_weight'}
+        if update_fields is None or 'text' in update_fields:
+            self.text_hash = text_hash(self.text)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'text_hash'}
+        text_changed = adding or self.text_hash != getattr(self, '_loaded_text_hash', None)
+        if not (adding or moved or text_changed):
+            return super().save(*args, **kwargs)
+
+        using = kwargs.get('using') or router.db_for_write(Quote, instance=self)
+        sources = Source.objects.db_manager(using)
+        # Без точки сохранения: ошибка SQL откатывает всю внешнюю транзакцию,
+        # а отказ по лимиту ничего не меняет и поднимается уже после блока
+        with transaction.atomic(using=using, savepoint=False):
+            reserved = not (adding or moved) or sources.reserve_quote_slot(self.source_id)
+            if reserved:
+                if moved:
+                    sources.release_quote_slot(loaded_source_id)
+                super().save(*args, **kwargs)
+                if text_changed:
+                    signatures = QuoteSignature.objects.db_manager(using)
+                    if not adding:
+                        signatures.filter(quote=self).delete()
+                    signatures.bulk_create([QuoteSignature(quote=self, key=key) for key in band_keys(self.text)])
+        if not reserved:
+            raise ValidationError(QUOTE_LIMIT_MESSAGE)
+        self._loaded_source_id = self.source_id
+        self._loaded_text_hash = self.text_hash
+
+
+class QuoteSignature(models.Model):
+    """Ключ одной LSH-полосы MinHash-подписи цитаты (см. dedup.py)"""
+    quote = models.ForeignKey(Quote, on_delete=models.CASCADE, related_name='signatures')
+    key = models.BigIntegerField(db_index=True)
+
+class QuoteActivity(models.Model):
+    """Просмотры и голоса цитаты за час или за сутки (см. activity.py)"""
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIOD_CHOICES = [
+        (HOUR, 'Час'),
+        (DAY, 'Сутки'),
+    ]
+
+    quote = models.ForeignKey(Quote, on_delete=models.CASCADE, related_name='activity')
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES, verbose_name="Период")
+    # Начало часа или суток (UTC)
+    bucket = models.DateTimeField(verbose_name="Начало периода")
+    views = models.PositiveIntegerField(default=0, verbose_name="Просмотры")
+    likes = models.PositiveIntegerField(default=0, verbose_name="Лайки")
+    dislikes = models.PositiveIntegerField(default=0, verbose_name="Дизлайки")
+
+    class Meta:
+        constraints = [
+            # По нему же работает INSERT ... ON CONFLICT при записи приращений
+            models.UniqueConstraint(fields=['quote', 'period', 'bucket'], name='quote_activity_bucket_uniq'),
+        ]
+        indexes = [
+            # Тренды и свертка читают все цитаты за диапазон периодов
+            models.Index(fields=['period', 'bucket'], name='quote_activity_period_idx'),
+        ]
@@ -0,0 +1,76 @@
+"""Чтение с реплики, запись в основную БД
+
+Реплика подключается настройкой QUOTES_REPLICA_DATABASE (алиас из
+DATABASES, по умолчанию 'replica'); пока ее нет, все идет в default.
+Читают с основной БД, чтобы видеть свои же изменения:
+- запросы внутри транзакции основной БД;
+- запросы, которые идут после записи в том же HTTP-запросе;
+- запросы клиента в течение QUOTES_REPLICA_STICKY_SECONDS секунд после
+  его POST с записью (голос, новая цитата) - это помечает cookie,
+  которую ставит ReplicaRoutingMiddleware.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class RoutingState:
+    """Состояние маршрутизации одного HTTP-запроса"""
+
+    def __init__(self, sticky=False):
+        self.sticky = sticky    # клиент недавно писал - читаем с основной БД
+        self.wrote = False      # в этом запросе уже была запись
+
+
+_state = ContextVar('quotes_routing_state', default=None)
+
+
+def activate(sticky=False):
+    return _state.set(RoutingState(sticky))
+
+
+def deactivate(token):
+    _state.reset(token)
+
+
+def current_state():
+    return _state.get()
+
+
+def replica_alias():
+    """Алиас реплики или None, если она не настроена"""
+    alias = getattr(settings, 'QUOTES_REPLICA_DATABASE', 'replica')
+    if alias not in settings.DATABASES:
+        return None
+    # В тестах реплика - зеркало той же БД (TEST MIRROR), читаем напрямую
+    if alias in connections.settings and (
+        connections[alias].settings_dict['NAME'] == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+    ):
+        return None
+    return alias
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = replica_alias()
+        if replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        if state is not None and (state.sticky or state.wrote):
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На реплике те же данные, что и в основной БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схему реплика получает вместе с данными от основной БД
+        return db != replica_alias()
@@ -0,0 +1,26 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from .counters import counter_buffer
+
+
+class QuotesTestRunner(DiscoverRunner):
+    """Тесты без фонового сброса счетчиков
+
+    Таймер писал бы приращения из своего потока мимо транзакции теста,
+    а перед удалением тестовой БД буфер сбрасывается в нее же - иначе при
+    выходе эти счетчики пришлось бы откладывать в spool.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._counters = override_settings(QUOTES_COUNTER_BACKGROUND_FLUSH=False)
+        self._counters.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._counters.disable()
+        super().teardown_test_environment(**kwargs)
+
+    def teardown_databases(self, old_config, **kwargs):
+        counter_buffer.flush()
+        super().teardown_databases(old_config, **kwargs)
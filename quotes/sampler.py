@@ -0,0 +1,339 @@
+import random
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+
+class WeightIndex:
+    """Дерево Фенвика (префиксные суммы) по весам одного набора цитат
+
+    Выбор и изменение веса стоят O(log n). Блокировок и чтения БД здесь
+    нет - этим занимается QuoteSampler.
+    """
+
+    def __init__(self):
+        self._ids = []          # позиция -> id цитаты
+        self._positions = {}    # id цитаты -> позиция
+        self._weights = []      # эффективные веса по позициям
+        self._tree = [0.0]      # дерево Фенвика, индексация с 1
+        self.dead = 0           # позиции удаленных цитат (вес 0)
+
+    def load(self, rows):
+        """Строит дерево по [(id, вес)] за O(n)"""
+        for quote_id, weight in rows:
+            self._positions[quote_id] = len(self._ids)
+            self._ids.append(quote_id)
+            self._weights.append(max(weight, 0.0))
+        self.rebuild()
+
+    def rebuild(self):
+        """Строит дерево по текущим весам за O(n)"""
+        size = len(self._weights)
+        tree = [0.0] + self._weights
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _prefix_sum(self, index):
+        total = 0.0
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def _add(self, position, delta):
+        index = position + 1
+        size = len(self._weights)
+        while index <= size:
+            self._tree[index] += delta
+            index += index & -index
+
+    def _append(self, quote_id, weight):
+        self._positions[quote_id] = len(self._ids)
+        self._ids.append(quote_id)
+        self._weights.append(weight)
+        index = len(self._weights)
+        # Узел покрывает отрезок (index - lowbit, index]
+        lower = index - (index & -index)
+        self._tree.append(weight + self._prefix_sum(index - 1) - self._prefix_sum(lower))
+
+    def _find(self, target):
+        """Первая позиция, у которой префиксная сумма больше target"""
+        size = len(self._weights)
+        position = 0
+        step = 1 << (size.bit_length() - 1) if size else 0
+        while step:
+            nxt = position + step
+            if nxt <= size and self._tree[nxt] <= target:
+                position = nxt
+                target -= self._tree[nxt]
+            step >>= 1
+        return position
+
+    @property
+    def total_weight(self):
+        return self._prefix_sum(len(self._weights))
+
+    @property
+    def size(self):
+        """Сколько позиций занято, включая удаленные цитаты"""
+        return len(self._ids)
+
+    def __len__(self):
+        return len(self._ids) - self.dead
+
+    def __contains__(self, quote_id):
+        return quote_id in self._positions
+
+    def choose(self):
+        """id случайной цитаты с учетом веса или None"""
+        for _ in range(2):
+            total = self._prefix_sum(len(self._weights))
+            if total <= 0:
+                return None
+            position = self._find(random.uniform(0, total))
+            if position < len(self._weights) and self._weights[position] > 0:
+                return self._ids[position]
+            # Накопилась ошибка округления в дереве - пересобираем его
+            self.rebuild()
+        return None
+
+    def choose_many(self, count):
+        """До count разных id с учетом веса (выбор без возвращения)"""
+        # Выбранные цитаты на время выбора обнуляем в дереве, чтобы они
+        # не выпали повторно, а потом возвращаем их веса: O(count * log n)
+        chosen = []
+        try:
+            for _ in range(count):
+                quote_id = self.choose()
+                if quote_id is None:
+                    break
+                position = self._positions[quote_id]
+                chosen.append((position, self._weights[position]))
+                self._add(position, -self._weights[position])
+                self._weights[position] = 0.0
+        finally:
+            for position, weight in chosen:
+                self._add(position, weight)
+                self._weights[position] = weight
+        return [self._ids[position] for position, _ in chosen]
+
+    def set_weight(self, quote_id, weight):
+        position = self._positions.get(quote_id)
+        if position is None:
+            self._append(quote_id, weight)
+            return
+        self._add(position, weight - self._weights[position])
+        self._weights[position] = weight
+
+    def remove(self, quote_id):
+        position = self._positions.pop(quote_id, None)
+        if position is None:
+            return
+        self._add(position, -self._weights[position])
+        self._weights[position] = 0.0
+        self.dead += 1
+
+
+class QuoteSampler:
+    """Взвешенный случайный выбор цитат, в том числе по типу источника
+
+    Индексы (общий и по одному на каждый тип источника) строятся одним
+    чтением из БД и дальше поправляются точечно, поэтому выбор с фильтром
+    по типу стоит столько же, сколько без него. Веса берутся готовыми из
+    Quote.effective_weight (см. weighting.py).
+
+    Чтение из БД идет без блокировки индекса: новые индексы строятся
+    рядом и подменяют текущие одним присваиванием, а изменения, пришедшие
+    за время чтения, доигрываются поверх. Поэтому выбор (в том числе в
+    цикле событий асинхронных представлений) ждет блокировку не дольше
+    одного выбора или изменения веса.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()          # индексы и их изменения
+        self._load_lock = threading.Lock()      # одно чтение из БД за раз
+        self._all = WeightIndex()
+        self._by_type = {}      # тип источника -> WeightIndex
+        self._types = {}        # id цитаты -> тип источника
+        self._built_at = None
+        self._generation = 0    # растет при каждом invalidate()
+        self._changes = None    # изменения во время чтения из БД или None
+
+    def _max_age(self):
+        # Каждый процесс держит свой индекс, поэтому периодически
+        # перечитываем его из БД, чтобы увидеть изменения соседей
+        return getattr(settings, 'QUOTES_SAMPLER_MAX_AGE', 300)
+
+    def _is_fresh(self):
+        if self._built_at is None:
+            return False
+        max_age = self._max_age()
+        return max_age is None or time.monotonic() - self._built_at < max_age
+
+    def _load(self):
+        from .models import Quote
+
+        with self._lock:
+            generation = self._generation
+            self._changes = []
+        try:
+            rows = Quote.objects.values_list('id', 'effective_weight', 'source__type').order_by('id')
+            everything = []
+            rows_by_type = {}
+            types = {}
+            for quote_id, weight, source_type in rows.iterator(chunk_size=2000):
+                everything.append((quote_id, weight))
+                rows_by_type.setdefault(source_type, []).append((quote_id, weight))
+                types[quote_id] = source_type
+            all_index = WeightIndex()
+            all_index.load(everything)
+            by_type = {}
+            for source_type, type_rows in rows_by_type.items():
+                by_type[source_type] = WeightIndex()
+                by_type[source_type].load(type_rows)
+        except BaseException:
+            with self._lock:
+                self._changes = None
+            raise
+
+        with self._lock:
+            changes, self._changes = self._changes, None
+            self._all, self._by_type, self._types = all_index, by_type, types
+            for change in changes:
+                # Чтение могло не застать эти изменения; повтор безвреден
+                if change[0] == 'set':
+                    self._set_weight(*change[1:])
+                else:
+                    self._remove(change[1])
+            # Сброс во время чтения: прочитанное могло его не застать
+            if self._generation == generation:
+                self._built_at = time.monotonic()
+
+    def _ensure_built(self):
+        """Перечитывает индекс, если он устарел; вызывается без self._lock"""
+        if self._is_fresh():
+            return
+        with self._load_lock:
+            if not self._is_fresh():
+                self._load()
+
+    def _index(self, source_type):
+        if source_type is None:
+            return self._all
+        index = self._by_type.get(source_type)
+        return index if index is not None else WeightIndex()
+
+    @property
+    def total_weight(self):
+        self._ensure_built()
+        with self._lock:
+            return self._all.total_weight
+
+    def __len__(self):
+        self._ensure_built()
+        with self._lock:
+            return len(self._all)
+
+    def pick(self, source_type=None):
+        """Возвращает id случайной цитаты (источника типа source_type) с учетом веса или None"""
+        self._ensure_built()
+        with self._lock:
+            return self._index(source_type).choose()
+
+    async def apick(self, source_type=None):
+        """pick() для асинхронных представлений
+
+        Выбор идет в памяти; в поток уходит только (пере)чтение индекса из БД.
+        """
+        if not self._is_fresh():
+            await sync_to_async(self._ensure_built)()
+        with self._lock:
+            return self._index(source_type).choose()
+
+    def pick_many(self, count, source_type=None):
+        """До count разных id цитат с учетом веса (выбор без возвращения)"""
+        self._ensure_built()
+        with self._lock:
+            return self._index(source_type).choose_many(count)
+
+    async def apick_many(self, count, source_type=None):
+        """pick_many() для асинхронных представлений"""
+        if not self._is_fresh():
+            await sync_to_async(self._ensure_built)()
+        with self._lock:
+            return self._index(source_type).choose_many(count)
+
+    def set_weight(self, quote_id, weight, source_type=None):
+        """Добавляет цитату в индекс или обновляет ее эффективный вес
+
+        source_type нужен для новой цитаты и при переносе к источнику
+        другого типа; для остальных тип уже известен индексу.
+        """
+        with self._lock:
+            weight = max(weight or 0.0, 0.0)
+            if self._changes is not None:
+                self._changes.append(('set', quote_id, weight, source_type))
+            if self._built_at is None:
+                # Индекс еще не строился - новые данные прочитаются из БД
+                return
+            self._set_weight(quote_id, weight, source_type)
+
+    def _set_weight(self, quote_id, weight, source_type):
+        known_type = self._types.get(quote_id)
+        source_type = source_type or known_type
+        if known_type is not None and known_type != source_type:
+            self._by_type[known_type].remove(quote_id)
+        self._all.set_weight(quote_id, weight)
+        if source_type is not None:
+            # Цитата другого процесса без типа попадет в индекс типа
+            # при следующем чтении из БД
+            self._types[quote_id] = source_type
+            self._by_type.setdefault(source_type, WeightIndex()).set_weight(quote_id, weight)
+
+    def refresh(self, quote_ids):
+        """Перечитывает эффективные веса указанных цитат после массового UPDATE"""
+        from .models import Quote
+
+        if self._built_at is None:
+            return
+        weights = list(
+            Quote.objects.filter(id__in=quote_ids).values_list('id', 'effective_weight', 'source__type')
+        )
+
+        def apply():
+            for quote_id, weight, source_type in weights:
+                self.set_weight(quote_id, weight, source_type)
+
+        transaction.on_commit(apply)
+
+    def remove(self, quote_id):
+        """Исключает цитату из выбора"""
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append(('remove', quote_id))
+            self._remove(quote_id)
+            if self._all.dead * 2 > self._all.size:
+                self.invalidate()
+
+    def _remove(self, quote_id):
+        if quote_id not in self._all:
+            return
+        self._all.remove(quote_id)
+        source_type = self._types.pop(quote_id, None)
+        if source_type is not None:
+            self._by_type[source_type].remove(quote_id)
+
+    def invalidate(self):
+        """Сбрасывает индекс, следующий выбор перечитает его из БД"""
+        with self._lock:
+            self._generation += 1
+            self._built_at = None
+
+
+quote_sampler = QuoteSampler()
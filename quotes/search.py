@@ -0,0 +1,435 @@
+"""Полнотекстовый поиск по тексту цитаты и названию источника
+
+На SQLite поиск идет по таблице FTS5 quotes_quote_fts, которую держат в
+актуальном состоянии триггеры БД (в том числе при bulk_create и update()).
+Если FTS5 недоступен (другая СУБД или SQLite без расширения), работает
+инвертированный индекс в памяти процесса. Оба варианта понимают русские и
+английские слова: регистр и ё/е не различаются, окончания отсекаются, а
+термы ищутся по префиксу, так что "рукописи" находит "рукописей".
+"""
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+FTS_TABLE = 'quotes_quote_fts'
+FTS_VOCAB_TABLE = 'quotes_quote_fts_vocab'
+COMMON_TERMS_CACHE_KEY = 'quotes:search:common_terms'
+MAX_TERMS = 8
+MIN_STEM_LENGTH = 3
+# Более короткие термы ищутся целиком: префикс "1" раскрылся бы в тысячи слов
+MIN_PREFIX_LENGTH = 3
+# Сколько лучших совпадений по редким термам проверять на частые
+CANDIDATES = 1000
+# Совпадение в названии источника весит меньше, чем в тексте цитаты
+SOURCE_WEIGHT = 0.5
+
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile('[а-я]')
+RU_ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'его', 'ого', 'ему', 'ому', 'ыми', 'ими', 'иях', 'ах', 'ях',
+    'ов', 'ев', 'ей', 'ой', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю',
+    'ам', 'ям', 'ом', 'ем', 'ть', 'ся', 'а', 'я', 'ы', 'и', 'о', 'е', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+EN_ENDINGS = ('ing', 'ies', 'es', 'ed', 's')
+
+
+def _fold(column):
+    """SQL-выражение: column с ё/Ё, замененными на е/Е
+
+    unicode61 не приравнивает ё к е, а normalize() в запросе заменяет ё,
+    поэтому в FTS5 текст попадает уже без ё. Регистр токенизатор
+    различать перестает сам.
+    """
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+FTS_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON quotes_quote BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text, source_name)
+        SELECT new.id, {_fold('new.text')}, {_fold('name')} FROM quotes_source WHERE id = new.source_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF text, source_id ON quotes_quote BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, text, source_name)
+        SELECT new.id, {_fold('new.text')}, {_fold('name')} FROM quotes_source WHERE id = new.source_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON quotes_quote BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_source_rename AFTER UPDATE OF name ON quotes_source BEGIN
+        UPDATE {FTS_TABLE} SET source_name = {_fold('new.name')}
+        WHERE rowid IN (SELECT id FROM quotes_quote WHERE source_id = new.id);
+    END
+    """,
+)
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+
+def tokenize(text):
+    return WORD_RE.findall(normalize(text))
+
+
+def stem(token):
+    """Грубо отсекает окончание; остальное добирает поиск по префиксу"""
+    endings = RU_ENDINGS if CYRILLIC_RE.search(token) else EN_ENDINGS
+    for ending in endings:
+        if token.endswith(ending) and len(token) - len(ending) >= MIN_STEM_LENGTH:
+            return token[:-len(ending)]
+    return token
+
+
+def query_terms(query):
+    """Уникальные основы слов запроса (не больше MAX_TERMS)"""
+    return list(dict.fromkeys(stem(token) for token in tokenize(query)))[:MAX_TERMS]
+
+
+def term_matches(term, word):
+    """Совпадает ли слово индекса с термом запроса (по префиксу, если терм не короткий)"""
+    return word.startswith(term) if len(term) >= MIN_PREFIX_LENGTH else word == term
+
+
+def fts_table_exists(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def create_fts_index(connection):
+    """Создает таблицу FTS5 и триггеры; False, если FTS5 недоступен"""
+    from django.db import OperationalError
+
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+                f'USING fts5(text, source_name, tokenize="unicode61 remove_diacritics 2")'
+            )
+        except OperationalError:
+            return False
+        # Частоты слов для выбора плана запроса (см. common_terms)
+        cursor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_VOCAB_TABLE} USING fts5vocab({FTS_TABLE}, row)')
+        for statement in FTS_TRIGGERS:
+            cursor.execute(statement)
+    return True
+
+
+def rebuild_fts_index(connection):
+    """Заново заполняет FTS5 из таблиц цитат и источников"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE}(rowid, text, source_name) '
+            f"SELECT q.id, {_fold('q.text')}, {_fold('s.name')} "
+            f'FROM quotes_quote q JOIN quotes_source s ON s.id = q.source_id'
+        )
+
+
+def drop_fts_triggers(connection):
+    """Снимает триггеры перед миграцией, пересоздающей таблицу цитат
+
+    Триггер на quotes_source ссылается на quotes_quote, и SQLite не дает
+    переименовать копию таблицы, пока он есть. Обратно триггеры ставит
+    ensure_fts_triggers после миграций.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for suffix in ('insert', 'update', 'delete', 'source_rename'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+
+
+def drop_fts_index(connection):
+    drop_fts_triggers(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_VOCAB_TABLE}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def ensure_fts_triggers(connection):
+    """Возвращает триггеры после миграций, пересоздающих таблицу цитат
+
+    SQLite при изменении схемы копирует таблицу и удаляет старую вместе с
+    триггерами; сам индекс FTS при этом не теряется, id цитат сохраняются.
+    """
+    if fts_table_exists(connection):
+        create_fts_index(connection)
+
+
+class InvertedIndex:
+    """Инвертированный индекс в памяти: основа слова -> {id цитаты: вес}
+
+    Основы хранятся и в отсортированном списке, поэтому термы с нужным
+    префиксом находятся двоичным поиском. Как и индекс выбора цитат, строится
+    из БД при первом запросе и периодически перечитывается.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._terms = []
+        self._documents = {}  # id цитаты -> {основа: вес}
+        self._unsorted = set()  # основы, чьи списки цитат уже не по возрастанию id
+        self._built_at = None
+
+    def _is_fresh(self):
+        if self._built_at is None:
+            return False
+        max_age = getattr(settings, 'QUOTES_SEARCH_INDEX_MAX_AGE', 300)
+        return max_age is None or time.monotonic() - self._built_at < max_age
+
+    def _load(self):
+        from .models import Quote
+
+        self._built_at = None
+        self._postings = {}
+        self._documents = {}
+        self._unsorted = set()
+        rows = Quote.objects.values_list('id', 'text', 'source__name').order_by('id')
+        for quote_id, text, source_name in rows.iterator(chunk_size=2000):
+            self._add(quote_id, text, source_name)
+        self._terms = sorted(self._postings)
+        self._built_at = time.monotonic()
+
+    def _add(self, quote_id, text, source_name):
+        weights = {}
+        for term in map(stem, tokenize(source_name)):
+            weights[term] = SOURCE_WEIGHT
+        for term in map(stem, tokenize(text)):
+            weights[term] = weights.get(term, 0) + 1.0
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if self._built_at is not None:
+                    bisect.insort(self._terms, term)
+            elif quote_id not in postings and postings and quote_id < next(reversed(postings)):
+                # Переиндексированная цитата встает в конец списка
+                self._unsorted.add(term)
+            postings[quote_id] = weight
+        self._documents[quote_id] = weights
+
+    def _remove(self, quote_id):
+        for term in self._documents.pop(quote_id, ()):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(quote_id, None)
+
+    def _sorted_postings(self, word):
+        """Список цитат слова по возрастанию id (нужен для слияния по новизне)"""
+        if word in self._unsorted:
+            self._postings[word] = dict(sorted(self._postings[word].items()))
+            self._unsorted.discard(word)
+        return self._postings[word]
+
+    def _expansions(self, term):
+        """Слова индекса, подходящие под терм запроса"""
+        if len(term) < MIN_PREFIX_LENGTH:
+            return [term] if term in self._postings else []
+        words = []
+        position = bisect.bisect_left(self._terms, term)
+        while position < len(self._terms) and self._terms[position].startswith(term):
+            words.append(self._terms[position])
+            position += 1
+        return words
+
+    def search(self, terms, limit):
+        """id цитат, содержащих все термы, по убыванию tf-idf
+
+        Перебираются только цитаты самого редкого терма, остальные термы
+        проверяются по словам самой цитаты - частые слова не замедляют поиск.
+        """
+        with self._lock:
+            if not self._is_fresh():
+                self._load()
+            total = len(self._documents) or 1
+            expansions = {term: self._expansions(term) for term in terms}
+            frequencies = {
+                term: sum(len(self._postings[word]) for word in words)
+                for term, words in expansions.items()
+            }
+            if not all(frequencies.values()):
+                return []
+            idf = {term: math.log(1 + total / frequencies[term]) for term in terms}
+            rarest, *others = sorted(terms, key=frequencies.get)
+
+            if frequencies[rarest] > getattr(settings, 'QUOTES_SEARCH_COMMON_TERM_DOCS', 5000):
+                # Все термы частые - как и FTS5, отдаем самые новые совпадения
+                newest = heapq.merge(
+                    *(reversed(self._sorted_postings(word)) for word in expansions[rarest]), reverse=True,
+                )
+                found = []
+                for quote_id in newest:
+                    if found and found[-1] == quote_id:
+                        # Цитата подошла под терм двумя словами
+                        continue
+                    document = self._documents[quote_id]
+                    if all(any(term_matches(term, word) for word in document) for term in others):
+                        found.append(quote_id)
+                        if len(found) == limit:
+                            break
+                return found
+
+            candidates = {}
+            for word in expansions[rarest]:
+                for quote_id, weight in self._postings[word].items():
+                    if weight > candidates.get(quote_id, 0):
+                        candidates[quote_id] = weight
+            scores = {}
+            for quote_id, weight in candidates.items():
+                document = self._documents[quote_id]
+                score = weight * idf[rarest]
+                for term in others:
+                    best = max((w for word, w in document.items() if term_matches(term, word)), default=0)
+                    if not best:
+                        break
+                    score += best * idf[term]
+                else:
+                    scores[quote_id] = score
+            ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+            return [quote_id for quote_id, _ in ranked]
+
+    @property
+    def built(self):
+        return self._built_at is not None
+
+    def update(self, quote_id, text, source_name):
+        """Переиндексирует цитату, если индекс уже построен"""
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove(quote_id)
+            self._add(quote_id, text, source_name)
+
+    def remove(self, quote_id):
+        with self._lock:
+            self._remove(quote_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+
+search_index = InvertedIndex()
+
+# FTS5 есть не в каждой сборке SQLite - проверяем таблицу один раз на БД
+_fts_checked = {}
+
+
+def _use_fts(connection):
+    backend = getattr(settings, 'QUOTES_SEARCH_BACKEND', 'auto')
+    if backend == 'memory':
+        return False
+    key = (connection.alias, str(connection.settings_dict['NAME']))
+    if key not in _fts_checked:
+        _fts_checked[key] = fts_table_exists(connection)
+    return _fts_checked[key]
+
+
+def common_terms(connection):
+    """Слова, которые встречаются больше чем в QUOTES_SEARCH_COMMON_TERM_DOCS цитатах
+
+    Разбор списка цитат такого слова стоит десятки миллисекунд на миллионе
+    цитат, поэтому поиск не передает их в MATCH. Подсчет требует полного
+    прохода по словарю FTS5, так что список хранится в кэше.
+    """
+    key = f"{COMMON_TERMS_CACHE_KEY}:{connection.settings_dict['NAME']}"
+    terms = cache.get(key)
+    if terms is None:
+        threshold = getattr(settings, 'QUOTES_SEARCH_COMMON_TERM_DOCS', 5000)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT term FROM {FTS_VOCAB_TABLE} WHERE doc > %s', [threshold])
+            terms = sorted(row[0] for row in cursor.fetchall())
+        cache.set(key, terms, getattr(settings, 'QUOTES_SEARCH_COMMON_TERMS_MAX_AGE', 3600))
+    return terms
+
+
+def invalidate_common_terms(connection):
+    cache.delete(f"{COMMON_TERMS_CACHE_KEY}:{connection.settings_dict['NAME']}")
+
+
+def _phrase(term):
+    return f'"{term}"*' if len(term) >= MIN_PREFIX_LENGTH else f'"{term}"'
+
+
+def _fts_search(connection, terms, limit):
+    """Поиск по FTS5 с учетом частых слов
+
+    Редкие термы ищутся через MATCH с ранжированием bm25, а частые
+    проверяются по тексту первых CANDIDATES совпадений. Если редких термов
+    нет, совпадает почти каждая цитата и ранжировать нечего - берем самые
+    новые цитаты с точными частыми словами.
+    """
+    common = common_terms(connection)
+    broad = {}
+    for term in terms:
+        words = [word for word in common if term_matches(term, word)]
+        if words:
+            broad[term] = words
+    selective = [term for term in terms if term not in broad]
+
+    with connection.cursor() as cursor:
+        if not selective:
+            match = ' AND '.join(
+                '(' + ' OR '.join(f'"{word}"' for word in words) + ')' for words in broad.values()
+            )
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s',
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(
+            f'SELECT rowid, text, source_name FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, 1.0, {SOURCE_WEIGHT}) LIMIT %s',
+            [' AND '.join(map(_phrase, selective)), limit if not broad else CANDIDATES],
+        )
+        found = []
+        for quote_id, text, source_name in cursor.fetchall():
+            words = tokenize(f'{text} {source_name}')
+            if all(any(term_matches(term, word) for word in words) for term in broad):
+                found.append(quote_id)
+                if len(found) == limit:
+                    break
+        return found
+
+
+def search_quote_ids(query, limit=20, using=DEFAULT_DB_ALIAS):
+    """id найденных цитат в порядке релевантности"""
+    terms = query_terms(query)
+    if not terms:
+        return []
+    connection = connections[using]
+    if _use_fts(connection):
+        return _fts_search(connection, terms, limit)
+    return search_index.search(terms, limit)
+
+
+def search_quotes(query, limit=20):
+    """Найденные цитаты (с источником) в порядке релевантности"""
+    from .models import Quote
+
+    quotes = Quote.objects.select_related('source')
+    ids = search_quote_ids(query, limit, using=quotes.db)
+    quotes = quotes.in_bulk(ids)
+    return [quotes[quote_id] for quote_id in ids if quote_id in quotes]
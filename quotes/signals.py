@@ -0,0 +1,111 @@
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from . import fragments
+from .leaderboard import popular_leaderboard
+from .metrics import install as install_metrics
+from .models import Quote, Source
+from .sampler import quote_sampler
+from .search import ensure_fts_triggers, search_index
+from .stats import dashboard_stats
+
+
+@receiver(post_save, sender=Quote)
+def sync_sampler_on_save(sender, instance, **kwargs):
+    """Добавляет новую цитату в индекс выбора или обновляет ее вес"""
+    quote_id, weight, source_type = instance.id, instance.effective_weight, instance.source.type
+    transaction.on_commit(lambda: quote_sampler.set_weight(quote_id, weight, source_type))
+
+
+@receiver(post_delete, sender=Quote)
+def sync_sampler_on_delete(sender, instance, **kwargs):
+    """Убирает удаленную цитату из индекса выбора"""
+    quote_id = instance.id
+    transaction.on_commit(lambda: quote_sampler.remove(quote_id))
+
+
+@receiver(post_save, sender=Source)
+def invalidate_sampler(sender, created, **kwargs):
+    """Тип источника мог измениться - его цитаты переходят в другой индекс"""
+    if not created:
+        transaction.on_commit(quote_sampler.invalidate)
+
+
+@receiver(post_delete, sender=Quote)
+def release_source_slot(sender, instance, using, **kwargs):
+    """Освобождает место в лимите источника (и при каскадном удалении)"""
+    Source.objects.db_manager(using).release_quote_slot(instance.source_id)
+
+
+@receiver(post_save, sender=Quote)
+@receiver(post_save, sender=Source)
+def sync_stats_on_save(sender, instance, created, **kwargs):
+    """Поправляет снимок статистики дашборда"""
+    if created:
+        model = 'quote' if sender is Quote else 'source'
+        transaction.on_commit(lambda: dashboard_stats.record_created(model))
+    elif sender is Source or dashboard_stats.is_leader(instance.id):
+        # Изменился текст лидера или название источника
+        transaction.on_commit(dashboard_stats.invalidate)
+
+
+@receiver(post_delete, sender=Quote)
+@receiver(post_delete, sender=Source)
+def sync_stats_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(dashboard_stats.invalidate)
+
+
+@receiver(post_save, sender=Quote)
+def sync_leaderboard_on_save(sender, instance, created, **kwargs):
+    """Новая цитата попадает в топ, пока в нем меньше N цитат"""
+    if (created and not popular_leaderboard.is_full()) or popular_leaderboard.contains(instance.id):
+        transaction.on_commit(popular_leaderboard.invalidate)
+
+
+@receiver(post_save, sender=Source)
+@receiver(post_delete, sender=Quote)
+@receiver(post_delete, sender=Source)
+def invalidate_leaderboard(sender, **kwargs):
+    transaction.on_commit(popular_leaderboard.invalidate)
+
+
+@receiver(post_save, sender=Quote)
+@receiver(post_save, sender=Source)
+@receiver(post_delete, sender=Quote)
+@receiver(post_delete, sender=Source)
+def invalidate_source_fragments(sender, **kwargs):
+    """Список источников показывает и число их цитат"""
+    transaction.on_commit(lambda: fragments.bump(fragments.SOURCES))
+
+
+@receiver(post_save, sender=Quote)
+def sync_search_index_on_save(sender, instance, **kwargs):
+    """Переиндексирует цитату в индексе поиска в памяти (FTS5 держат триггеры)"""
+    if search_index.built:
+        quote_id, text, source_name = instance.id, instance.text, instance.source.name
+        transaction.on_commit(lambda: search_index.update(quote_id, text, source_name))
+
+
+@receiver(post_delete, sender=Quote)
+def sync_search_index_on_delete(sender, instance, **kwargs):
+    quote_id = instance.id
+    transaction.on_commit(lambda: search_index.remove(quote_id))
+
+
+@receiver(post_save, sender=Source)
+def invalidate_search_index(sender, created, **kwargs):
+    """Название источника проиндексировано у каждой его цитаты"""
+    if not created and search_index.built:
+        transaction.on_commit(search_index.invalidate)
+
+
+@receiver(post_migrate)
+def restore_fts_triggers(sender, using, **kwargs):
+    if sender.name == 'quotes':
+        ensure_fts_triggers(connections[using])
+
+
+# Счетчик SQL для метрик запросов ставится на каждое новое соединение
+connection_created.connect(install_metrics, dispatch_uid='quotes.metrics.install')
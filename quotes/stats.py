@@ -0,0 +1,172 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from . import fragments
+
+CACHE_KEY = 'quotes:dashboard_stats'
+
+
+def _leader(quote):
+    """Данные цитаты-лидера, нужные шаблону дашборда"""
+    if quote is None:
+        return None
+    return {
+        'id': quote.id,
+        'text': quote.text,
+        'source': str(quote.source),
+        'views': quote.views,
+        'likes': quote.likes,
+        'dislikes': quote.dislikes,
+    }
+
+
+class DashboardStats:
+    """Снимок статистики для дашборда в кэше
+
+    Снимок поправляется по мере изменения счетчиков и полностью
+    пересчитывается не реже, чем раз в QUOTES_STATS_MAX_AGE секунд, поэтому
+    дашборд не делает агрегаты и сортировки по всей таблице на каждый запрос.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def _max_age(self):
+        return getattr(settings, 'QUOTES_STATS_MAX_AGE', 60)
+
+    def _cached(self):
+        snapshot = cache.get(CACHE_KEY)
+        if snapshot is None or time.time() - snapshot['built_at'] >= self._max_age():
+            return None
+        return snapshot
+
+    def _save(self, snapshot):
+        timeout = max(self._max_age() - (time.time() - snapshot['built_at']), 1)
+        cache.set(CACHE_KEY, snapshot, timeout)
+
+    def get(self):
+        snapshot = self._cached()
+        if snapshot is None:
+            snapshot = self.rebuild()
+        return snapshot
+
+    def rebuild(self):
+        """Полный пересчет статистики по БД"""
+        from .models import Quote, Source
+
+        quotes = Quote.objects.select_related('source')
+        totals = quotes.aggregate(
+            total_views=Coalesce(Sum('views'), 0),
+            total_likes=Coalesce(Sum('likes'), 0),
+            total_dislikes=Coalesce(Sum('dislikes'), 0),
+        )
+        snapshot = {
+            'total_quotes': quotes.count(),
+            'total_sources': Source.objects.count(),
+            **totals,
+            'most_popular': _leader(quotes.order_by('-likes', '-views').first()),
+            'most_viewed': _leader(quotes.order_by('-views').first()),
+            'built_at': time.time(),
+        }
+        self._save(snapshot)
+        return snapshot
+
+    def invalidate(self):
+        cache.delete(CACHE_KEY)
+        fragments.bump(fragments.STATS)
+
+    def _update(self, mutate):
+        # Блокировка защищает от гонок внутри процесса; между процессами
+        # расхождение ограничено временем жизни снимка
+        with self._lock:
+            snapshot = self._cached()
+            if snapshot is None:
+                return
+            if mutate(snapshot) is False:
+                self.invalidate()
+                return
+            self._save(snapshot)
+            fragments.bump(fragments.STATS)
+
+    def record_counters(self, deltas, rows):
+        """Учитывает записанные приращения {id: [views, likes, dislikes]}
+
+        rows - новые значения счетчиков [(id, views, likes, dislikes)].
+        """
+        def mutate(snapshot):
+            snapshot['total_views'] += sum(values[0] for values in deltas.values())
+            snapshot['total_likes'] += sum(values[1] for values in deltas.values())
+            snapshot['total_dislikes'] += sum(values[2] for values in deltas.values())
+            for quote_id, views, likes, dislikes in rows:
+                self._promote(snapshot, quote_id, views, likes, dislikes)
+
+        self._update(mutate)
+
+    def record_vote(self, quote_id, vote_type, likes, dislikes):
+        """Учитывает голос, уже записанный в БД"""
+        from .models import Quote
+
+        def mutate(snapshot):
+            snapshot['total_likes' if vote_type == 'like' else 'total_dislikes'] += 1
+            popular = snapshot['most_popular']
+            if popular is None or popular['id'] == quote_id or likes >= popular['likes']:
+                views = Quote.objects.filter(id=quote_id).values_list('views', flat=True).first()
+                if views is None:
+                    return False
+            else:
+                views = None
+            self._promote(snapshot, quote_id, views, likes, dislikes)
+
+        self._update(mutate)
+
+    def _promote(self, snapshot, quote_id, views, likes, dislikes):
+        """Обновляет лидеров с учетом новых значений счетчиков цитаты"""
+        from .models import Quote
+
+        candidates = []
+        for key, rank in (('most_popular', lambda q: (q['likes'], q['views'])),
+                          ('most_viewed', lambda q: q['views'])):
+            leader = snapshot[key]
+            if leader is not None and leader['id'] == quote_id:
+                leader.update(likes=likes, dislikes=dislikes)
+                if views is not None:
+                    leader['views'] = views
+                continue
+            if views is None:
+                continue
+            candidate = {'likes': likes, 'views': views}
+            if leader is None or rank(candidate) > rank(leader):
+                candidates.append(key)
+        if candidates:
+            quote = Quote.objects.select_related('source').filter(id=quote_id).first()
+            for key in candidates:
+                snapshot[key] = _leader(quote)
+
+    def record_created(self, model):
+        """Учитывает новую цитату или источник"""
+        key = 'total_quotes' if model == 'quote' else 'total_sources'
+
+        def mutate(snapshot):
+            snapshot[key] += 1
+            if model == 'quote' and snapshot['most_popular'] is None:
+                # Первая цитата сразу становится лидером
+                return False
+
+        self._update(mutate)
+
+    def is_leader(self, quote_id):
+        snapshot = self._cached()
+        if snapshot is None:
+            return False
+        return any(
+            leader is not None and leader['id'] == quote_id
+            for leader in (snapshot['most_popular'], snapshot['most_viewed'])
+        )
+
+
+dashboard_stats = DashboardStats()
@@ -1,3 +1,1083 @@
-from django.test import TestCase
+import collections
+import csv
+import datetime
+import gzip
+import importlib
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import types
+import uuid
+import warnings
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import OperationalError, close_old_connections, connection, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+
+from . import async_views, importer as quotes_importer
+from .admin import estimated_count
+from .activity import compute_trending, hour_bucket, rollup
+from .benchmark import QUERY_BUDGETS, budget_failures, seed
+from .counters import counter_buffer, drain_spool, request_flush, spool_deltas, write_deltas
+from .exporter import FIELDS as EXPORT_FIELDS
+from .importer import QuoteImporter
+from .leaderboard import CACHE_KEY as LEADERBOARD_CACHE_KEY, popular_leaderboard
+from .metrics import Histogram, request_metrics
+from .middleware import STICKY_COOKIE, ReplicaRoutingMiddleware
+from .models import QUOTE_LIMIT_MESSAGE, Quote, QuoteActivity, QuoteSignature, Source
+from .sampler import WeightIndex, quote_sampler
+from .search import search_index, search_quote_ids
+from .stats import CACHE_KEY as STATS_CACHE_KEY, dashboard_stats
+from .urls import build_urlpatterns
+from .views import apply_vote
+from .weighting import MAX_DECAY_HALF_LIVES, POLICIES, effective_weight
+
+
+def expected_weight(likes, dislikes, weight):
+    """Эталон формулы views.update_quote_weight на Python"""
+    total_votes = likes + dislikes
+    if total_votes > 0:
+        like_percentage = (likes / total_votes) * 100
+        raw_new_weight = max(1, 10 + likes - dislikes + (like_percentage / 10))
+        new_weight = min(raw_new_weight, weight * 1.8)
+    else:
+        new_weight = 10
+    if abs(new_weight - weight) > 0.1:
+        return int(new_weight)
+    return weight
+
+
+class VoteTests(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name='Мастер и Маргарита', type='book')
+        self.quote = Quote.objects.create(text='Рукописи не горят', source=self.source, weight=10)
+
+    def test_vote_requires_view(self):
+        response = self.client.post(f'/quote/{self.quote.id}/like/')
+        self.assertFalse(response.json()['success'])
+
+    def test_cannot_vote_twice_without_new_view(self):
+        self.client.get('/')
+        self.assertTrue(self.client.post(f'/quote/{self.quote.id}/like/').json()['success'])
+        self.assertFalse(self.client.post(f'/quote/{self.quote.id}/like/').json()['success'])
+        self.client.get('/')
+        self.assertTrue(self.client.post(f'/quote/{self.quote.id}/like/').json()['success'])
+
+    def test_forged_eligibility_cookie_is_ignored(self):
+        self.client.cookies['quotes_can_vote'] = str(self.quote.id)
+        self.assertFalse(self.client.post(f'/quote/{self.quote.id}/like/').json()['success'])
+
+    def test_vote_is_single_query(self):
+        self.client.get('/')
+        with self.assertNumQueries(1):
+            Quote.objects.apply_vote(self.quote.id, 'like')
+
+    def test_vote_returns_new_counters_and_weight(self):
+        self.client.get('/')
+        response = self.client.post(f'/quote/{self.quote.id}/dislike/')
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual((data['likes'], data['dislikes']), (0, 1))
+        self.assertEqual(data['weight'], expected_weight(0, 1, 10))
+        self.quote.refresh_from_db()
+        self.assertEqual(self.quote.weight, data['weight'])
+
+    def test_vote_on_missing_quote(self):
+        self.assertIsNone(Quote.objects.apply_vote(self.quote.id + 1, 'like'))
+
+    def test_sql_formula_matches_python(self):
+        likes, dislikes, weight = 0, 0, 10
+        for vote_type in ['like'] * 5 + ['dislike'] * 7 + ['like'] * 3:
+            likes += vote_type == 'like'
+            dislikes += vote_type == 'dislike'
+            weight = expected_weight(likes, dislikes, weight)
+            self.assertEqual(Quote.objects.apply_vote(self.quote.id, vote_type)[:3], (likes, dislikes, weight))
+
+
+class WeightPolicyTests(TestCase):
+    def setUp(self):
+        source = Source.objects.create(name='Собачье сердце', type='book')
+        self.quote = Quote.objects.create(text='Разруха не в клозетах, а в головах', source=source, weight=7, views=40)
+
+    def test_sql_and_python_policies_agree(self):
+        for name in POLICIES:
+            with self.subTest(policy=name), override_settings(QUOTES_WEIGHT_POLICY=name):
+                Quote.objects.filter(id=self.quote.id).refresh_effective_weights()
+                self.quote.refresh_from_db()
+                self.assertAlmostEqual(self.quote.effective_weight / effective_weight(self.quote), 1.0, places=6)
+
+    @override_settings(QUOTES_WEIGHT_POLICY='decay', QUOTES_WEIGHT_POLICY_OPTIONS={'half_life_days': 1})
+    def test_decay_is_bounded_far_from_epoch(self):
+        for year in (1900, 2300):
+            with self.subTest(year=year):
+                created_at = datetime.datetime(year, 1, 1, tzinfo=datetime.timezone.utc)
+                Quote.objects.filter(id=self.quote.id).update(created_at=created_at)
+                Quote.objects.filter(id=self.quote.id).refresh_effective_weights()
+                self.quote.refresh_from_db()
+                expected = 7 ** 1.5 * 2.0 ** (MAX_DECAY_HALF_LIVES if year > 2024 else -MAX_DECAY_HALF_LIVES)
+                self.assertAlmostEqual(self.quote.effective_weight / expected, 1.0, places=6)
+                self.assertAlmostEqual(effective_weight(self.quote) / expected, 1.0, places=6)
+
+    def test_vote_stores_effective_weight(self):
+        self.assertAlmostEqual(self.quote.effective_weight, 7 ** 1.5)
+        likes, dislikes, weight, stored = Quote.objects.apply_vote(self.quote.id, 'like')
+        self.assertAlmostEqual(stored, weight ** 1.5)
+        self.quote.refresh_from_db()
+        self.assertEqual(self.quote.effective_weight, stored)
+
+
+class SamplerTests(TestCase):
+    def test_choice_follows_weights(self):
+        index = WeightIndex()
+        index.load([(1, 1.0), (2, 3.0), (3, 0.0)])
+        random.seed(1)
+        picks = collections.Counter(index.choose() for _ in range(4000))
+        self.assertEqual(set(picks), {1, 2})
+        self.assertAlmostEqual(picks[2] / picks[1], 3, delta=0.5)
+
+    def test_set_weight_append_and_remove(self):
+        index = WeightIndex()
+        index.load([(1, 2.0)])
+        weights = {1: 2.0}
+        # Добавление по одной проверяет сборку узлов дерева при _append
+        for quote_id in range(2, 20):
+            index.set_weight(quote_id, float(quote_id))
+            weights[quote_id] = float(quote_id)
+            self.assertAlmostEqual(index.total_weight, sum(weights.values()))
+        index.set_weight(5, 0.0)
+        index.remove(7)
+        self.assertEqual((len(index), index.size, index.dead), (18, 19, 1))
+        self.assertAlmostEqual(index.total_weight, sum(weights.values()) - 5 - 7)
+
+        chosen = index.choose_many(30)
+        self.assertEqual(len(chosen), len(set(chosen)))
+        self.assertEqual(set(chosen), set(weights) - {5, 7})
+        # Веса выбранных на время выбора цитат восстановлены
+        self.assertAlmostEqual(index.total_weight, sum(weights.values()) - 5 - 7)
+
+    def test_indexes_follow_saved_and_deleted_quotes(self):
+        book = Source.objects.create(name='Мастер и Маргарита', type='book')
+        movie = Source.objects.create(name='Брат', type='movie')
+        first = Quote.objects.create(text='Рукописи не горят', source=book, weight=10)
+        quote_sampler.invalidate()
+        self.assertEqual(quote_sampler.pick('book'), first.id)
+        self.assertIsNone(quote_sampler.pick('movie'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second = Quote.objects.create(text='Сила в правде', source=movie, weight=10)
+        self.assertEqual(quote_sampler.pick('movie'), second.id)
+        self.assertEqual(set(quote_sampler.pick_many(5)), {first.id, second.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertIsNone(quote_sampler.pick('book'))
+        self.assertEqual(quote_sampler.pick_many(5), [second.id])
+
+        # Смена типа источника перестраивает индексы целиком
+        with self.captureOnCommitCallbacks(execute=True):
+            movie.type = 'series'
+            movie.save()
+        self.assertEqual(quote_sampler.pick('series'), second.id)
+        self.assertIsNone(quote_sampler.pick('movie'))
+
+
+class RandomFilterTests(TestCase):
+    def setUp(self):
+        self.book = Source.objects.create(name='Мастер и Маргарита', type='book')
+        self.movie = Source.objects.create(name='Брат', type='movie')
+        self.book_quote = Quote.objects.create(text='Рукописи не горят', source=self.book, weight=10)
+        self.movie_quote = Quote.objects.create(text='Сила в правде', source=self.movie, weight=10)
+        quote_sampler.invalidate()
+
+    def picks(self, **params):
+        return {self.client.get(reverse('api_random_quote'), params).json()['quote']['id'] for _ in range(10)}
+
+    def test_pick_by_type_and_source(self):
+        self.assertEqual(self.picks(type='movie'), {self.movie_quote.id})
+        self.assertEqual(self.picks(source=self.book.id), {self.book_quote.id})
+        self.assertIsNone(self.client.get(reverse('api_random_quote'), {'type': 'game'}).json()['quote'])
+
+    def test_type_index_follows_moved_quote(self):
+        self.picks(type='book')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book_quote.source = self.movie
+            self.book_quote.save()
+        self.assertEqual(set(quote_sampler.pick_many(5, 'movie')), {self.book_quote.id, self.movie_quote.id})
+        self.assertIsNone(quote_sampler.pick('book'))
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        counter_buffer.flush()
+        seed(30)
+        self.quotes = list(Quote.objects.order_by('id'))
+        dashboard_stats.get()
+
+    def assertMatchesRebuild(self):
+        incremental = dict(cache.get(STATS_CACHE_KEY))
+        rebuilt = dashboard_stats.rebuild()
+        for snapshot in (incremental, rebuilt):
+            del snapshot['built_at']
+        self.assertEqual(incremental, rebuilt)
+
+    def test_incremental_snapshot_matches_rebuild(self):
+        # Новый лидер по лайкам через сброс счетчиков
+        with self.captureOnCommitCallbacks(execute=True):
+            write_deltas({self.quotes[0].id: [3, 5000, 2], self.quotes[1].id: [1, 0, 0]})
+        self.assertEqual(cache.get(STATS_CACHE_KEY)['most_popular']['id'], self.quotes[0].id)
+        self.assertMatchesRebuild()
+
+        # Голоса за лидера и за рядовую цитату
+        apply_vote(self.quotes[0].id, 'like')
+        apply_vote(self.quotes[2].id, 'dislike')
+        self.assertMatchesRebuild()
+
+        # Новый лидер по просмотрам
+        with self.captureOnCommitCallbacks(execute=True):
+            write_deltas({self.quotes[3].id: [10 ** 6, 0, 0]})
+        self.assertEqual(cache.get(STATS_CACHE_KEY)['most_viewed']['id'], self.quotes[3].id)
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            source = Source.objects.create(name='Новый источник', type='other')
+            Quote.objects.create(text='Новая цитата', source=source, weight=10)
+        self.assertMatchesRebuild()
+
+
+@override_settings(QUOTES_LEADERBOARD_SIZE=3)
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        counter_buffer.flush()
+        self.quotes = [
+            Quote.objects.create(
+                text=f'Цитата {likes}', source=Source.objects.create(name=f'Источник {likes}', type='book'),
+                weight=10, likes=likes,
+            )
+            for likes in (10, 20, 30, 40, 50)
+        ]
+
+    def top(self):
+        ids = [entry['id'] for entry in popular_leaderboard.get()]
+        self.assertEqual(ids, [entry['id'] for entry in popular_leaderboard.rebuild()['entries']])
+        return [self.quotes.index(Quote(id=quote_id)) for quote_id in ids]
+
+    def test_quotes_enter_and_leave_top(self):
+        self.assertEqual(self.top(), [4, 3, 2])
+        with self.captureOnCommitCallbacks(execute=True):
+            write_deltas({self.quotes[0].id: [0, 100, 0]})
+        self.assertEqual([entry['id'] for entry in popular_leaderboard.get()][0], self.quotes[0].id)
+        self.assertEqual(self.top(), [0, 4, 3])
+
+        # Голоса поднимают вытесненную цитату обратно, вытесняя другую
+        for _ in range(11):
+            apply_vote(self.quotes[2].id, 'like')
+        self.assertEqual(self.top(), [0, 4, 2])
+
+    def test_deletion_invalidates_top(self):
+        popular_leaderboard.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.quotes[4].delete()
+        self.assertIsNone(cache.get(LEADERBOARD_CACHE_KEY))
+        self.assertEqual(self.top(), [3, 2, 1])
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        sources = [Source.objects.create(name=f'Источник {number}', type='book') for number in range(2)]
+        self.quotes = [
+            Quote.objects.create(text=f'Цитата номер {number}', source=sources[number % 2], weight=10)
+            for number in range(5)
+        ]
+
+    def test_keyset_pagination_follows_next(self):
+        url = f"{reverse('api_quote_list')}?limit=2"
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([quote['id'] for quote in data['results']])
+            url = data['next']
+        self.assertEqual(pages, [[quote.id for quote in self.quotes[start:start + 2]] for start in (0, 2, 4)])
+
+    def test_unchanged_list_is_not_modified(self):
+        url = reverse('api_quote_list')
+        response = self.client.get(url)
+        etag = response['ETag']
+        # Проверка версии - один запрос, без чтения строк и сериализации
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+
+        self.quotes[1].text = 'Цитата изменена'
+        self.quotes[1].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_last_modified(self):
+        url = reverse('api_quote_detail', args=[self.quotes[0].id])
+        response = self.client.get(url)
+        self.assertEqual(response['Last-Modified'], http_date(int(self.quotes[0].updated_at.timestamp())))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        later = self.client.get(reverse('api_quote_list'))['Last-Modified']
+        self.assertEqual(later, http_date(int(max(quote.updated_at for quote in self.quotes).timestamp())))
+
+
+class SourceQuoteLimitTests(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name='Мастер и Маргарита', type='book')
+
+    def add(self, text, source=None):
+        return Quote.objects.create(text=text, source=source or self.source, weight=10)
+
+    def test_limit_is_enforced_on_save(self):
+        quotes = [self.add(f'Цитата {number}') for number in range(3)]
+        with self.assertRaises(ValidationError):
+            self.add('Лишняя цитата')
+        self.assertEqual(Quote.objects.filter(source=self.source).count(), 3)
+
+        quotes[0].delete()
+        self.source.refresh_from_db()
+        self.assertEqual(self.source.quote_count, 2)
+        self.add('Снова есть место')
+
+    def test_moving_quote_updates_both_sources(self):
+        other = Source.objects.create(name='Собачье сердце', type='book')
+        quote = self.add('Разруха не в клозетах, а в головах')
+        quote = Quote.objects.get(id=quote.id)
+        quote.source = other
+        quote.save()
+        self.assertEqual(
+            dict(Source.objects.values_list('name', 'quote_count')),
+            {'Мастер и Маргарита': 0, 'Собачье сердце': 1},
+        )
+
+    def test_importer_maintains_quote_count(self):
+        QuoteImporter().run([
+            {'text': f'Импорт {number}', 'source': 'Мастер и Маргарита', 'type': 'book'}
+            for number in range(5)
+        ])
+        self.source.refresh_from_db()
+        self.assertEqual(self.source.quote_count, 3)
+
+    @mock.patch('quotes.views.MAX_QUOTES_PER_SOURCE', 5)
+    def test_source_list_shows_configured_limit(self):
+        for number in range(3):
+            self.add(f'Цитата {number}')
+        response = self.client.get(reverse('add_source'))
+        self.assertContains(response, '3/5')
+        self.assertContains(response, 'width: 60%')
+        self.assertNotContains(response, 'table-warning')
+
+
+class ImporterTests(TestCase):
+    def setUp(self):
+        Source.objects.create(name='Мастер и Маргарита', type='book')
+
+    def test_sources_created_counts_only_new_sources(self):
+        importer = QuoteImporter().run([
+            {'text': 'Рукописи не горят', 'source': 'Мастер и Маргарита', 'type': 'book'},
+            {'text': 'Сила в правде', 'source': 'Брат', 'type': 'movie'},
+            {'text': 'Кто ходит в гости по утрам', 'source': 'Винни-Пух', 'type': 'movie'},
+        ])
+        self.assertEqual((importer.created, importer.sources_created), (3, 2))
+
+        # Другой импорт создает источник между поиском и вставкой: первый
+        # поиск его еще не видит
+        Source.objects.create(name='Брат 2', type='movie')
+        real_filter = Source.objects.filter
+
+        def stale_first_lookup(*args, **kwargs):
+            return Source.objects.none() if lookup.call_count == 1 else real_filter(*args, **kwargs)
+
+        with mock.patch.object(Source.objects, 'filter', side_effect=stale_first_lookup) as lookup:
+            importer = QuoteImporter().run([
+                {'text': 'Город - сила, а деревня - дохляк', 'source': 'Брат 2', 'type': 'movie'},
+                {'text': 'Лошадка, лошадка, ты меня слышишь?', 'source': 'Ёжик в тумане', 'type': 'movie'},
+            ])
+        self.assertEqual((importer.created, importer.sources_created), (2, 1))
+
+    def test_ids_are_found_without_insert_returning(self):
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            importer = QuoteImporter().run([
+                {'text': 'Рукописи не горят', 'source': 'Мастер и Маргарита', 'type': 'book'},
+                {'text': 'Никогда и ничего не просите', 'source': 'Мастер и Маргарита', 'type': 'book'},
+            ])
+        self.assertEqual(importer.created, 2)
+        for quote in Quote.objects.all():
+            self.assertTrue(QuoteSignature.objects.filter(quote=quote).exists())
+
+    def test_limit_is_shared_with_concurrent_saves(self):
+        source = Source.objects.get(name='Мастер и Маргарита')
+        Quote.objects.create(text='Рукописи не горят', source=source, weight=10)
+        real_deduplicator = quotes_importer.BatchDeduplicator
+
+        def save_during_import(texts):
+            # Цитата с сайта сохраняется, пока импорт уже нашел источник
+            Quote.objects.create(text='Никогда и ничего не просите', source=source, weight=10)
+            return real_deduplicator(texts)
+
+        with mock.patch.object(quotes_importer, 'BatchDeduplicator', side_effect=save_during_import):
+            importer = QuoteImporter().run([
+                {'text': 'Трусость - самый страшный порок', 'source': 'Мастер и Маргарита', 'type': 'book'},
+                {'text': 'Правду говорить легко и приятно', 'source': 'Мастер и Маргарита', 'type': 'book'},
+            ])
+        self.assertEqual(importer.created, 1)
+        self.assertEqual(importer.rejected[QUOTE_LIMIT_MESSAGE], 1)
+        source.refresh_from_db()
+        self.assertEqual(source.quote_count, 3)
+        self.assertEqual(Quote.objects.filter(source=source).count(), 3)
+
+    def test_unused_slots_are_released(self):
+        QuoteImporter().run([
+            {'text': 'Рукописи не горят', 'source': 'Мастер и Маргарита', 'type': 'book'},
+            {'text': 'Рукописи не горят!', 'source': 'Мастер и Маргарита', 'type': 'book'},
+        ])
+        source = Source.objects.get(name='Мастер и Маргарита')
+        self.assertEqual(source.quote_count, 1)
+
+
+class DuplicateTests(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name='Мастер и Маргарита', type='book')
+        self.other = Source.objects.create(name='Собачье сердце', type='book')
+        Quote.objects.create(text='Рукописи не горят.', source=self.source, weight=10)
+
+    def duplicate_errors(self, text):
+        with self.assertRaises(ValidationError) as context:
+            Quote(text=text, source=self.other, weight=10).full_clean()
+        return context.exception.messages
+
+    def test_exact_duplicate_is_rejected_across_sources(self):
+        errors = self.duplicate_errors('рукописи НЕ горят')
+        self.assertIn('Такая цитата уже есть у источника "Книга: Мастер и Маргарита"', errors)
+
+    def test_near_duplicate_is_rejected(self):
+        Quote.objects.create(
+            text='Никогда и ничего не просите! Никогда и ничего, и в особенности у тех, кто сильнее вас.',
+            source=self.source, weight=10,
+        )
+        errors = self.duplicate_errors(
+            'Никогда ничего не просите! Никогда и ничего, и в особенности у тех, кто сильнее вас'
+        )
+        self.assertTrue(errors[0].startswith('Похожая цитата уже есть'))
+        Quote(text='Разруха не в клозетах, а в головах', source=self.other, weight=10).full_clean()
+
+    def test_editing_text_updates_signature(self):
+        quote = Quote.objects.get()
+        quote.text = 'Трусость - самый страшный порок'
+        quote.save()
+        Quote(text='Рукописи не горят', source=self.other, weight=10).full_clean()
+        self.duplicate_errors('Трусость — самый страшный порок!')
+
+    def test_importer_rejects_duplicates(self):
+        rejected = []
+        importer = QuoteImporter(on_reject=lambda line, row, reason: rejected.append(line)).run([
+            {'text': 'Рукописи не горят!', 'source': 'Собачье сердце', 'type': 'book'},
+            {'text': 'Разруха не в клозетах, а в головах', 'source': 'Собачье сердце', 'type': 'book'},
+            {'text': 'Разруха не в клозетах, а в головах!!', 'source': 'Собачье сердце', 'type': 'book'},
+            {'text': 'Разруха не в клозетах, а в головах у нас', 'source': 'Собачье сердце', 'type': 'book'},
+        ])
+        self.assertEqual(importer.created, 1)
+        self.assertEqual(rejected, [1, 3, 4])
+        self.duplicate_errors('Разруха — не в клозетах, а в головах')
+
+
+class SourcePickerTests(TestCase):
+    def setUp(self):
+        self.book = Source.objects.create(name='Мёртвые души', type='book')
+        self.movie = Source.objects.create(name='Мертвый сезон', type='movie')
+        Source.objects.create(name='Мастер и Маргарита', type='book')
+
+    def lookup(self, **params):
+        response = self.client.get(reverse('api_source_lookup'), params)
+        return [source['id'] for source in response.json()['results']]
+
+    def test_prefix_lookup_ignores_case_and_yo(self):
+        self.assertEqual(self.lookup(q='МЕРТ'), [self.book.id, self.movie.id])
+        self.assertEqual(self.lookup(q='мерт', type='movie'), [self.movie.id])
+        self.assertEqual(self.lookup(q='сезон'), [])
+
+    def test_form_does_not_render_all_sources(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('add_quote'))
+        self.assertEqual(len(queries), 0)
+        self.assertNotContains(response, 'Мастер и Маргарита')
+
+        response = self.client.post(reverse('add_quote'), {'text': 'Нет', 'source': self.book.id, 'weight': 10})
+        self.assertContains(response, 'value="Книга: Мёртвые души"')
+
+
+class ActivityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        counter_buffer.flush()
+        source = Source.objects.create(name='Горе от ума', type='book')
+        self.quote = Quote.objects.create(text='Счастливые часов не наблюдают', source=source, weight=10)
+        self.other = Quote.objects.create(text='А судьи кто?', source=source, weight=10)
+
+    @override_settings(QUOTES_COUNTER_FLUSH_INTERVAL=None)
+    def test_views_and_votes_reach_history_on_flush(self):
+        self.client.get(reverse('random_quote'))
+        viewed = self.client.get(reverse('random_quote')).context['quote']
+        self.client.post(reverse('like_quote', args=[viewed.id]))
+        self.assertFalse(QuoteActivity.objects.exists())
+
+        counter_buffer.flush()
+        counter_buffer.add_history(viewed.id, dislikes=1)
+        counter_buffer.flush()
+        history = QuoteActivity.objects.filter(period=QuoteActivity.HOUR)
+        self.assertEqual(sum(history.values_list('views', flat=True)), 2)
+        self.assertEqual(history.get(quote=viewed).likes, 1)
+        self.assertEqual(history.get(quote=viewed).dislikes, 1)
+
+    def test_rollup_and_trending(self):
+        now = hour_bucket()
+
+        def bucket(hours_ago):
+            return datetime.datetime.fromtimestamp(now - hours_ago * 3600, tz=datetime.timezone.utc)
+
+        QuoteActivity.objects.bulk_create([
+            QuoteActivity(quote=self.other, period=QuoteActivity.HOUR, bucket=bucket(60), likes=30),
+            QuoteActivity(quote=self.other, period=QuoteActivity.HOUR, bucket=bucket(20), likes=10),
+            QuoteActivity(quote=self.quote, period=QuoteActivity.HOUR, bucket=bucket(0), likes=6),
+            QuoteActivity(quote=self.quote, period=QuoteActivity.DAY, bucket=bucket(24 * 100), views=5),
+        ])
+        # Свежие 6 лайков важнее 10, набранных 20 часов назад
+        self.assertEqual([entry['id'] for entry in compute_trending(10)], [self.quote.id, self.other.id])
+
+        self.assertEqual(rollup(), (1, 1))
+        day = QuoteActivity.objects.get(period=QuoteActivity.DAY)
+        self.assertEqual((day.quote_id, day.likes, day.bucket.hour), (self.other.id, 30, 0))
+
+
+@override_settings(QUOTES_COUNTER_FLUSH_SIZE=None, QUOTES_COUNTER_FLUSH_INTERVAL=None)
+class CounterBufferTests(TestCase):
+    def setUp(self):
+        counter_buffer.flush()
+        source = Source.objects.create(name='Горе от ума', type='book')
+        self.quote = Quote.objects.create(text='Счастливые часов не наблюдают', source=source, weight=10)
+        self.other = Quote.objects.create(text='А судьи кто?', source=source, weight=10)
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.spool_dir = spool_dir.name
+        override = override_settings(QUOTES_COUNTER_SPOOL_DIR=self.spool_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def views(self):
+        return dict(Quote.objects.values_list('id', 'views'))
+
+    def test_flush_by_size_and_interval(self):
+        with self.settings(QUOTES_COUNTER_FLUSH_SIZE=2):
+            counter_buffer.add(self.quote.id, views=1)
+            self.assertEqual(self.views(), {self.quote.id: 0, self.other.id: 0})
+            counter_buffer.add(self.other.id, views=1)
+            self.assertEqual(self.views(), {self.quote.id: 1, self.other.id: 1})
+        with self.settings(QUOTES_COUNTER_FLUSH_INTERVAL=0):
+            counter_buffer.add(self.quote.id, views=1)
+        self.assertEqual(self.views()[self.quote.id], 2)
+
+    def test_exit_flush_spools_when_database_fails(self):
+        counter_buffer.add(self.quote.id, views=2)
+        counter_buffer.flush_on_exit()
+        self.assertEqual(self.views()[self.quote.id], 2)
+
+        counter_buffer.add(self.quote.id, views=3, likes=1)
+        with (
+            mock.patch('quotes.counters.write_deltas', side_effect=OperationalError('disk I/O error')),
+            self.assertLogs('quotes.counters', 'ERROR'),
+        ):
+            counter_buffer.flush_on_exit()
+        self.assertEqual(self.views()[self.quote.id], 2)
+        self.assertEqual(drain_spool(), 1)
+        self.quote.refresh_from_db()
+        self.assertEqual((self.quote.views, self.quote.likes), (5, 1))
+        self.assertEqual(QuoteActivity.objects.get(quote=self.quote).views, 5)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_counters_of_another_database_are_kept_aside(self):
+        with mock.patch('quotes.counters._database_name', return_value='other.sqlite3'):
+            counter_buffer.add(self.quote.id, views=4)
+        with self.assertLogs('quotes.counters', 'INFO'):
+            self.assertEqual(counter_buffer.flush(), 0)
+        spool_deltas({self.other.id: [1, 0, 0]})
+        # Применяются только счетчики текущей БД, чужие ждут своей
+        with self.assertLogs('quotes.counters', 'WARNING'):
+            self.assertEqual(drain_spool(), 1)
+        self.assertEqual(self.views(), {self.quote.id: 0, self.other.id: 1})
+        self.assertEqual(len(os.listdir(self.spool_dir)), 1)
+
+    @override_settings(QUOTES_COUNTER_FLUSH_SIZE=None, QUOTES_COUNTER_FLUSH_INTERVAL=None, QUOTES_COUNTER_FLUSH_POLL=0)
+    def test_flush_request_reaches_buffers_of_running_processes(self):
+        counter_buffer.add(self.quote.id, views=1)
+        self.assertEqual(self.views()[self.quote.id], 0)
+        # Команда в своем процессе только оставляет запрос; буфер этого
+        # процесса для нее - буфер "чужого" воркера
+        self.assertTrue(request_flush())
+        counter_buffer.add(self.other.id, views=1)
+        self.assertEqual(self.views(), {self.quote.id: 1, self.other.id: 1})
+        # Запрос выполнен - дальше приращения снова копятся
+        counter_buffer.add(self.quote.id, views=1)
+        self.assertEqual(self.views()[self.quote.id], 1)
+
+        stdout = io.StringIO()
+        call_command('flush_counters', '--wait', '0', stdout=stdout)
+        self.assertEqual(self.views()[self.quote.id], 2)
+        self.assertIn('цитат из буфера этого процесса: 1', stdout.getvalue())
+
+
+class BackgroundFlushTests(TransactionTestCase):
+    @override_settings(
+        QUOTES_COUNTER_BACKGROUND_FLUSH=True, QUOTES_COUNTER_FLUSH_INTERVAL=0.05, QUOTES_COUNTER_FLUSH_SIZE=None,
+    )
+    def test_idle_buffer_is_flushed_by_timer(self):
+        counter_buffer.flush()
+        source = Source.objects.create(name='Горе от ума', type='book')
+        quote = Quote.objects.create(text='Счастливые часов не наблюдают', source=source, weight=10)
+        counter_buffer.add(quote.id, views=1)
+        deadline = time.monotonic() + 5
+        while Quote.objects.get(id=quote.id).views == 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(Quote.objects.get(id=quote.id).views, 1)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        source = Source.objects.create(name='Горе от ума', type='book')
+        self.quotes = [
+            Quote.objects.create(text=text, source=source, weight=10)
+            for text in ('Счастливые часов не наблюдают', 'А судьи кто?', 'Служить бы рад, прислуживаться тошно')
+        ]
+
+    def test_streaming_csv(self):
+        # Маленькие куски: выгрузка отдается по частям
+        with mock.patch('quotes.exporter.CHUNK_BYTES', 50):
+            response = self.client.get(reverse('export_quotes'))
+            chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="quotes.csv"')
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode())))
+        self.assertEqual(rows[0], list(EXPORT_FIELDS))
+        self.assertEqual([row[1] for row in rows[1:]], [quote.text for quote in self.quotes])
+
+    def test_gzipped_jsonl_from_view_and_command(self):
+        response = self.client.get(reverse('export_quotes'), {'format': 'jsonl', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [quote.id for quote in self.quotes])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'quotes.jsonl.gz')
+            call_command('export_quotes', path, '--format', 'jsonl', '--gzip', stderr=io.StringIO())
+            with gzip.open(path, 'rt') as exported:
+                self.assertEqual(exported.read().splitlines(), lines)
+
+    def test_internal_pages_are_hidden_from_outside(self):
+        for name in ('export_quotes', 'metrics'):
+            with self.subTest(page=name):
+                self.assertEqual(self.client.get(reverse(name), REMOTE_ADDR='203.0.113.5').status_code, 404)
+        self.client.force_login(User.objects.create_user('staff', password='password', is_staff=True))
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.5').status_code, 200)
+
+
+class AdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(300)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelist_does_not_query_per_row(self):
+        url = reverse('admin:quotes_quote_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'source__type__exact': 'book', 'weight': 'top', 'q': 'цитата'})
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), 8, [query['sql'] for query in queries])
+        self.assertEqual(estimated_count(Quote, 'default'), 300)
+
+    def test_bulk_actions(self):
+        quotes = list(Quote.objects.order_by('id')[:2])
+        url = reverse('admin:quotes_quote_changelist')
+        self.client.post(url, {'action': 'reset_counters', '_selected_action': [quote.id for quote in quotes]})
+        self.assertEqual(
+            list(Quote.objects.filter(id__in=[quote.id for quote in quotes]).values_list('views', 'likes', 'dislikes')),
+            [(0, 0, 0)] * 2,
+        )
+        self.client.post(url, {'action': 'recompute_vote_weights', '_selected_action': [quotes[0].id]})
+        self.assertEqual(Quote.objects.get(id=quotes[0].id).weight, expected_weight(0, 0, quotes[0].weight))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        bulgakov = Source.objects.create(name='Мастер и Маргарита', type='book')
+        tolkien = Source.objects.create(name='The Lord of the Rings', type='book')
+        self.manuscripts = Quote.objects.create(text='Рукописи не горят', source=bulgakov, weight=10)
+        self.devil = Quote.objects.create(text='Никогда и ничего не просите', source=bulgakov, weight=10)
+        self.wandering = Quote.objects.create(text='Not all those who wander are lost', source=tolkien, weight=10)
+
+    def search(self, query):
+        return self.client.get(reverse('api_search'), {'q': query}).json()['results']
+
+    def assertFinds(self, query, expected):
+        """expected - список в порядке выдачи или множество, если порядок не важен"""
+        kind = type(expected)
+        for backend in ('auto', 'memory'):
+            with self.subTest(backend=backend), self.settings(QUOTES_SEARCH_BACKEND=backend):
+                search_index.invalidate()
+                found = [quote['id'] for quote in self.search(query)]
+                self.assertEqual(kind(found), kind(quote.id for quote in expected))
+
+    def test_inflected_russian_words_match(self):
+        self.assertFinds('рукописей', [self.manuscripts])
+
+    def test_prefix_and_english_stemming(self):
+        self.assertFinds('wandering los', [self.wandering])
+
+    def test_source_name_is_searchable(self):
+        self.assertFinds('маргарите ничего', [self.devil])
+
+    def test_common_words_are_checked_after_match(self):
+        # Все слова считаются частыми: "не" встречается в двух цитатах
+        with self.settings(QUOTES_SEARCH_COMMON_TERM_DOCS=1):
+            cache.clear()
+            self.assertFinds('не горят', [self.manuscripts])
+            self.assertFinds('не', {self.devil, self.manuscripts})
+
+    def test_index_follows_edits(self):
+        self.manuscripts.text = 'Трусость - самый страшный порок'
+        self.manuscripts.save()
+        self.assertFinds('рукописи', [])
+        self.assertFinds('трусость', [self.manuscripts])
+
+    def test_yo_and_ye_spellings_match(self):
+        tree = Quote.objects.create(text='Зелёная ёлка', source=self.devil.source, weight=10)
+        for query in ('ёлка', 'елка', 'зеленая', 'зелёная', 'ЁЛКА'):
+            self.assertFinds(query, [tree])
+        self.devil.source.name = 'Мастер и Маргарита. Чёрная магия'
+        self.devil.source.save()
+        self.assertFinds('черная магия', {self.devil, self.manuscripts, tree})
+
+    @override_settings(QUOTES_SEARCH_BACKEND='memory', QUOTES_SEARCH_COMMON_TERM_DOCS=1)
+    def test_common_terms_stay_newest_first_after_reindex(self):
+        search_index.invalidate()
+        self.assertEqual(search_quote_ids('не'), [self.devil.id, self.manuscripts.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.manuscripts.text = 'Рукописи не горят никогда'
+            self.manuscripts.save()
+        self.assertEqual(search_quote_ids('не'), [self.devil.id, self.manuscripts.id])
+        self.assertEqual(search_quote_ids('не', limit=1), [self.devil.id])
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        request_metrics.reset()
+        source = Source.objects.create(name='Горе от ума', type='book')
+        Quote.objects.create(text='Счастливые часов не наблюдают', source=source, weight=10)
+
+    def test_views_are_measured(self):
+        self.client.get(reverse('random_quote'))
+        measured = self.client.get(reverse('metrics')).json()['random_quote']
+        self.assertEqual(measured['latency_ms']['count'], 1)
+        self.assertGreaterEqual(measured['queries']['sum'], 1)
+        self.assertGreater(measured['template_ms']['sum'], 0)
+
+    def test_slow_request_log_includes_sql_only_when_enabled(self):
+        for keep_sql in (False, True):
+            with (
+                self.subTest(keep_sql=keep_sql),
+                self.settings(QUOTES_SLOW_REQUEST_MS=0, QUOTES_SLOW_REQUEST_SQL=keep_sql),
+                self.assertLogs('quotes.slow_requests', 'WARNING') as logs,
+            ):
+                self.client.get(reverse('random_quote'))
+            self.assertEqual('SELECT' in logs.output[0], keep_sql)
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram((1, 5, float('inf')))
+        for value in (0.5, 3, 3, 100):
+            histogram.observe(value)
+        summary = histogram.as_dict()
+        self.assertEqual((summary['p50'], summary['p99'], summary['count']), (5, float('inf'), 4))
+        self.assertEqual(summary['buckets'], {'1': 1, '5': 2, '+Inf': 1})
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    """Решения роутера; реплика объявлена только в настройках, запросов к ней нет"""
+
+    def setUp(self):
+        replica = {**settings.DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+        with warnings.catch_warnings():
+            # Django предупреждает о подмене DATABASES, но соединения здесь не нужны
+            warnings.simplefilter('ignore')
+            self.override = override_settings(
+                DATABASES={**settings.DATABASES, 'replica_under_test': replica},
+                QUOTES_REPLICA_DATABASE='replica_under_test',
+            )
+            self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+
+    def request(self, method='get', cookies=None, write=False):
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(Quote))
+            if write:
+                router.db_for_write(Quote)
+                reads.append(router.db_for_read(Quote))
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaRoutingMiddleware(view)(request), reads
+
+    def test_reads_follow_client_writes(self):
+        self.assertEqual(router.db_for_read(Quote), 'replica_under_test')
+        self.assertEqual(self.request()[1], ['replica_under_test'])
+        response, reads = self.request('post', write=True)
+        self.assertEqual(reads, ['replica_under_test', 'default'])
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.request(cookies={STICKY_COOKIE: '1'})[1], ['default'])
+        # Сброс счетчиков в GET не привязывает клиента к основной БД
+        self.assertNotIn(STICKY_COOKIE, self.request(write=True)[0].cookies)
+
+
+class ProductionSettingsTests(TestCase):
+    def test_pages_render_with_production_templates(self):
+        with mock.patch.dict(os.environ, {'DJANGO_SECRET_KEY': 'test'}):
+            production = importlib.import_module('quotes_site.settings_production')
+        self.assertFalse(production.DEBUG)
+        # WAL только в продакшене; настройки разработки не меняются импортом
+        self.assertIn('journal_mode=WAL', production.DATABASES['default']['OPTIONS']['init_command'])
+        self.assertNotIn('journal_mode', settings.DATABASES['default']['OPTIONS']['init_command'])
+        loaders = production.TEMPLATES[0]['OPTIONS']['loaders']
+        self.assertEqual(loaders[0][0], 'django.template.loaders.cached.Loader')
+        source = Source.objects.create(name='Книга', type='book')
+        Quote.objects.create(text='Цитата', source=source, weight=10)
+        with override_settings(TEMPLATES=production.TEMPLATES, MESSAGE_STORAGE=production.MESSAGE_STORAGE):
+            for name in ['random_quote', 'popular_quotes', 'dashboard']:
+                self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+
+
+async_urls = types.ModuleType('async_urls')
+async_urls.urlpatterns = build_urlpatterns(async_views)
+
+
+@override_settings(ROOT_URLCONF=async_urls)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        source = Source.objects.create(name='Мастер и Маргарита', type='book')
+        self.quote = Quote.objects.create(text='Рукописи не горят', source=source, weight=10)
+
+    async def test_view_then_vote(self):
+        response = await self.async_client.get('/')
+        self.assertContains(response, 'Рукописи не горят')
+        data = (await self.async_client.post(f'/quote/{self.quote.id}/like/')).json()
+        self.assertEqual((data['success'], data['likes'], data['weight']), (True, 1, expected_weight(1, 0, 10)))
+        self.assertFalse((await self.async_client.post(f'/quote/{self.quote.id}/like/')).json()['success'])
+
+    async def test_popular_quotes(self):
+        response = await self.async_client.get('/popular/')
+        self.assertContains(response, 'Рукописи не горят')
+
+
+class ConcurrentVoteTests(TransactionTestCase):
+    threads = 8
+    votes_per_thread = 25
+
+    def test_concurrent_votes_are_not_lost(self):
+        source = Source.objects.create(name='Игра престолов', type='series')
+        quote = Quote.objects.create(text='Зима близко', source=source, weight=10)
+        errors = []
+
+        def hammer():
+            try:
+                for _ in range(self.votes_per_thread):
+                    Quote.objects.apply_vote(quote.id, 'like')
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        workers = [threading.Thread(target=hammer) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        quote.refresh_from_db()
+        total = self.threads * self.votes_per_thread
+        self.assertEqual(quote.likes, total)
+
+        # Каждый голос видел предыдущий, поэтому ограничение в 80% не теряется
+        weight = 10
+        for likes in range(1, total + 1):
+            weight = expected_weight(likes, 0, weight)
+        self.assertEqual(quote.weight, weight)
+
+
+class ConcurrentWriteStressTests(TransactionTestCase):
+    """Голоса, сброс счетчиков и импорт из многих потоков без "database is locked"
+
+    Держится на настройках SQLite (BEGIN IMMEDIATE, busy timeout) и
+    повторах db.retry_on_busy; в продакшене к ним добавляется WAL.
+    """
+    threads = 12
+    rounds = 20
+
+    def test_mixed_writers_do_not_hit_lock_errors(self):
+        source = Source.objects.create(name='Властелин колец', type='book')
+        quotes = [
+            Quote.objects.create(text=f'Цитата {number}', source=source, weight=10)
+            for number in range(3)
+        ]
+        ids = [quote.id for quote in quotes]
+        errors = []
+
+        def writer(number):
+            try:
+                for round_number in range(self.rounds):
+                    if number % 3 == 0:
+                        Quote.objects.apply_vote(ids[number % len(ids)], 'like')
+                    elif number % 3 == 1:
+                        write_deltas({quote_id: [2, 0, 0] for quote_id in ids})
+                    else:
+                        # Импорт сначала читает, потом пишет в той же транзакции
+                        QuoteImporter().run([{
+                            'text': f'Импорт {uuid.uuid4().hex}',
+                            'source': f'Источник {number}-{round_number}',
+                            'type': 'other',
+                        }])
+                    list(Quote.objects.values_list('views', 'likes'))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=writer, args=(number,)) for number in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        writers = self.threads // 3 * self.rounds
+        self.assertEqual(
+            sorted(Quote.objects.filter(id__in=ids).values_list('views', flat=True)),
+            [2 * writers] * len(ids),
+        )
+        self.assertEqual(sum(Quote.objects.values_list('likes', flat=True)), writers)
+        self.assertEqual(Quote.objects.count(), len(ids) + writers)
+
+
+class BenchmarkTests(TestCase):
+    def test_seed_leaves_existing_sources_alone(self):
+        source = Source.objects.create(name='Горе от ума', type='book')
+        Quote.objects.create(text='А судьи кто?', source=source, weight=10)
+        seed(10)
+        seed(4)
+        source.refresh_from_db()
+        self.assertEqual(source.quote_count, 1)
+        self.assertEqual(Quote.objects.filter(source=source).count(), 1)
+        self.assertEqual(Quote.objects.count(), 15)
+        for seeded in Source.objects.exclude(id=source.id):
+            self.assertEqual(Quote.objects.filter(source=seeded).count(), seeded.quote_count)
+
+    def test_budget_failures(self):
+        summary = {'count': 10, 'errors': 0, 'queries_p50': 2}
+        self.assertEqual(budget_failures({'random_quote': summary}), [])
+        failures = budget_failures({
+            'popular_quotes': summary,
+            'dashboard': {**summary, 'errors': 1, 'queries_p50': 0},
+            'add_quote': {'count': 0, 'errors': 5},
+        })
+        self.assertEqual(len(failures), 4, failures)
+
+
+class EndpointQueryBudgetTests(TestCase):
+    """Бюджет SQL-запросов на страницу, чтобы регрессии были заметны
+
+    Нагрузочный замер тех же страниц: manage.py bench_endpoints.
+    """
+
+    budgets = QUERY_BUDGETS
+
+    @classmethod
+    def setUpTestData(cls):
+        seed(300)
+        cls.empty_source = Source.objects.create(name='Пустой источник', type='other')
+
+    def setUp(self):
+        cache.clear()
+        # Прогрев кэшей: замеряем установившийся режим
+        self.client.get(reverse('popular_quotes'))
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('add_source'))
+
+    def assertWithinBudget(self, name, request):
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertLess(response.status_code, 400)
+        self.assertLessEqual(len(queries), self.budgets[name], [query['sql'] for query in queries])
+
+    def test_random_quote(self):
+        self.client.get(reverse('random_quote'))
+        self.assertWithinBudget('random_quote', lambda: self.client.get(reverse('random_quote')))
+
+    def test_random_quote_batch(self):
+        self.client.get(reverse('random_quote'))
+        url = f"{reverse('api_random_quotes')}?count=10"
+        self.assertWithinBudget('random_batch', lambda: self.client.get(url))
+        quotes = self.client.get(url).json()['results']
+        ids = [quote['id'] for quote in quotes]
+        self.assertEqual(len(set(ids)), 10)
+        for quote_id in ids:
+            self.assertTrue(self.client.post(reverse('like_quote', args=[quote_id])).json()['success'])
+
+    def test_like_quote(self):
+        quote_id = self.client.get(reverse('random_quote')).context['quote'].id
+        self.assertWithinBudget(
+            'like_quote', lambda: self.client.post(reverse('like_quote', args=[quote_id]))
+        )
+
+    def test_popular_quotes(self):
+        self.assertWithinBudget('popular_quotes', lambda: self.client.get(reverse('popular_quotes')))
+
+    def test_dashboard(self):
+        self.assertWithinBudget('dashboard', lambda: self.client.get(reverse('dashboard')))
+
+    def test_add_quote(self):
+        self.assertWithinBudget('add_quote', lambda: self.client.post(reverse('add_quote'), {
+            'text': 'Новая цитата для проверки',
+            'source': self.empty_source.pk,
+            'weight': 10,
+        }))
+
+    def test_add_source(self):
+        self.assertWithinBudget('add_source', lambda: self.client.get(reverse('add_source')))
+
+    def test_source_fragment_is_invalidated_by_signals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Source.objects.create(name='Совсем новый источник', type='other')
+        self.assertContains(self.client.get(reverse('add_source')), 'Совсем новый источник')
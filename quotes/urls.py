@@ -1,12 +1,30 @@
+from django.conf import settings
 from django.urls import path
-from . import views
-
-urlpatterns = [
-    path('', views.random_quote, name='random_quote'),
-    path('add/', views.add_quote, name='add_quote'),
-    path('add/source/', views.add_source, name='add_source'),
-    path('popular/', views.popular_quotes, name='popular_quotes'),
-    path('dashboard/', views.dashboard, name='dashboard'),
-    path('quote/<int:quote_id>/like/', views.like_quote, name='like_quote'),
-    path('quote/<int:quote_id>/dislike/', views.dislike_quote, name='dislike_quote'),
-]
\ No newline at end of file
+from . import api, async_views, views
+
+
+def build_urlpatterns(hot_views):
+    """Маршруты приложения; hot_views - модуль с горячими представлениями"""
+    return [
+        path('', hot_views.random_quote, name='random_quote'),
+        path('add/', views.add_quote, name='add_quote'),
+        path('add/source/', views.add_source, name='add_source'),
+        path('popular/', hot_views.popular_quotes, name='popular_quotes'),
+        path('dashboard/', views.dashboard, name='dashboard'),
+        path('quote/<int:quote_id>/like/', hot_views.like_quote, name='like_quote'),
+        path('quote/<int:quote_id>/dislike/', hot_views.dislike_quote, name='dislike_quote'),
+        path('internal/metrics/', views.metrics, name='metrics'),
+        path('internal/export/', views.export_quotes, name='export_quotes'),
+        path('api/quotes/', api.quote_list, name='api_quote_list'),
+        path('api/quotes/random/', api.random_quote, name='api_random_quote'),
+        path('api/quotes/random/batch/', api.random_quotes, name='api_random_quotes'),
+        path('api/quotes/popular/', api.popular_quotes, name='api_popular_quotes'),
+        path('api/quotes/trending/', api.trending, name='api_trending_quotes'),
+        path('api/quotes/<int:quote_id>/', api.quote_detail, name='api_quote_detail'),
+        path('api/stats/', api.stats, name='api_stats'),
+        path('api/search/', api.search, name='api_search'),
+        path('api/sources/', api.source_lookup, name='api_source_lookup'),
+    ]
+
+
+urlpatterns = build_urlpatterns(async_views if getattr(settings, 'QUOTES_ASYNC_VIEWS', False) else views)
@@ -1,74 +1,116 @@
 from django.forms import ValidationError
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.db.models import Sum, F, Q
 from django.views.decorators.http import require_POST
 from django.contrib import messages
-import random
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 import json
-from .models import Quote, Source
+import random
+from .models import MAX_QUOTES_PER_SOURCE, Quote, Source
 from .forms import QuoteForm, SourceForm
+from . import fragments
+from .activity import trending_quotes
+from .counters import counter_buffer
+from .eligibility import VoteEligibility
+from .exporter import export_chunks, export_filename
+from .leaderboard import popular_leaderboard
+from .metrics import request_metrics
+from .sampler import quote_sampler
+from .stats import dashboard_stats
+
+# Сколько цитат в блоке трендов на дашборде
+TRENDING_ON_DASHBOARD = 5
+
+
+def random_filters(request):
+    """Фильтры случайного выбора из запроса: ?type=<тип источника> и ?source=<id>"""
+    source_type = request.GET.get('type')
+    source_id = request.GET.get('source', '')
+    return {
+        'source_type': source_type if source_type in dict(Source.TYPE_CHOICES) else None,
+        'source_id': int(source_id) if source_id.isdigit() else None,
+    }
+
+
+def sample_without_replacement(quotes, count):
+    """До count разных цитат из списка с учетом эффективного веса"""
+    quotes = list(quotes)
+    chosen = []
+    while quotes and len(chosen) < count:
+        weights = [quote.effective_weight for quote in quotes]
+        if sum(weights) <= 0:
+            break
+        chosen.append(quotes.pop(random.choices(range(len(quotes)), weights)[0]))
+    return chosen
+
+
+def source_quotes(source_id):
+    # У источника не больше MAX_QUOTES_PER_SOURCE цитат: они читаются
+    # одним запросом по индексу source_id и выбираются в Python
+    return Quote.objects.select_related('source').filter(source_id=source_id)
+
 
+def pick_random_quote(source_type=None, source_id=None):
+    """Случайная цитата с учетом веса - усиленная версия"""
+    if source_id is not None:
+        return next(iter(sample_without_replacement(source_quotes(source_id), 1)), None)
+    # Выбор по индексу сохраненных эффективных весов (общему или по типу
+    # источника), без чтения всей таблицы
+    quotes = Quote.objects.select_related('source')
+    quote_id = quote_sampler.pick(source_type)
+    if quote_id is not None:
+        quote = quotes.filter(id=quote_id).first()
+        if quote is not None:
+            return quote
+        # Цитату удалили в другом процессе - индекс устарел
+        quote_sampler.invalidate()
+    if source_type is not None:
+        # В индексе типа нет цитат с ненулевым весом
+        return None
+    
+    return quotes.order_by('?').first()
+
+
+def pick_random_quotes(count, source_type=None, source_id=None):
+    """До count разных случайных цитат с учетом веса одним запросом"""
+    if source_id is not None:
+        return sample_without_replacement(source_quotes(source_id), count)
+    quotes = Quote.objects.select_related('source')
+    quote_ids = quote_sampler.pick_many(count, source_type)
+    if not quote_ids:
+        return [] if source_type is not None else list(quotes.order_by('?')[:count])
+    found = quotes.in_bulk(quote_ids)
+    if len(found) < len(quote_ids):
+        # Часть цитат удалили в другом процессе - индекс устарел
+        quote_sampler.invalidate()
+    return [found[quote_id] for quote_id in quote_ids if quote_id in found]
 
 
 def random_quote(request):
     """Получение случайной цитаты с учетом веса - усиленная версия"""
-    # Получаем все цитаты с их весами
-    quotes = list(Quote.objects.values('id', 'weight'))
-    
-    if not quotes:
-        selected_quote = None
-    else:
-        # Усиливаем влияние веса - возводим в степень
-        weighted_quotes = []
-        total_weight = 0
-        
-        for quote in quotes:
-            # Усиливаем вес: weight^1.5 для большего разброса
-            enhanced_weight = quote['weight'] ** 1.5
-            weighted_quotes.append({
-                'id': quote['id'],
-                'weight': enhanced_weight
-            })
-            total_weight += enhanced_weight
-        
-        if total_weight <= 0:
-            selected_quote = Quote.objects.order_by('?').first()
-        else:
-            # Выбор с учетом усиленного веса
-            random_weight = random.uniform(0, total_weight)
-            cumulative_weight = 0
-            
-            for quote in weighted_quotes:
-                cumulative_weight += quote['weight']
-                if cumulative_weight >= random_weight:
-                    selected_quote = Quote.objects.get(id=quote['id'])
-                    break
-            else:
-                selected_quote = Quote.objects.order_by('?').first()
+    filters = random_filters(request)
+    selected_quote = pick_random_quote(**filters)
     
+    eligibility = VoteEligibility.from_request(request)
     if selected_quote:
-        Quote.objects.filter(id=selected_quote.id).update(views=F('views') + 1)
-        selected_quote.refresh_from_db()
-        
-        viewed_quotes = request.session.setdefault('viewed_quotes', {})
-        viewed_quotes[str(selected_quote.id)] = {
-            'can_vote': True,
-            'voted': False
-        }
-        request.session.modified = True
+        # Просмотр копится в буфере и пишется в БД пачкой
+        counter_buffer.record(selected_quote, views=1)
+        # Право голоса хранится в подписанной cookie, а не в сессии
+        eligibility.mark_viewed(selected_quote.id)
     
-    return render(request, 'quotes/random_quote.html', {
+    response = render(request, 'quotes/random_quote.html', {
         'quote': selected_quote,
-        'total_quotes': Quote.objects.count()
+        'total_quotes': Quote.objects.count(),
+        'source_types': Source.TYPE_CHOICES,
+        'filters': filters,
     })
+    return eligibility.save(response)
 
 def can_user_vote(request, quote_id):
     """Проверяет, может ли пользователь голосовать за цитату"""
-    viewed_quotes = request.session.get('viewed_quotes', {})
-    quote_data = viewed_quotes.get(str(quote_id), {})
-    
-    return quote_data.get('can_vote', False) and not quote_data.get('voted', False)
+    return VoteEligibility.from_request(request).can_vote(quote_id)
 
 
 @require_POST
@@ -85,9 +127,8 @@ def dislike_quote(request, quote_id):
 
 def _vote_quote(request, quote_id, vote_type):
     """Общая функция для обработки голосования"""
-    quote = get_object_or_404(Quote, id=quote_id)
-    
     if not can_user_vote(request, quote_id):
+        quote = counter_buffer.apply_pending(get_object_or_404(Quote, id=quote_id))
         return JsonResponse({
             'success': False, 
             'error': 'Вы уже голосовали за эту цитату или не просматривали её',
@@ -95,60 +136,40 @@ def _vote_quote(request, quote_id, vote_type):
             'dislikes': quote.dislikes
         })
     
-    # Обновляем счетчик
-    if vote_type == 'like':
-        Quote.objects.filter(id=quote_id).update(likes=F('likes') + 1)
-    else:
-        Quote.objects.filter(id=quote_id).update(dislikes=F('dislikes') + 1)
-    
-    quote.refresh_from_db()
-    
-    # Обновляем вес цитаты
-    update_quote_weight(quote)
+    likes, dislikes, weight = apply_vote(quote_id, vote_type)
     
     # Отмечаем, что пользователь проголосовал
-    viewed_quotes = request.session['viewed_quotes']
-    viewed_quotes[str(quote_id)]['voted'] = True
-    viewed_quotes[str(quote_id)]['can_vote'] = False
-    request.session.modified = True
+    eligibility = VoteEligibility.from_request(request)
+    eligibility.mark_voted(quote_id)
     
-    return JsonResponse({
+    return eligibility.save(JsonResponse({
         'success': True,
-        'likes': quote.likes, 
-        'dislikes': quote.dislikes,
-        'weight': quote.weight
-    })
+        'likes': likes, 
+        'dislikes': dislikes,
+        'weight': weight
+    }))
+
+
+def apply_vote(quote_id, vote_type):
+    """Записывает голос и обновляет производные индексы, возвращает (likes, dislikes, weight)"""
+    # Голос и новый вес записываются одним атомарным UPDATE ... RETURNING
+    result = Quote.objects.apply_vote(quote_id, vote_type)
+    if result is None:
+        raise Http404('Цитата не найдена')
+    likes, dislikes, weight, effective_weight = result
+    quote_sampler.set_weight(quote_id, effective_weight)
+    dashboard_stats.record_vote(quote_id, vote_type, likes, dislikes)
+    popular_leaderboard.record_vote(quote_id, likes, dislikes)
+    # В историю голос попадет со сбросом буфера счетчиков
+    counter_buffer.add_history(quote_id, **{'likes' if vote_type == 'like' else 'dislikes': 1})
+    return likes, dislikes, weight
 
 
 def update_quote_weight(quote):
     """Обновляет вес цитаты с ограничением максимального прироста в 80%"""
-    # Базовый вес для новых цитат
-    base_weight = 10
-    current_weight = quote.weight
-    
-    # Рассчитываем рейтинг (лайки минус дизлайки)
-    rating = quote.likes - quote.dislikes
-    
-    # Общее количество голосов
-    total_votes = quote.likes + quote.dislikes
-    
-    if total_votes > 0:
-        # Процент лайков (от 0 до 100)
-        like_percentage = (quote.likes / total_votes) * 100
-        
-        # Рассчитываем новый вес без ограничений
-        raw_new_weight = max(1, base_weight + rating + (like_percentage / 10))
-        
-
-        max_allowed_weight = current_weight * 1.8
-        new_weight = min(raw_new_weight, max_allowed_weight)
-    else:
-        # Если нет голосов, используем базовый вес
-        new_weight = base_weight
-    
-
-    if abs(new_weight - current_weight) > 0.1:
-        Quote.objects.filter(id=quote.id).update(weight=new_weight)
+    # Формула считается в БД одним UPDATE (см. models.vote_weight_expression)
+    Quote.objects.filter(id=quote.id).recompute_vote_weights()
+    quote_sampler.refresh([quote.id])
 
 
 def add_quote(request):
@@ -166,14 +187,14 @@ def add_quote(request):
                     return render(request, 'quotes/add_quote.html', {'form': form})
                 
                 # Дополнительная проверка ограничения на количество цитат
-                if quote.source.quote_set.count() >= 3:
+                # Счетчик цитат хранится в источнике; окончательно лимит
+                # проверяется условным UPDATE при сохранении
+                if quote.source.quote_count >= MAX_QUOTES_PER_SOURCE:
                     messages.error(request, f'У источника "{quote.source}" уже есть 3 цитаты. Нельзя добавить больше.')
                     return render(request, 'quotes/add_quote.html', {'form': form})
                 
-                # Проверяем уникальность цитаты
-                if Quote.objects.filter(text=quote.text, source=quote.source).exists():
-                    messages.error(request, 'Цитата с таким текстом уже существует для этого источника')
-                    return render(request, 'quotes/add_quote.html', {'form': form})
+                # Точные и похожие дубликаты среди всех источников уже
+                # отсеяны в Quote.clean при проверке формы (см. dedup.py)
                 
                 # Сохраняем цитату
                 quote.save()
@@ -201,6 +222,7 @@ def add_quote(request):
 
 def add_source(request):
     """Добавление нового источника"""
+    # Запрос ленивый: при попадании в кэш фрагмента он не выполняется
     sources = Source.objects.all().order_by('type', 'name')
     
     if request.method == 'POST':
@@ -218,35 +240,69 @@ def add_source(request):
     
     return render(request, 'quotes/add_source.html', {
         'form': form,
-        'sources': sources
+        'sources': sources,
+        'max_quotes': MAX_QUOTES_PER_SOURCE,
+        **fragments.context(fragments.SOURCES),
     })
 
 
 def popular_quotes(request):
     """Популярные цитаты по количеству лайков"""
-    quotes = Quote.objects.order_by('-likes', '-views')[:10]
+    # Топ поддерживается при голосовании, таблица не сортируется;
+    # читается, только если фрагмента нет в кэше
+    quotes = SimpleLazyObject(popular_leaderboard.get)
     
-    return render(request, 'quotes/popular_quotes.html', {'quotes': quotes})
+    return render(request, 'quotes/popular_quotes.html', {
+        'quotes': quotes,
+        **fragments.context(fragments.POPULAR),
+    })
 
 
 def dashboard(request):
     """Дашборд со статистикой"""
-    quotes = Quote.objects.all()
+    # Снимок из кэша, поддерживается при изменении счетчиков;
+    # читается, только если фрагмента нет в кэше
+    stats = SimpleLazyObject(dashboard_stats.get)
+    # Тренды затухают со временем, поэтому их фрагмент живет столько же,
+    # сколько кэш самого рейтинга
+    trending = SimpleLazyObject(lambda: trending_quotes(TRENDING_ON_DASHBOARD))
     
-    stats_data = quotes.aggregate(
-        total_views=Sum('views') or 0,
-        total_likes=Sum('likes') or 0,
-        total_dislikes=Sum('dislikes') or 0
-    )
+    return render(request, 'quotes/dashboard.html', {
+        'stats': stats,
+        'trending': trending,
+        'trending_timeout': getattr(settings, 'QUOTES_TRENDING_MAX_AGE', 300),
+        **fragments.context(fragments.STATS),
+    })
+
+
+def _require_internal(request):
+    """Служебные страницы доступны только с INTERNAL_IPS или персоналу"""
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS and not request.user.is_staff:
+        raise Http404
+
+
+def metrics(request):
+    """Гистограммы задержек и SQL-запросов по представлениям (для мониторинга)"""
+    _require_internal(request)
     
-    stats = {
-        'total_quotes': quotes.count(),
-        'total_sources': Source.objects.count(),
-        'total_views': stats_data['total_views'],
-        'total_likes': stats_data['total_likes'],
-        'total_dislikes': stats_data['total_dislikes'],
-        'most_popular': quotes.order_by('-likes', '-views').first(),
-        'most_viewed': quotes.order_by('-views').first(),
-    }
+    return JsonResponse(request_metrics.snapshot())
+
+
+def export_quotes(request):
+    """Потоковая выгрузка всех цитат (?format=csv|jsonl&gzip=1)"""
+    _require_internal(request)
     
-    return render(request, 'quotes/dashboard.html', {'stats': stats})
\ No newline at end of file
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        fmt = 'csv'
+    compress = request.GET.get('gzip') == '1'
+    
+    response = StreamingHttpResponse(
+        export_chunks(fmt, compress),
+        content_type='text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson; charset=utf-8',
+    )
+    if compress:
+        # Отдаем файл .gz как есть, без Content-Encoding
+        response['Content-Type'] = 'application/gzip'
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(fmt, compress)}"'
+    return response
@@ -0,0 +1,157 @@
+"""Политики веса выбора случайной цитаты
+
+Политика переводит вес цитаты и ее счетчики в эффективный вес, с которым
+цитата участвует во взвешенном выборе (sampler.py). Эффективный вес
+хранится в Quote.effective_weight и пересчитывается только при изменении
+входов политики: тем же UPDATE, что пишет голос или счетчики, или при
+сохранении цитаты. Поэтому выбор ничего не считает на запрос.
+
+Политика задается настройкой QUOTES_WEIGHT_POLICY (имя из POLICIES или
+путь к классу) с аргументами QUOTES_WEIGHT_POLICY_OPTIONS. После смены
+политики сохраненные веса пересчитывает команда recompute_weights.
+"""
+import datetime
+
+from django.conf import settings
+from django.db.models import F, FloatField, Func, Value
+from django.db.models.functions import Cast, Greatest, Least, Power
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+# Поля цитаты, от которых может зависеть эффективный вес
+INPUTS = ('weight', 'likes', 'dislikes', 'views', 'created_at')
+# Точка отсчета времени для затухания (см. DecayPolicy)
+DECAY_EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+# Предел числа полураспадов от DECAY_EPOCH: 2^512 с запасом помещается в
+# float вместе с весом и суммой весов всего индекса
+MAX_DECAY_HALF_LIVES = 512
+
+
+class EpochSeconds(Func):
+    """Дата и время как число секунд эпохи"""
+    arity = 1
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)'
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        template = '((julianday(%(expressions)s) - 2440587.5) * 86400.0)'
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+class WeightPolicy:
+    """Эффективный вес равен весу цитаты
+
+    Наследники переопределяют expression() и value(): первое считает вес
+    в UPDATE, второе - в Python при сохранении и массовом импорте, и они
+    должны давать одно и то же. В inputs перечисляются поля, при изменении
+    которых вес надо пересчитать.
+    """
+    inputs = ('weight',)
+
+    def expression(self, weight, likes, dislikes, views, created_at):
+        return Cast(weight, FloatField())
+
+    def value(self, weight, likes, dislikes, views, created_at):
+        return float(weight)
+
+
+class PowerPolicy(WeightPolicy):
+    """Усиленный вес weight^exponent: популярные цитаты выпадают заметно чаще"""
+
+    def __init__(self, exponent=1.5):
+        self.exponent = exponent
+
+    def expression(self, weight, likes, dislikes, views, created_at):
+        return Power(Cast(weight, FloatField()), Value(float(self.exponent)))
+
+    def value(self, weight, likes, dislikes, views, created_at):
+        return float(weight) ** self.exponent
+
+
+class DecayPolicy(PowerPolicy):
+    """Усиленный вес, который для более старых цитат вдвое меньше каждые half_life_days дней
+
+    Для выбора важно только отношение весов, поэтому вместо множителя
+    0.5^(возраст / полураспад), который пришлось бы пересчитывать со
+    временем, хранится 2^((создана - DECAY_EPOCH) / полураспад): новая
+    цитата так же растет относительно старых, а вес не меняется.
+
+    Показатель ограничен MAX_DECAY_HALF_LIVES в обе стороны, иначе степень
+    переполнила бы float. Цитаты дальше этого предела от DECAY_EPOCH
+    получают одинаковый множитель (при полураспаде 30 дней - через 40 лет).
+    """
+    inputs = ('weight', 'created_at')
+
+    def __init__(self, exponent=1.5, half_life_days=30):
+        super().__init__(exponent)
+        self.half_life = half_life_days * 86400
+
+    def expression(self, weight, likes, dislikes, views, created_at):
+        age = (EpochSeconds(created_at) - Value(DECAY_EPOCH)) / Value(float(self.half_life))
+        age = Greatest(Least(age, Value(float(MAX_DECAY_HALF_LIVES))), Value(-float(MAX_DECAY_HALF_LIVES)))
+        return super().expression(weight, likes, dislikes, views, created_at) * Power(Value(2.0), age)
+
+    def value(self, weight, likes, dislikes, views, created_at):
+        age = (created_at.timestamp() - DECAY_EPOCH) / self.half_life
+        age = max(min(age, MAX_DECAY_HALF_LIVES), -MAX_DECAY_HALF_LIVES)
+        return super().value(weight, likes, dislikes, views, created_at) * 2.0 ** age
+
+
+class ExplorationPolicy(PowerPolicy):
+    """Усиленный вес с бонусом малопросмотренным цитатам
+
+    Цитата без просмотров получает вес в 1 + bonus раз больше, после
+    views_scale просмотров бонус уменьшается вдвое.
+    """
+    inputs = ('weight', 'views')
+
+    def __init__(self, exponent=1.5, bonus=1.0, views_scale=100):
+        super().__init__(exponent)
+        self.bonus = bonus
+        self.views_scale = views_scale
+
+    def expression(self, weight, likes, dislikes, views, created_at):
+        scale = Value(float(self.views_scale))
+        factor = Value(1.0) + Value(float(self.bonus)) * scale / (scale + Cast(views, FloatField()))
+        return super().expression(weight, likes, dislikes, views, created_at) * factor
+
+    def value(self, weight, likes, dislikes, views, created_at):
+        factor = 1 + self.bonus * self.views_scale / (self.views_scale + views)
+        return super().value(weight, likes, dislikes, views, created_at) * factor
+
+
+POLICIES = {
+    'plain': WeightPolicy,
+    'power': PowerPolicy,
+    'decay': DecayPolicy,
+    'exploration': ExplorationPolicy,
+}
+
+
+def current_policy():
+    """Политика из настроек QUOTES_WEIGHT_POLICY и QUOTES_WEIGHT_POLICY_OPTIONS"""
+    name = getattr(settings, 'QUOTES_WEIGHT_POLICY', 'power')
+    policy_class = POLICIES[name] if name in POLICIES else import_string(name)
+    return policy_class(**getattr(settings, 'QUOTES_WEIGHT_POLICY_OPTIONS', {}))
+
+
+def effective_weight_expression(policy=None, **fields):
+    """Эффективный вес как SQL-выражение от полей строки
+
+    Поля, которые тот же UPDATE меняет, передаются явно (например, новый
+    вес после голосования): иначе выражение увидит старые значения.
+    """
+    policy = policy or current_policy()
+    fields = {name: fields.get(name, F(name)) for name in INPUTS}
+    return Cast(policy.expression(**fields), FloatField())
+
+
+def effective_weight(quote, policy=None):
+    """Эффективный вес цитаты, посчитанный в Python"""
+    policy = policy or current_policy()
+    fields = {name: getattr(quote, name) for name in INPUTS}
+    fields['created_at'] = fields['created_at'] or timezone.now()
+    return policy.value(**fields)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -28,6 +29,9 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# Адреса, которым доступна страница метрик /internal/metrics/
+INTERNAL_IPS = ['127.0.0.1']
+
 
 # Application definition
 
@@ -42,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'quotes.middleware.InstrumentationMiddleware',
+    'quotes.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,7 +61,8 @@ ROOT_URLCONF = 'quotes_site.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Стандартный бэкенд с замером времени рендеринга для метрик
+        'BACKEND': 'quotes.templating.InstrumentedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -75,10 +82,62 @@ WSGI_APPLICATION = 'quotes_site.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Прагмы на каждое соединение: mmap и кэш страниц (cache_size в КиБ, если
+# отрицательный) - меньше чтений с диска. Режим журнала WAL записывается
+# в заголовок файла БД, поэтому включается только в settings_production.py
+SQLITE_PRAGMAS = {
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -32 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            # Транзакция сразу берет блокировку записи: без этого два писателя,
+            # начавшие с чтения, получают "database is locked" без ожидания
+            'transaction_mode': 'IMMEDIATE',
+            # Сколько секунд ждать занятую БД (busy_timeout)
+            'timeout': 20,
+        },
+        # Соединение живет между запросами одного потока; под ASGI
+        # соединения привязаны к потокам sync_to_async и тоже переиспользуются
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        # Файловая тестовая БД: in-memory SQLite с общим кэшем не дает
+        # параллельно писать из потоков (нужно для тестов конкурентности).
+        # Лежит во временном каталоге, а не рядом с рабочей БД
+        'TEST': {
+            'NAME': Path(tempfile.gettempdir()) / 'quotes_test_db.sqlite3',
+        },
+    }
+}
+
+# Реплика только для чтения (quotes/routers.py): путь к ее файлу задает
+# переменная окружения QUOTES_REPLICA_DB. Локально копию основной БД
+# обновляет manage.py sync_replica; в тестах реплика - та же тестовая БД
+
+if os.environ.get('QUOTES_REPLICA_DB'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['QUOTES_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['quotes.routers.PrimaryReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Снимки статистики и другие кэши приложения; при нескольких процессах
+# лучше использовать общий бэкенд (Redis, Memcached)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -127,3 +186,129 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Tests
+# Без фонового сброса счетчиков; буфер пишется в тестовую БД до ее удаления
+
+TEST_RUNNER = 'quotes.runner.QuotesTestRunner'
+
+
+# Quotes app
+# Индекс для случайного выбора цитат перечитывается из БД не реже, чем раз
+# в столько секунд (None - только при изменениях в этом процессе)
+
+QUOTES_SAMPLER_MAX_AGE = 300
+
+# Счетчики просмотров и голосов копятся в памяти процесса и пишутся в БД
+# пачкой: при накоплении FLUSH_SIZE цитат или раз в FLUSH_INTERVAL секунд
+# (BACKGROUND_FLUSH - по таймеру, даже если запросов больше нет).
+# Команда flush_counters просит все процессы сбросить буферы через файл
+# в SPOOL_DIR, процессы проверяют его раз в FLUSH_POLL секунд.
+# Если при завершении процесса БД недоступна, счетчики сохраняются в
+# SPOOL_DIR (применяются той же командой)
+
+QUOTES_COUNTER_FLUSH_SIZE = 500
+QUOTES_COUNTER_FLUSH_INTERVAL = 5
+QUOTES_COUNTER_FLUSH_POLL = 1
+QUOTES_COUNTER_BACKGROUND_FLUSH = True
+QUOTES_COUNTER_SPOOL_DIR = BASE_DIR / 'counter_spool'
+
+# Снимок статистики дашборда живет в кэше и полностью пересчитывается не
+# реже, чем раз в столько секунд (между пересчетами поправляется точечно)
+
+QUOTES_STATS_MAX_AGE = 60
+
+# Топ популярных цитат: размер и период полной пересборки (секунды)
+
+QUOTES_LEADERBOARD_SIZE = 10
+QUOTES_LEADERBOARD_MAX_AGE = 300
+
+# Запросы дольше стольких миллисекунд пишутся в лог quotes.slow_requests
+# (None - не логировать). SLOW_REQUEST_SQL добавляет в лог список SQL, но
+# для этого каждый запрос хранит текст всех своих SQL - включать для отладки
+
+QUOTES_SLOW_REQUEST_MS = 500
+QUOTES_SLOW_REQUEST_SQL = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'quotes': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
+# Сколько последних просмотренных цитат помнить для права голоса
+# (подписанная cookie вместо записи в сессию на каждый просмотр)
+
+QUOTES_VOTE_ELIGIBILITY_SIZE = 50
+
+# Асинхронные версии случайной цитаты, голосования и топа (quotes/async_views.py).
+# Включать при запуске под ASGI (quotes_site/asgi.py); под WSGI
+# асинхронное представление лишь выполнялось бы через async_to_sync
+
+QUOTES_ASYNC_VIEWS = False
+
+# Повторы записи счетчиков и голосов, если SQLite все же занята дольше
+# timeout: число повторов и начальная пауза в секундах (удваивается)
+
+QUOTES_DB_BUSY_RETRIES = 5
+QUOTES_DB_BUSY_BACKOFF = 0.05
+
+# Поиск по цитатам: 'auto' - FTS5 в SQLite, если таблица индекса есть,
+# иначе индекс в памяти; 'memory' - всегда индекс в памяти.
+# Индекс в памяти перечитывается из БД раз в столько секунд
+
+QUOTES_SEARCH_BACKEND = 'auto'
+QUOTES_SEARCH_INDEX_MAX_AGE = 300
+
+# Слова, которые есть в стольких цитатах, FTS5-поиск проверяет уже после
+# MATCH по редким словам; их список пересчитывается раз в столько секунд
+
+QUOTES_SEARCH_COMMON_TERM_DOCS = 5000
+QUOTES_SEARCH_COMMON_TERMS_MAX_AGE = 3600
+
+# Порог сходства (Жаккар по 4-граммам), с которого новая цитата считается
+# почти точным дубликатом существующей; None - отсеивать только точные
+
+QUOTES_NEAR_DUPLICATE_THRESHOLD = 0.8
+
+# Сколько секунд хранятся отрисованные фрагменты страниц (список
+# источников, топ, статистика); изменения сбрасывают их раньше
+
+QUOTES_FRAGMENT_CACHE_TIMEOUT = 300
+
+# История просмотров и голосов: часовые корзины хранятся столько часов
+# (не меньше окна трендов), потом сворачиваются в суточные командой
+# rollup_activity; суточные хранятся столько дней
+
+QUOTES_ACTIVITY_HOURLY_RETENTION = 48
+QUOTES_ACTIVITY_DAILY_RETENTION = 90
+
+# Тренды: окно в часах, период полураспада вклада часа, вес просмотра
+# относительно лайка и время жизни кэша рейтинга в секундах
+
+QUOTES_TRENDING_HOURS = 24
+QUOTES_TRENDING_HALF_LIFE = 6
+QUOTES_TRENDING_VIEW_WEIGHT = 0.1
+QUOTES_TRENDING_MAX_AGE = 300
+
+# Политика веса случайного выбора (см. quotes/weighting.py): 'plain',
+# 'power' (weight^1.5), 'decay', 'exploration' или путь к классу, и ее
+# аргументы. После смены выполните manage.py recompute_weights
+
+QUOTES_WEIGHT_POLICY = 'power'
+QUOTES_WEIGHT_POLICY_OPTIONS = {}
+
+# Сколько секунд после записи (голос, новая цитата) клиент читает из
+# основной БД, а не с реплики: не меньше запаздывания реплики
+
+QUOTES_REPLICA_STICKY_SECONDS = 10
@@ -0,0 +1,112 @@
+"""
+Профиль настроек для продакшена
+
+Включается переменной окружения:
+    DJANGO_SETTINGS_MODULE=quotes_site.settings_production
+
+Берет все из settings.py и меняет то, что нужно только при разработке:
+DEBUG выключен (без него Django не копит список SQL каждого запроса),
+шаблоны читаются с диска один раз и дальше берутся из кэша загрузчика,
+лишние для работающего сайта middleware и приложения убраны.
+
+Переменные окружения:
+    DJANGO_SECRET_KEY      - секретный ключ (обязательно)
+    DJANGO_ALLOWED_HOSTS   - домены через запятую
+    QUOTES_ADMIN=0         - процесс без админки (например, воркеры,
+                             которые отдают только публичные страницы)
+    DJANGO_SECURE_COOKIES=0 - cookie сессии и CSRF без флага Secure
+                             (если TLS завершается не перед этим сайтом)
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES, INSTALLED_APPS, MIDDLEWARE, SQLITE_PRAGMAS, STATICFILES_DIRS, TEMPLATES
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Задайте секретный ключ в переменной окружения DJANGO_SECRET_KEY')
+
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host.strip()]
+
+
+# Database
+# WAL - читатели не ждут писателя и наоборот, synchronous=NORMAL - в WAL-режиме
+# безопасно и без fsync на каждый коммит. Режим сохраняется в файле БД, поэтому
+# он не включен в settings.py, где БД лежит в репозитории
+
+SQLITE_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', **SQLITE_PRAGMAS}
+
+# Новый словарь, а не правка на месте: DATABASES из settings.py остается
+# прежним, даже если этот модуль импортирован в том же процессе
+
+DATABASES = {
+    alias: {
+        **database,
+        'OPTIONS': {
+            **database['OPTIONS'],
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
+    }
+    for alias, database in DATABASES.items()
+}
+
+
+# Application definition
+# Админка - самая тяжелая часть запуска (autodiscover импортирует все admin.py
+# и формы), процессам только с публичными страницами она не нужна
+
+if os.environ.get('QUOTES_ADMIN', '1') == '0':
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'django.contrib.admin']
+
+# Без реплики маршрутизация чтения ничего не делает, а cookie не нужна
+
+if 'replica' not in DATABASES:
+    MIDDLEWARE = [name for name in MIDDLEWARE if name != 'quotes.middleware.ReplicaRoutingMiddleware']
+
+# Сообщения только в подписанной cookie: с хранилищем по умолчанию
+# (FallbackStorage) длинное сообщение записало бы сессию в БД
+
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+
+# Templates
+# Кэширующий загрузчик явно: шаблон читается и разбирается один раз на
+# процесс. При явных loaders APP_DIRS должен быть выключен. Контекст-процессор
+# debug без DEBUG ничего не добавляет - убираем его
+
+TEMPLATES = [
+    {
+        **TEMPLATES[0],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            **TEMPLATES[0]['OPTIONS'],
+            'debug': False,
+            'context_processors': [
+                processor for processor in TEMPLATES[0]['OPTIONS']['context_processors']
+                if processor != 'django.template.context_processors.debug'
+            ],
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    },
+]
+
+
+# Static files
+# Несуществующий каталог в STATICFILES_DIRS дает предупреждение при каждом запуске
+
+STATICFILES_DIRS = [path for path in STATICFILES_DIRS if os.path.isdir(path)]
+
+# Security
+
+SESSION_COOKIE_SECURE = os.environ.get('DJANGO_SECURE_COOKIES', '1') != '0'
+CSRF_COOKIE_SECURE = SESSION_COOKIE_SECURE